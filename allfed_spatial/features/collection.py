@@ -0,0 +1,108 @@
+from allfed_spatial.geometry.index import SpatialIndex
+
+
+class FeatureCollection(list):
+    """ A list of Features which carries a spatial index over their
+    bounds. The index is built on first use with SpatialIndex's bulk
+    loading, and is kept up to date as features are appended or replaced
+    and as geometries are changed through `update_geom`. Other list
+    operations which move features around discard the index, and it is
+    rebuilt when next needed.
+
+    Geometries reassigned directly on the features, e.g. by the
+    `project_features_*` functions, are not seen by the collection, so call
+    `refresh_index` afterwards.
+    """
+
+    def __init__(self, features=()):
+        super().__init__(features)
+        self._index = None
+
+    @property
+    def index(self):
+        """ SpatialIndex -- index over the bounds of the features, where
+        ids are positions in the collection, rebuilt if it has lost
+        track of the number of features """
+        if self._index is None or len(self._index) != len(self):
+            self._index = SpatialIndex.from_features(self)
+        return self._index
+
+    @index.setter
+    def index(self, index):
+        if index is not None and len(index) != len(self):
+            raise ValueError(
+                'Index has {} entries but collection has {} features'.format(
+                    len(index), len(self)))
+        self._index = index
+
+    def refresh_index(self):
+        """ Discard the index so that it is rebuilt when next needed """
+        self._index = None
+
+    def update_geom(self, i, geom):
+        """ Replace the geometry of the `i`th feature, updating the index
+
+        Arguments:
+            i {int} -- position of the feature in the collection
+            geom {Shapely geometry} -- new geometry
+        """
+        feature = self[i]
+        feature.geom = geom
+        if self._index is not None:
+            self._index.update(i % len(self), feature.bounds)
+
+    def append(self, feature):
+        super().append(feature)
+        if self._index is not None:
+            self._index.insert(feature.bounds)
+
+    def extend(self, features):
+        for feature in features:
+            self.append(feature)
+
+    def __iadd__(self, features):
+        self.extend(features)
+        return self
+
+    def __imul__(self, n):
+        super().__imul__(n)
+        self._index = None
+        return self
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if self._index is None:
+            return
+        if isinstance(key, int):
+            self._index.update(key % len(self), value.bounds)
+        else:
+            self._index = None
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._index = None
+
+    def insert(self, i, feature):
+        super().insert(i, feature)
+        self._index = None
+
+    def pop(self, i=-1):
+        feature = super().pop(i)
+        self._index = None
+        return feature
+
+    def remove(self, feature):
+        super().remove(feature)
+        self._index = None
+
+    def clear(self):
+        super().clear()
+        self._index = None
+
+    def reverse(self):
+        super().reverse()
+        self._index = None
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._index = None
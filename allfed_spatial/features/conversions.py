@@ -1,17 +1,110 @@
+from itertools import islice
+from operator import itemgetter
+
 import geopandas as gpd
+import pandas as pd
+
+from allfed_spatial.features.feature import Feature
+
+DEFAULT_CHUNK_SIZE = 100000
 
 
-def features_to_geodataframe(features: list) -> gpd.GeoDataFrame:
+def _data_columns(datas: list) -> dict:
     """
-    Convert a list of features into a GeoPandas data frame
+    Transpose a list of data dictionaries into a dictionary of typed columns.
+    Keys missing from some dictionaries are filled with None, which pandas
+    treats as missing.
+
+    :param datas: list of data dictionaries
+    :return: dictionary of column name to pandas Series
+    """
+    if len(datas) == 0:
+        return {}
+
+    keys = list(datas[0].keys())
+    if all(d.keys() == datas[0].keys() for d in datas):
+        if len(keys) == 0:
+            return {}
+        if len(keys) == 1:
+            values = [[d[keys[0]] for d in datas]]
+        else:
+            values = list(zip(*map(itemgetter(*keys), datas)))
+    else:
+        for d in datas:
+            keys.extend(k for k in d.keys() if k not in keys)
+        values = [[d.get(k) for d in datas] for k in keys]
+
+    return {k: pd.Series(v) for k, v in zip(keys, values)}
+
+
+def features_to_geodataframe(features: list, crs=None) -> gpd.GeoDataFrame:
+    """
+    Convert a list of features into a GeoPandas data frame. Columns are
+    built one at a time from the feature data, so each column's type is
+    inferred once rather than row by row. Geometries are not copied.
 
     :param features: list of Features
+    :param crs: optional coordinate reference system of the geometries
     :return: geodataframe corresponding to the feature list
     """
     return gpd.GeoDataFrame(
-        [f.data for f in features],
-        geometry=[f.geom for f in features]
+        _data_columns([f.data for f in features]),
+        geometry=[f.geom for f in features],
+        crs=crs
     )
 
 
+def iter_geodataframes(features, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                       crs=None):
+    """
+    Convert an iterable of features into a sequence of GeoPandas data frames
+    holding at most `chunk_size` rows each, so that very large collections
+    never need to be held twice in memory.
+
+    :param features: iterable of Features
+    :param chunk_size: maximum number of rows in each data frame
+    :param crs: optional coordinate reference system of the geometries
+    :return: generator of geodataframes, in feature order
+    """
+    features = iter(features)
+    while True:
+        chunk = list(islice(features, chunk_size))
+        if len(chunk) == 0:
+            return
+        yield features_to_geodataframe(chunk, crs=crs)
+
 
+def iter_features(gdf: gpd.GeoDataFrame,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Convert a GeoPandas data frame into Features, reading whole column
+    arrays `chunk_size` rows at a time rather than iterating over rows.
+    Values come out as pandas boxes them, i.e. native Python numbers and
+    strings, and Timestamps for dates.
+
+    :param gdf: geodataframe to convert
+    :param chunk_size: number of rows to convert at a time
+    :return: generator of Features, in row order
+    """
+    geometry_name = gdf.geometry.name
+    keys = [c for c in gdf.columns if c != geometry_name]
+    for start in range(0, len(gdf), chunk_size):
+        stop = start + chunk_size
+        geoms = gdf.geometry.iloc[start:stop].tolist()
+        columns = [gdf[k].iloc[start:stop].tolist() for k in keys]
+        rows = zip(*columns) if keys else ((),) * len(geoms)
+        for geom, row in zip(geoms, rows):
+            yield Feature(geom, dict(zip(keys, row)))
+
+
+def geodataframe_to_features(gdf: gpd.GeoDataFrame,
+                             chunk_size: int = DEFAULT_CHUNK_SIZE) -> list:
+    """
+    Convert a GeoPandas data frame into a list of features, the inverse of
+    `features_to_geodataframe`.
+
+    :param gdf: geodataframe to convert
+    :param chunk_size: number of rows to convert at a time
+    :return: list of Features corresponding to the geodataframe rows
+    """
+    return list(iter_features(gdf, chunk_size))
@@ -1,17 +1,130 @@
+import numpy as np
+import pyproj
+
+from allfed_spatial.geometry.arrays import (
+    linear_parts, lines_to_coords, segment_lengths, segment_mask,
+    vertex_owners)
+
+
 class Feature:
+    """ A Shapely geometry paired with a dictionary of attribute data.
+
+    Quantities derived from the geometry (bounds, length, first/last
+    coordinate and centroid) are computed lazily and cached on the feature.
+    The cache is cleared whenever `geom` is reassigned, e.g. by the
+    `project_features_*` functions.
+    """
 
     def __init__(self, geom, data={}):
         self.geom = geom
         self.data = data
 
+    @property
+    def geom(self):
+        return self._geom
+
+    @geom.setter
+    def geom(self, geom):
+        self._geom = geom
+        self._cache = {}
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute(self._geom)
+        return self._cache[key]
+
+    @property
+    def bounds(self):
+        """ tuple -- (minx, miny, maxx, maxy) of the geometry """
+        return self._cached('bounds', lambda g: g.bounds)
+
+    @property
+    def length(self):
+        """ float -- planar length of the geometry """
+        return self._cached('length', lambda g: g.length)
+
+    @property
+    def first_coord(self):
+        """ tuple -- first coordinate of a Point, LineString or LinearRing """
+        return self._cached('first_coord', lambda g: g.coords[0])
+
+    @property
+    def last_coord(self):
+        """ tuple -- last coordinate of a Point, LineString or LinearRing """
+        return self._cached('last_coord', lambda g: g.coords[-1])
+
+    @property
+    def centroid(self):
+        """ Point -- centroid of the geometry """
+        return self._cached('centroid', lambda g: g.centroid)
+
     def update_data(self, field, value):
         self.data[field] = value
 
     def update_length(self, unit='m'):
         if unit == 'm':
-            length = max(self.geom.length, 1)
+            length = max(self.length, 1)
         elif unit == 'km':
-            length = max(self.geom.length / 1000, 1)
+            length = max(self.length / 1000, 1)
         else:
             raise ValueError('Invalid unit')
         self.update_data('length', length)
+
+
+def compute_lengths(features, unit='m', geodesic=False, min_length=1):
+    """ Compute the length of every feature in one vectorized pass over
+    their coordinates and write it to each feature's `length` attribute.
+    Multi-part geometries are summed over their parts and polygons are
+    measured around their rings.
+
+    Arguments:
+        features {list} -- list of Features
+
+    Keyword Arguments:
+        unit {str} -- 'm' or 'km' (default: {'m'})
+        geodesic {bool} -- measure along the WGS84 ellipsoid, for features
+            in EPSG:4326, rather than in the planar units of the CRS, which
+            are assumed to be metres (default: {False})
+        min_length {int|float|None} -- lengths are clamped to at least this
+            value, as in Feature.update_length, None to disable
+            (default: {1})
+
+    Returns:
+        numpy.ndarray -- the computed lengths, indexed to features
+    """
+    if unit == 'm':
+        scale = 1
+    elif unit == 'km':
+        scale = 1000
+    else:
+        raise ValueError('Invalid unit')
+
+    parts = []
+    part_owners = []
+    for i, f in enumerate(features):
+        for part in linear_parts(f.geom):
+            parts.append(part)
+            part_owners.append(i)
+
+    coords, offsets = lines_to_coords(parts)
+    mask = segment_mask(offsets)
+    if geodesic and len(coords) > 1:
+        geod = pyproj.Geod(ellps='WGS84')
+        _, _, seg_lengths = geod.inv(
+            coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1])
+        seg_lengths = np.asarray(seg_lengths, dtype=float)
+    else:
+        seg_lengths = segment_lengths(coords)
+
+    seg_owners = np.asarray(part_owners, dtype=np.int64)[
+        vertex_owners(offsets)[:-1]]
+    lengths = np.bincount(
+        seg_owners[mask],
+        weights=seg_lengths[mask],
+        minlength=len(features)) / scale
+    if min_length is not None:
+        lengths = np.maximum(lengths, min_length)
+
+    for f, length in zip(features, lengths.tolist()):
+        f.update_data('length', length)
+    return lengths
@@ -0,0 +1,162 @@
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from allfed_spatial.geometry.arrays import linear_parts
+
+# Rough per-object costs used when estimating memory, in bytes. A Shapely
+# geometry is a small Python object wrapping a GEOS geometry, whose
+# coordinates are stored as doubles. An rtree entry holds its bounds, id
+# and a share of the tree's node overhead.
+GEOMETRY_OVERHEAD_BYTES = 200
+BYTES_PER_COORDINATE = 24
+RTREE_BYTES_PER_ENTRY = 80
+
+
+def _coordinate_count(geom):
+    if geom.geom_type == 'Point':
+        return 0 if geom.is_empty else 1
+    if geom.geom_type == 'MultiPoint':
+        return len(geom.geoms)
+    return sum(len(part.coords) for part in linear_parts(geom))
+
+
+def _data_bytes(data, seen):
+    if id(data) in seen:
+        return 0
+    seen.add(id(data))
+    return sys.getsizeof(data) + sum(
+        sys.getsizeof(k) + sys.getsizeof(v) for k, v in data.items())
+
+
+def memory_footprint(features, index=None):
+    """ Estimate the memory used by a list of features, split into
+    geometries (based on their coordinate counts), attribute data and
+    spatial index. Data dictionaries shared between features, e.g. after
+    `split_features_by_distance`, are only counted once. These are
+    estimates for finding which part of a pipeline is using memory, not
+    exact measurements.
+
+    Arguments:
+        features {list} -- list of Features, or a FeatureCollection whose
+            index is included if it has been built
+
+    Keyword Arguments:
+        index {SpatialIndex} -- index to include in the estimate
+            (default: {None})
+
+    Returns:
+        dict -- object counts and estimated bytes for each part
+    """
+    if index is None:
+        index = getattr(features, '_index', None)
+
+    geom_types = Counter()
+    coordinates = 0
+    data_bytes = 0
+    seen = set()
+    for f in features:
+        geom_types[f.geom.geom_type] += 1
+        coordinates += _coordinate_count(f.geom)
+        data_bytes += _data_bytes(f.data, seen)
+
+    geometry_bytes = (
+        len(features) * GEOMETRY_OVERHEAD_BYTES +
+        coordinates * BYTES_PER_COORDINATE)
+    index_bytes = 0
+    if index is not None:
+        index_bytes = index.bounds.nbytes + len(index) * RTREE_BYTES_PER_ENTRY
+
+    return {
+        'features': len(features),
+        'geom_types': dict(geom_types),
+        'coordinates': coordinates,
+        'data_dicts': len(seen),
+        'geometry_bytes': geometry_bytes,
+        'data_bytes': data_bytes,
+        'index_bytes': index_bytes,
+        'total_bytes': geometry_bytes + data_bytes + index_bytes,
+    }
+
+
+def peak_rss():
+    """ Peak resident set size of this process so far, in bytes, or None
+    where the platform doesn't report it """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+@contextmanager
+def profile_stage(name, results=None, verbose=False):
+    """ Record the time, Python allocations and peak RSS of a pipeline
+    stage, e.g.
+
+        with profile_stage('load'):
+            features = load_features(path)
+
+    Allocations are tracked with tracemalloc, so they cover Python objects
+    but not memory allocated inside GEOS or libspatialindex, which only
+    shows up in the RSS figures. The allocation peak is only known when
+    this stage starts tracemalloc, so it is None in a nested stage or when
+    tracing is already on. Peak RSS is the high water mark of the whole
+    process, so `rss_increase` is how far this stage raised it.
+
+    Arguments:
+        name {str} -- name of the stage
+
+    Keyword Arguments:
+        results {list} -- list to append the stage's statistics to
+            (default: {None})
+        verbose {bool} -- print a summary when the stage ends
+            (default: {False})
+
+    Yields:
+        dict -- the stage's statistics, filled in when the stage ends
+    """
+    stats = {'stage': name}
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    allocated_before, _ = tracemalloc.get_traced_memory()
+    rss_before = peak_rss()
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        allocated_after, allocated_peak = tracemalloc.get_traced_memory()
+        if started_tracing:
+            tracemalloc.stop()
+        rss_after = peak_rss()
+        stats.update({
+            'seconds': time.perf_counter() - start,
+            'allocated_bytes': allocated_after - allocated_before,
+            'peak_allocated_bytes': (
+                allocated_peak - allocated_before if started_tracing
+                else None),
+            'peak_rss_bytes': rss_after,
+            'rss_increase_bytes': (
+                None if rss_after is None else rss_after - rss_before),
+        })
+        if results is not None:
+            results.append(stats)
+        if verbose:
+            peak = stats['peak_allocated_bytes']
+            print('{stage}: {seconds:.2f}s, {allocated:.1f}MB allocated '
+                  '({peak} peak), peak RSS {rss}'.format(
+                      stage=name,
+                      seconds=stats['seconds'],
+                      allocated=stats['allocated_bytes'] / 1e6,
+                      peak='unknown' if peak is None else
+                      '{:.1f}MB'.format(peak / 1e6),
+                      rss='unknown' if rss_after is None else
+                      '{:.1f}MB'.format(rss_after / 1e6)))
@@ -0,0 +1,236 @@
+import numpy as np
+from shapely.geometry import LineString, Point
+
+# Helpers for moving between Shapely geometries and flat NumPy coordinate
+# arrays. A collection of lines is packed into a single (N, 2) array of xy
+# coordinates plus an `offsets` array of length n + 1, such that line `i`
+# is coords[offsets[i]:offsets[i + 1]]. Working on these arrays lets us
+# process whole collections in one vectorized pass.
+
+
+def coords_array(geom):
+    """ Get the xy coordinates of a Point, LineString or LinearRing
+
+    Arguments:
+        geom {Shapely geometry} -- geometry with a `coords` attribute
+
+    Returns:
+        numpy.ndarray -- (N, 2) array of float coordinates
+    """
+    coords = np.asarray(geom.coords, dtype=float)
+    if len(coords) == 0:
+        return np.empty((0, 2))
+    return coords[:, :2]
+
+
+def point_coords(geoms):
+    """ Get the coordinates of a list of Points, or pass through an array
+    of coordinates
+
+    Arguments:
+        geoms {list|numpy.ndarray} -- Shapely Points, or an array of xy
+            coordinates
+
+    Returns:
+        numpy.ndarray|None -- (N, 2) array of float coordinates, or None if
+            geoms aren't all non-empty Points
+    """
+    if isinstance(geoms, np.ndarray):
+        return geoms.reshape(-1, 2).astype(float)
+    if not all(isinstance(g, Point) and not g.is_empty for g in geoms):
+        return None
+    return np.array(
+        [g.coords[0][:2] for g in geoms], dtype=float).reshape(-1, 2)
+
+
+def as_geoms(geoms):
+    """ Turn an array of xy coordinates into Points, passing through lists
+    of geometries
+
+    Arguments:
+        geoms {list|numpy.ndarray} -- Shapely geometries, or an array of xy
+            coordinates
+
+    Returns:
+        list -- list of Shapely geometries
+    """
+    if isinstance(geoms, np.ndarray):
+        return [Point(xy) for xy in geoms.reshape(-1, 2)]
+    return geoms
+
+
+def linear_parts(geom):
+    """ Break a geometry down into its linear components, e.g. the parts
+    of a MultiLineString or the rings of a Polygon. Points have none.
+
+    Arguments:
+        geom {Shapely geometry} -- geometry to break down
+
+    Returns:
+        list -- list of LineStrings and LinearRings
+    """
+    if geom.is_empty:
+        return []
+    geom_type = geom.geom_type
+    if geom_type in ('LineString', 'LinearRing'):
+        return [geom]
+    if geom_type == 'Polygon':
+        return [geom.exterior] + list(geom.interiors)
+    if geom_type.startswith('Multi') or geom_type == 'GeometryCollection':
+        return [part for g in geom.geoms for part in linear_parts(g)]
+    return []
+
+
+def lines_to_coords(lines):
+    """ Pack a list of lines into a flat coordinate array
+
+    Arguments:
+        lines {list} -- list of Shapely LineStrings (or LinearRings)
+
+    Returns:
+        tuple -- (coords, offsets) where coords is an (N, 2) float array and
+            line `i` is coords[offsets[i]:offsets[i + 1]]
+    """
+    arrays = [coords_array(line) for line in lines]
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(a) for a in arrays])
+    if len(arrays) == 0:
+        return np.empty((0, 2)), offsets
+    return np.concatenate(arrays), offsets
+
+
+def coords_to_lines(coords, offsets):
+    """ Unpack a flat coordinate array into LineStrings
+
+    Arguments:
+        coords {numpy.ndarray} -- (N, 2) array of coordinates
+        offsets {numpy.ndarray} -- line start offsets into coords
+
+    Returns:
+        list -- list of Shapely LineStrings
+    """
+    return [
+        LineString(coords[start:end])
+        for start, end in zip(offsets[:-1], offsets[1:])
+    ]
+
+
+def vertex_owners(offsets):
+    """ Get the index of the line each coordinate belongs to
+
+    Arguments:
+        offsets {numpy.ndarray} -- line start offsets into coords
+
+    Returns:
+        numpy.ndarray -- (N,) array of line indices
+    """
+    counts = np.diff(offsets)
+    return np.repeat(np.arange(len(counts)), counts)
+
+
+def segment_lengths(coords):
+    """ Planar length between each consecutive pair of coordinates. The
+    segment joining the last vertex of one line to the first vertex of the
+    next is included, so combine with `segment_mask` where needed.
+
+    Arguments:
+        coords {numpy.ndarray} -- (N, 2) array of coordinates
+
+    Returns:
+        numpy.ndarray -- (N - 1,) array of lengths
+    """
+    delta = np.diff(coords, axis=0)
+    return np.sqrt(delta[:, 0] * delta[:, 0] + delta[:, 1] * delta[:, 1])
+
+
+def segment_mask(offsets):
+    """ Flag which consecutive coordinate pairs form real segments, i.e.
+    both coordinates belong to the same line
+
+    Arguments:
+        offsets {numpy.ndarray} -- line start offsets into coords
+
+    Returns:
+        numpy.ndarray -- (N - 1,) boolean array
+    """
+    owners = vertex_owners(offsets)
+    return owners[:-1] == owners[1:]
+
+
+def cumulative_lengths(coords, offsets):
+    """ Distance along its line of every coordinate, starting from 0 at the
+    first vertex of each line. Each line's lengths are summed on their own,
+    in order, as GEOS does, so points placed with them match Shapely's
+    exactly.
+
+    Arguments:
+        coords {numpy.ndarray} -- (N, 2) array of coordinates
+        offsets {numpy.ndarray} -- line start offsets into coords
+
+    Returns:
+        numpy.ndarray -- (N,) array of distances along each line
+    """
+    cumulative = np.zeros(len(coords))
+    counts = np.diff(offsets)
+    if len(coords) < 2:
+        return cumulative
+    lengths = segment_lengths(coords)
+
+    # lines of similar lengths are summed together, one per row of a padded
+    # array, with rows at most twice as wide as the shortest line in them
+    lines = np.flatnonzero(counts > 1)
+    sizes = np.floor(np.log2(counts[lines] - 1)).astype(np.int64)
+    for size in np.unique(sizes):
+        group = lines[sizes == size]
+        steps = np.arange(counts[group].max() - 1)
+        in_line = steps < (counts[group] - 1)[:, None]
+        index = offsets[group][:, None] + steps
+        padded = np.where(in_line, lengths[np.where(in_line, index, 0)], 0)
+        cumulative[index[in_line] + 1] = np.cumsum(padded, axis=1)[in_line]
+    return cumulative
+
+
+def endpoint_nodes(coords, offsets, tolerance=0):
+    """ Number the distinct endpoints of packed lines, so lines which share
+    an endpoint share a node. Endpoints are rounded to a grid of
+    `tolerance` before they are compared, and nodes are numbered in the
+    order they first appear.
+
+    Arguments:
+        coords {numpy.ndarray} -- (N, 2) array of coordinates
+        offsets {numpy.ndarray} -- line start offsets into coords, where
+            every line has at least one coordinate
+
+    Keyword Arguments:
+        tolerance {int|float} -- size of the grid endpoints are rounded to,
+            or 0 to only match identical endpoints (default: {0})
+
+    Returns:
+        tuple -- (line_nodes, node_coords) where line `i` runs from node
+            line_nodes[i, 0] to node line_nodes[i, 1], and node_coords holds
+            the first endpoint seen at each node
+    """
+    n_lines = len(offsets) - 1
+    endpoints = np.empty((2 * n_lines, 2))
+    endpoints[0::2] = coords[offsets[:-1]]
+    endpoints[1::2] = coords[offsets[1:] - 1]
+    if n_lines == 0:
+        return np.empty((0, 2), dtype=np.int64), endpoints
+
+    keys = endpoints if tolerance == 0 else np.round(endpoints / tolerance)
+    # a single integer key per endpoint sorts far faster than the pairs
+    _, xs = np.unique(keys[:, 0], return_inverse=True)
+    _, ys = np.unique(keys[:, 1], return_inverse=True)
+    ys = ys.reshape(-1).astype(np.int64)
+    combined = xs.reshape(-1).astype(np.int64) * (ys.max() + 1) + ys
+
+    order = np.argsort(combined)
+    sorted_keys = combined[order]
+    starts = np.ones(len(keys), dtype=bool)
+    starts[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    first = np.minimum.reduceat(order, np.flatnonzero(starts))
+    ranks = np.empty(len(first), dtype=np.int64)
+    ranks[np.argsort(first)] = np.arange(len(first))
+    nodes = np.empty(len(keys), dtype=np.int64)
+    nodes[order] = ranks[np.cumsum(starts) - 1]
+    return nodes.reshape(-1, 2), endpoints[np.sort(first)]
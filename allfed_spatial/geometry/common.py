@@ -1,8 +1,34 @@
 
-def closest(geom, targets, n=1):
+import heapq
+
+import numpy as np
+from shapely.geometry import Point, LineString, GeometryCollection
+from shapely.prepared import prep
+
+from allfed_spatial.geometry.arrays import as_geoms, lines_to_coords, point_coords
+from allfed_spatial.geometry.distance import (
+    point_distances, point_line_distances, geom_distance, search_index,
+    haversine_distances, check_metric, DEFAULT_CHUNK_PAIRS, EARTH_RADIUS,
+    EUCLIDEAN)
+from allfed_spatial.geometry.index import SpatialIndex
+
+DEFAULT_CHUNK_SIZE = 2048
+# Geometries closer than this are treated as intersecting
+INTERSECTS_TOLERANCE = 1e-8
+# Misses before prepared_intersects builds its buffer, which only pays off
+# when testing many targets
+BAND_AFTER_MISSES = 8
+# Above this many point pairs, a grid search beats brute force
+MAX_BRUTE_FORCE_PAIRS = 10 ** 7
+# Targets per cell aimed for by the grid search between point sets
+GRID_TARGETS_PER_CELL = 2
+
+
+def closest(geom, targets, n=1, index=None, metric=EUCLIDEAN):
     """ Finds the `n`th closest geometry to geom from a set of targets.
     For example, if n=2, finds the member of targets which is the 2nd closest 
-    to geom. 
+    to geom. Where targets are equally close, the one earliest in targets
+    is treated as closest.
 
     Arguments:
         geom {Shapely geometry} -- A single Shapely geometry (e.g. Point)
@@ -10,20 +36,62 @@ def closest(geom, targets, n=1):
 
     Keyword Arguments:
         n {int} -- The `n`th closest geometry to return (default: {1})
+        index {SpatialIndex} -- prebuilt index over targets, which limits
+            the distance calculations to targets near geom (default: {None})
+        metric {str} -- 'euclidean' for planar distances, or 'haversine'
+            for distances in metres between EPSG:4326 geometries, see
+            `distance.geom_distance` (default: {'euclidean'})
 
     Returns:
         Shapely geometry -- Member of targets which is the `n`th closest
     """
+    check_metric(metric)
     if len(targets) < n:
         raise ValueError(
             'List of targets needs at least {} members'.format(n)
         )
 
-    def distance(t): return geom.distance(t)
-    return sorted(targets, key=distance)[n - 1]
+    if index is None:
+        candidates = range(len(targets))
+    else:
+        candidates = _nearest_candidates(geom, targets, n, index, metric)
+    return targets[_nth_closest(geom, targets, candidates, n, metric)]
+
+
+def _nth_closest(geom, targets, candidates, n, metric=EUCLIDEAN):
+    """ Position of the `n`th closest of the candidate targets, where
+    candidates are positions in targets in ascending order. Equivalent to a
+    stable sort by distance, but only keeps the closest `n`. """
+    distances = [geom_distance(geom, targets[i], metric) for i in candidates]
+    nearest = heapq.nsmallest(
+        n, range(len(distances)), key=distances.__getitem__)
+    return candidates[nearest[n - 1]]
+
+
+def _nearest_candidates(geom, targets, n, index, metric=EUCLIDEAN):
+    """ Use an index to find a small set of targets which is guaranteed to
+    contain the `n` closest to geom, including any ties.
+
+    The `n` targets with the nearest bounds give an upper bound on the
+    distance to the `n`th closest target, and every target within that
+    distance has bounds within that distance of geom's bounds. For the
+    haversine metric the bounds are in degrees, so nearest bounds needn't
+    be nearest in metres, but they still give an upper bound.
+    """
+    bounds = geom.bounds
+    if len(bounds) == 0:
+        return range(len(targets))
+    nearest = index.nearest(bounds, n)
+    if len(nearest) < n:
+        # some targets are empty and not indexed
+        return range(len(targets))
+    distances = heapq.nsmallest(
+        n, [geom_distance(geom, targets[i], metric) for i in nearest])
+    return sorted(search_index(index, bounds, distances[-1], metric))
 
 
-def closest_within_radius(geom, targets, radius, n=1):
+def closest_within_radius(geom, targets, radius, n=1, index=None,
+                          metric=EUCLIDEAN):
     """Finds the `n`th closest geometry to geom from a set of targets within 
     or equal to a defined radius of geom. For example, if n=2 and r=10, finds 
     the member of targets which is the 2nd closest to geom, which is also 
@@ -37,23 +105,417 @@ def closest_within_radius(geom, targets, radius, n=1):
 
     Keyword Arguments:
         n {int} -- The `n`th closest geometry to return (default: {1})
+        index {SpatialIndex} -- prebuilt index over targets. Only targets
+            whose bounds are within the radius of geom's bounds are then
+            considered, so small searches cost almost nothing however many
+            targets there are (default: {None})
+        metric {str} -- 'euclidean' or 'haversine', in which case radius
+            is in metres, see `closest` (default: {'euclidean'})
 
     Returns:
         Shapely geometry | None -- Member of targets which is `n`th closest
             within or equal to the radius
     """
-    most_close = closest(geom, targets, n)
-    if geom.distance(most_close) > radius:
+    check_metric(metric)
+    if len(targets) < n:
+        raise ValueError(
+            'List of targets needs at least {} members'.format(n)
+        )
+
+    bounds = geom.bounds
+    if index is None or len(bounds) == 0:
+        candidates = range(len(targets))
+    else:
+        candidates = sorted(search_index(index, bounds, radius, metric))
+        if len(candidates) < n:
+            return None
+
+    distances = [geom_distance(geom, targets[i], metric) for i in candidates]
+    within = [j for j, d in enumerate(distances) if d <= radius]
+    if len(within) < n:
+        return None
+    nearest = heapq.nsmallest(n, within, key=distances.__getitem__)
+    return targets[candidates[nearest[n - 1]]]
+
+
+def closest_indices(geoms, targets, k=1, radius=None, index=None,
+                    chunk_size=DEFAULT_CHUNK_SIZE, metric=EUCLIDEAN):
+    """ Finds the `k` closest targets to each of a set of geometries in one
+    call, returning their positions in targets and their distances. Ties
+    are broken in favour of the target earliest in targets, as in
+    `closest`.
+
+    When geoms are points and targets are points or LineStrings, small
+    problems are solved by brute force with NumPy, in tiles of `chunk_size`
+    queries by `chunk_size` point targets, or in chunks sized for the
+    `distance` kernel for line targets, which bounds memory use. Larger
+    problems between points are answered all together from a grid over the
+    targets, see `_closest_point_indices_grid`. Otherwise each query is
+    answered from a spatial index over targets, which is built if not
+    given.
+
+    Arguments:
+        geoms {list|numpy.ndarray} -- Shapely geometries to search from, or
+            an (M, 2) array of point coordinates
+        targets {list|numpy.ndarray} -- Shapely geometries to search, or an
+            (N, 2) array of point coordinates
+
+    Keyword Arguments:
+        k {int} -- number of closest targets to find (default: {1})
+        radius {int|float} -- only find targets within or equal to this
+            distance (default: {None})
+        index {SpatialIndex} -- prebuilt index over targets
+            (default: {None})
+        chunk_size {int} -- tile size for point distances
+            (default: {DEFAULT_CHUNK_SIZE})
+        metric {str} -- 'euclidean' or 'haversine', in which case radius
+            and distances are in metres, see `closest`
+            (default: {'euclidean'})
+
+    Returns:
+        tuple -- (indices, distances), (M, k) arrays of the positions in
+            targets of the closest targets, nearest first, and their
+            distances. Missing results, where there are fewer than `k`
+            targets (within the radius), have index -1 and distance inf.
+    """
+    check_metric(metric)
+    query_xy = point_coords(geoms)
+    target_xy = point_coords(targets)
+    if query_xy is not None and target_xy is not None:
+        if index is None and \
+                len(query_xy) * len(target_xy) <= MAX_BRUTE_FORCE_PAIRS:
+            return _closest_point_indices(
+                query_xy, target_xy, k, radius, chunk_size, metric)
+        if index is None:
+            return _closest_point_indices_grid(
+                query_xy, target_xy, k, radius, metric)
+        return _closest_point_indices_with_index(
+            query_xy, target_xy, k, radius, index, metric)
+
+    if query_xy is not None and index is None:
+        packed = _packed_lines(targets)
+        if packed is not None and \
+                len(query_xy) * len(packed[0]) <= MAX_BRUTE_FORCE_PAIRS:
+            return _closest_line_indices(query_xy, packed, k, radius, metric)
+
+    geoms = as_geoms(geoms)
+    targets = as_geoms(targets)
+    if index is None:
+        index = SpatialIndex.from_geoms(targets)
+
+    indices = np.full((len(geoms), k), -1, dtype=np.int64)
+    distances = np.full((len(geoms), k), np.inf)
+    for row, geom in enumerate(geoms):
+        if radius is None:
+            candidates = _nearest_candidates(
+                geom, targets, k, index, metric)
+        elif geom.is_empty:
+            continue
+        else:
+            candidates = sorted(
+                search_index(index, geom.bounds, radius, metric))
+        candidates = np.asarray(candidates, dtype=np.int64)
+
+        if target_xy is not None and geom.geom_type == 'Point':
+            candidate_distances = point_distances(
+                np.array(geom.coords[0][:2])[None], target_xy[candidates],
+                metric)[0]
+        else:
+            candidate_distances = np.array(
+                [geom_distance(geom, targets[i], metric) for i in candidates],
+                dtype=float)
+
+        order = np.argsort(candidate_distances, kind='stable')[:k]
+        if radius is not None:
+            order = order[candidate_distances[order] <= radius]
+        indices[row, :len(order)] = candidates[order]
+        distances[row, :len(order)] = candidate_distances[order]
+
+    return indices, distances
+
+
+def _packed_lines(geoms):
+    """ Flat coordinates of a list of LineStrings, or None if they aren't
+    all non-empty lines """
+    if isinstance(geoms, np.ndarray) or not all(
+            isinstance(g, LineString) and not g.is_empty for g in geoms):
         return None
-    return most_close
+    return lines_to_coords(geoms)
+
+
+def _closest_point_indices(query_xy, target_xy, k, radius, chunk_size,
+                           metric=EUCLIDEAN):
+    """ Tiled brute force k nearest search between two sets of points """
+    indices = np.full((len(query_xy), k), -1, dtype=np.int64)
+    distances = np.full((len(query_xy), k), np.inf)
+
+    for q_start in range(0, len(query_xy), chunk_size):
+        queries = query_xy[q_start:q_start + chunk_size]
+        best_distances = np.full((len(queries), k), np.inf)
+        best_indices = np.full((len(queries), k), -1, dtype=np.int64)
+
+        for t_start in range(0, len(target_xy), chunk_size):
+            tile = target_xy[t_start:t_start + chunk_size]
+            tile_distances = point_distances(queries, tile, metric)
+            if radius is not None:
+                tile_distances[tile_distances > radius] = np.inf
+
+            if tile_distances.shape[1] > k:
+                tile_distances, tile_indices = _k_smallest(
+                    tile_distances, k)
+                tile_indices += t_start
+            else:
+                tile_indices = np.broadcast_to(
+                    np.arange(t_start, t_start + len(tile)),
+                    tile_distances.shape)
+
+            # earlier targets come first, so a stable sort keeps them
+            # ahead of later targets at the same distance
+            candidate_distances = np.concatenate(
+                [best_distances, tile_distances], axis=1)
+            candidate_indices = np.concatenate(
+                [best_indices, tile_indices], axis=1)
+            order = np.argsort(
+                candidate_distances, axis=1, kind='stable')[:, :k]
+            best_distances = np.take_along_axis(
+                candidate_distances, order, axis=1)
+            best_indices = np.take_along_axis(
+                candidate_indices, order, axis=1)
+
+        best_indices[np.isinf(best_distances)] = -1
+        indices[q_start:q_start + len(queries)] = best_indices
+        distances[q_start:q_start + len(queries)] = best_distances
+
+    return indices, distances
+
+
+def _closest_line_indices(query_xy, packed, k, radius, metric=EUCLIDEAN):
+    """ Brute force k nearest search from points to lines, working on as
+    many queries at once as fit in the distance kernel's chunk size """
+    coords, offsets = packed
+    indices = np.full((len(query_xy), k), -1, dtype=np.int64)
+    distances = np.full((len(query_xy), k), np.inf)
+    chunk_size = max(1, DEFAULT_CHUNK_PAIRS // max(len(coords), 1))
+
+    for start in range(0, len(query_xy), chunk_size):
+        rows = slice(start, start + chunk_size)
+        line_distances = point_line_distances(
+            query_xy[rows], coords, offsets, metric=metric)
+        if radius is not None:
+            line_distances[line_distances > radius] = np.inf
+        if line_distances.shape[1] > k:
+            line_distances, columns = _k_smallest(line_distances, k)
+        else:
+            columns = np.broadcast_to(
+                np.arange(line_distances.shape[1]), line_distances.shape)
+        order = np.argsort(line_distances, axis=1, kind='stable')
+        best_distances = np.take_along_axis(line_distances, order, axis=1)
+        best_indices = np.take_along_axis(columns, order, axis=1)
+        best_indices[np.isinf(best_distances)] = -1
+        width = best_indices.shape[1]
+        indices[rows, :width] = best_indices
+        distances[rows, :width] = best_distances
+
+    return indices, distances
+
+
+def _closest_point_indices_with_index(query_xy, target_xy, k, radius, index,
+                                     metric=EUCLIDEAN):
+    """ k nearest search between two sets of points using an index. For
+    point targets, rtree's nearest search by bounds is already exact in
+    the plane. Nearest in degrees isn't nearest in metres though, so for
+    the haversine metric it only bounds the search. """
+    indices = np.full((len(query_xy), k), -1, dtype=np.int64)
+    distances = np.full((len(query_xy), k), np.inf)
+
+    for row, (x, y) in enumerate(query_xy.tolist()):
+        query = np.array([[x, y]])
+        if radius is None:
+            candidates = index.nearest((x, y, x, y), k)
+            if metric != EUCLIDEAN and len(candidates) > 0:
+                furthest = np.sort(point_distances(
+                    query, target_xy[candidates], metric)[0])[:k][-1]
+                candidates = search_index(
+                    index, (x, y, x, y), furthest, metric)
+        else:
+            candidates = search_index(index, (x, y, x, y), radius, metric)
+        candidates = np.sort(np.asarray(candidates, dtype=np.int64))
+        candidate_distances = point_distances(
+            query, target_xy[candidates], metric)[0]
+
+        order = np.argsort(candidate_distances, kind='stable')[:k]
+        if radius is not None:
+            order = order[candidate_distances[order] <= radius]
+        indices[row, :len(order)] = candidates[order]
+        distances[row, :len(order)] = candidate_distances[order]
+
+    return indices, distances
+
+
+def _closest_point_indices_grid(query_xy, target_xy, k, radius,
+                                metric=EUCLIDEAN):
+    """ k nearest search between two sets of points, answering all of the
+    queries at once from a grid over the targets. Each query looks in the
+    block of cells around its own, which holds every target nearer than a
+    cell width, so it is done once its `k`th nearest is that near. The rest
+    look again on a grid of cells twice the size. For the haversine metric
+    the grid is over the points on the sphere, where straight line
+    distances rank points as great circle distances do. """
+    indices = np.full((len(query_xy), k), -1, dtype=np.int64)
+    distances = np.full((len(query_xy), k), np.inf)
+    if len(query_xy) == 0 or len(target_xy) == 0:
+        return indices, distances
+
+    if metric == EUCLIDEAN:
+        query_grid, target_grid = query_xy, target_xy
+    else:
+        query_grid = _sphere_coords(query_xy)
+        target_grid = _sphere_coords(target_xy)
+    lower = target_grid.min(axis=0)
+    spans = np.sort(target_grid.max(axis=0) - lower)[::-1][:2]
+    spans = spans[spans > 0]
+    size = 1.0
+    if len(spans) > 0:
+        # the points spread over at most a surface
+        size = (np.prod(spans) * GRID_TARGETS_PER_CELL /
+                len(target_grid)) ** (1 / len(spans))
+    offsets = np.array(
+        np.meshgrid(*[[-1, 0, 1]] * target_grid.shape[1]),
+        dtype=float).reshape(target_grid.shape[1], -1).T
+
+    remaining = np.arange(len(query_xy))
+    while len(remaining) > 0:
+        target_cells = np.floor((target_grid - lower) / size)
+        shape = target_cells.max(axis=0) + 1
+        strides = np.concatenate([np.cumprod(shape[::-1])[::-1][1:], [1]])
+        target_keys = target_cells.dot(strides)
+        order = np.argsort(target_keys, kind='stable')
+        cells, cell_starts, cell_counts = np.unique(
+            target_keys[order], return_index=True, return_counts=True)
+
+        query_cells = np.floor((query_grid[remaining] - lower) / size)
+        block = query_cells[:, None] + offsets[None]
+        keys = block.dot(strides)
+        found = np.minimum(np.searchsorted(cells, keys), len(cells) - 1)
+        starts = cell_starts[found]
+        counts = np.where(cells[found] == keys, cell_counts[found], 0)
+        counts[((block < 0) | (block >= shape)).any(axis=2)] = 0
+        covered = ((query_cells <= 1) & (query_cells >= shape - 2)).all(
+            axis=1)
+
+        # as many queries at a time as have DEFAULT_CHUNK_PAIRS pairs
+        finished = np.zeros(len(remaining), dtype=bool)
+        pairs = np.cumsum(counts.sum(axis=1))
+        start = 0
+        while start < len(remaining):
+            before = pairs[start - 1] if start > 0 else 0
+            end = max(start + 1, int(np.searchsorted(
+                pairs, before + DEFAULT_CHUNK_PAIRS, 'right')))
+            rows, columns, pair_distances = _grid_pairs(
+                query_xy, target_xy, remaining[start:end], order,
+                starts[start:end], counts[start:end], metric)
+            if radius is not None:
+                pair_distances[pair_distances > radius] = np.inf
+            chunk_indices, chunk_distances = _k_nearest_pairs(
+                rows, columns, pair_distances, end - start, k)
+
+            # nothing outside the block is nearer than a cell width
+            kth = chunk_distances[:, -1]
+            if metric != EUCLIDEAN:
+                kth = 2 * EARTH_RADIUS * np.sin(
+                    np.minimum(kth / (2 * EARTH_RADIUS), np.pi / 2))
+            done = (kth < size) | covered[start:end]
+            if radius is not None and radius < size:
+                done[:] = True
+            finished[start:end] = done
+            queries = remaining[start:end][done]
+            indices[queries] = chunk_indices[done]
+            distances[queries] = chunk_distances[done]
+            start = end
+
+        remaining = remaining[~finished]
+        size *= 2
+
+    return indices, distances
+
+
+def _grid_pairs(query_xy, target_xy, queries, order, starts, counts, metric):
+    """ Positions in `queries` and in targets of the query and target of
+    every pair within the grid blocks of the queries, with their
+    distances """
+    counts = counts.ravel()
+    rows = np.repeat(
+        np.arange(len(queries)), counts.reshape(len(queries), -1).sum(axis=1))
+    position = np.arange(counts.sum()) - np.repeat(
+        np.cumsum(counts) - counts, counts)
+    columns = order[np.repeat(starts.ravel(), counts) + position]
+    query = query_xy[queries[rows]]
+    target = target_xy[columns]
+    if metric == EUCLIDEAN:
+        dx = query[:, 0] - target[:, 0]
+        dy = query[:, 1] - target[:, 1]
+        return rows, columns, np.sqrt(dx * dx + dy * dy)
+    return rows, columns, haversine_distances(query, target)
+
+
+def _k_nearest_pairs(rows, columns, distances, n_rows, k):
+    """ The `k` nearest targets of each row from pairs grouped by row,
+    nearest first and the earliest target first on ties, taking the
+    nearest remaining pair of every row at each step """
+    indices = np.full((n_rows, k), -1, dtype=np.int64)
+    best_distances = np.full((n_rows, k), np.inf)
+    if len(rows) == 0:
+        return indices, best_distances
+    firsts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    counts = np.diff(np.r_[firsts, len(rows)])
+    distances = distances.copy()
+    unused = np.iinfo(np.int64).max
+    for rank in range(k):
+        nearest = np.minimum.reduceat(distances, firsts)
+        ties = distances == np.repeat(nearest, counts)
+        earliest = np.minimum.reduceat(
+            np.where(ties, columns, unused), firsts)
+        kept = nearest < np.inf
+        if not kept.any():
+            break
+        indices[rows[firsts[kept]], rank] = earliest[kept]
+        best_distances[rows[firsts[kept]], rank] = nearest[kept]
+        distances[columns == np.repeat(earliest, counts)] = np.inf
+    return indices, best_distances
+
+
+def _sphere_coords(lonlat):
+    """ Points on a sphere the size of the Earth, from longitudes and
+    latitudes in degrees """
+    lon, lat = np.radians(lonlat).T
+    return EARTH_RADIUS * np.column_stack([
+        np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def _k_smallest(distances, k):
+    """ The `k` smallest values in each row of a 2D array and their column
+    positions, in column order. Where several values tie for the `k`th
+    smallest, the earliest columns are kept. """
+    kth = np.partition(distances, k - 1, axis=1)[:, k - 1, None]
+    below = distances < kth
+    tied = distances == kth
+    room = k - below.sum(axis=1, keepdims=True)
+    keep = below | (tied & (np.cumsum(tied, axis=1) <= room))
+    columns = np.nonzero(keep)[1].reshape(len(distances), k)
+    return np.take_along_axis(distances, columns, axis=1), columns
 
 
 def closest_non_intersecting_within_radius(
-        geom, non_intersect_geom, targets, radius, n=1):
+        geom, non_intersect_geom, targets, radius, n=1, index=None,
+        metric=EUCLIDEAN):
     """Finds the `n`th closest geometry to geom from a set of targets within a
     defined radius of geom, which also does not intersect non_intersect_geom.
     See closest_within_radius for more info on radius condition.
 
+    Targets are visited in order of distance, and only tested for
+    intersection until the `n`th which doesn't intersect is found, so the
+    intersection tests stop at the radius.
+
     Arguments:
         geom {Shapely geometry} -- A single Shapely geometry (e.g. Point)
         non_intersect_geom {Shapely geometry} -- A single Shapely geometry 
@@ -62,29 +524,66 @@ def closest_non_intersecting_within_radius(
 
     Keyword Arguments:
         n {int} -- The `n`th closest geometry to return (default: {1})
+        index {SpatialIndex} -- prebuilt index over targets, so that only
+            targets whose bounds are within the radius are considered
+            (default: {None})
+        metric {str} -- 'euclidean' or 'haversine', in which case radius
+            is in metres, see `closest` (default: {'euclidean'})
 
     Returns:
         Shapely geometry | None -- Member of targets which is `n`th closest
             within the radius, which also doesn't intersect non_intersect_geom
     """
+    check_metric(metric)
     if len(targets) < n:
         raise ValueError(
-            'List of targets needs at least {n} members'.format(n)
+            'List of targets needs at least {} members'.format(n)
         )
 
-    eligible = list(filter(lambda t: not intersects(
-        non_intersect_geom, t), targets))
+    bounds = geom.bounds
+    if index is None or len(bounds) == 0:
+        candidates = range(len(targets))
+    else:
+        candidates = sorted(search_index(index, bounds, radius, metric))
 
-    if len(eligible) > 0:
-        most_close = closest(geom, eligible, n)
-        if geom.distance(most_close) > radius:
-            return None
-        return most_close
+    # ties are popped in candidate order, as in a stable sort
+    heap = [
+        (geom_distance(geom, targets[i], metric), j)
+        for j, i in enumerate(candidates)]
+    heapq.heapify(heap)
+    intersects_non_intersect_geom = prepared_intersects(non_intersect_geom)
+
+    found = 0
+    while heap:
+        distance, j = heapq.heappop(heap)
+        if distance > radius:
+            heapq.heappush(heap, (distance, j))
+            break
+        if not intersects_non_intersect_geom(targets[candidates[j]]):
+            found += 1
+            if found == n:
+                return targets[candidates[j]]
+
+    if index is None and 1 < n:
+        # Without an index, having some but fewer than `n` non-intersecting
+        # targets in total has always been an error
+        for _, j in heap:
+            if not intersects_non_intersect_geom(targets[candidates[j]]):
+                found += 1
+                if found == n:
+                    return None
+        if found > 0:
+            raise ValueError(
+                'List of targets needs at least {} members which don\'t '
+                'intersect non_intersect_geom'.format(n)
+            )
     return None
 
 
 def intersects(g1, g2):
-    """ Determine if g1 geometrically intersects g2
+    """ Determine if g1 geometrically intersects g2, to within a tolerance
+    of INTERSECTS_TOLERANCE. To test one geometry against many others,
+    `prepared_intersects` is much faster
 
     Arguments:
         g1 {Shapely geometry} -- A single Shapely geometry (e.g. Polygon)
@@ -93,4 +592,49 @@ def intersects(g1, g2):
     Returns:
         boolean -- true if g1 intersects g2, false otherwise
     """
-    return g1.distance(g2) < 1e-8
+    return g1.distance(g2) < INTERSECTS_TOLERANCE
+
+
+def prepared_intersects(geom):
+    """ Prepare a geometry for testing intersection against many others.
+    The returned predicate gives the same answers as `intersects(geom, t)`.
+    A prepared geometry, which rejects targets on their bounding boxes
+    before doing any exact work, confirms intersections cheaply. Targets
+    which miss need a full distance calculation to check the tolerance.
+    Once there have been a few of them, a prepared buffer of twice the
+    tolerance is built, and then only targets passing within that thin
+    band need the distance.
+
+    Arguments:
+        geom {Shapely geometry} -- geometry to test others against
+
+    Returns:
+        function -- predicate taking a Shapely geometry and returning true
+            if it intersects geom
+    """
+    prepared = prep(geom) if _supports_predicates(geom) else None
+    # distances from points are cheap enough to not need the buffer
+    use_band = prepared is not None and not isinstance(geom, Point)
+    misses = 0
+    band = None
+
+    def predicate(target):
+        nonlocal misses, band
+        if prepared is not None and _supports_predicates(target):
+            if prepared.intersects(target):
+                return True
+            if use_band:
+                misses += 1
+                if band is None and misses > BAND_AFTER_MISSES:
+                    band = prep(geom.buffer(2 * INTERSECTS_TOLERANCE))
+                if band is not None and not band.intersects(target):
+                    return False
+        return geom.distance(target) < INTERSECTS_TOLERANCE
+
+    return predicate
+
+
+def _supports_predicates(geom):
+    """ GEOS predicates don't accept collections, and shapely reports a
+    distance of 0 to empty geometries, so both take the distance route """
+    return not isinstance(geom, GeometryCollection) and not geom.is_empty
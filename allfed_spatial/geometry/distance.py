@@ -0,0 +1,814 @@
+import math
+import os
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+from shapely.geometry import LineString, Point
+from shapely.ops import nearest_points, transform
+
+from allfed_spatial.geometry.arrays import (
+    as_geoms, lines_to_coords, point_coords, segment_mask, vertex_owners)
+from allfed_spatial.geometry.index import SpatialIndex, expand_bounds
+
+# Distances between points and the segments of lines held in flat
+# coordinate arrays (see `arrays`). The formulas follow GEOS's point to
+# segment distance step by step, so results agree exactly with Shapely's
+# `distance`, and ties are broken the same way.
+#
+# Distances can also be measured in metres along the surface of the Earth
+# directly from EPSG:4326 longitude and latitude, with metric='haversine',
+# which avoids projecting data to and from a planar CRS. Between points
+# this is the exact great circle distance on a sphere. For other
+# geometries the nearest point is found in a local equirectangular
+# projection centred on the query, and the great circle distance to it is
+# returned, which is accurate for the short distances used when searching
+# and snapping.
+
+# Largest number of point-segment pairs worked on at once, which bounds the
+# size of temporary arrays
+DEFAULT_CHUNK_PAIRS = 2 ** 20
+
+# Number of points searched together against a segment index
+DEFAULT_BATCH_POINTS = 4096
+
+EUCLIDEAN = 'euclidean'
+HAVERSINE = 'haversine'
+METRICS = (EUCLIDEAN, HAVERSINE)
+
+# Mean radius of the Earth in metres
+EARTH_RADIUS = 6371008.8
+
+# Largest distance matrix, in bytes, kept in memory before it is written
+# to memory-mapped files instead
+DEFAULT_RAM_BUDGET = 2 ** 30
+
+# A sparse matrix in compressed sparse row form, which can be passed
+# straight to scipy.sparse.csr_matrix((data, indices, indptr), shape)
+CSRMatrix = namedtuple('CSRMatrix', ['data', 'indices', 'indptr', 'shape'])
+
+
+def check_metric(metric):
+    """ Raise a ValueError if metric isn't one of METRICS """
+    if metric not in METRICS:
+        raise ValueError('Invalid metric')
+
+
+def haversine_distances(lonlat1, lonlat2):
+    """ Great circle distance in metres between points, broadcasting over
+    the leading dimensions of the arrays
+
+    Arguments:
+        lonlat1 {numpy.ndarray} -- (..., 2) array of longitudes and
+            latitudes in degrees
+        lonlat2 {numpy.ndarray} -- (..., 2) array of longitudes and
+            latitudes in degrees
+
+    Returns:
+        numpy.ndarray -- array of distances
+    """
+    lonlat1 = np.radians(np.asarray(lonlat1, dtype=float))
+    lonlat2 = np.radians(np.asarray(lonlat2, dtype=float))
+    lat1 = lonlat1[..., 1]
+    lat2 = lonlat2[..., 1]
+    half_dlat = np.sin((lat2 - lat1) / 2)
+    half_dlon = np.sin((lonlat2[..., 0] - lonlat1[..., 0]) / 2)
+    a = half_dlat * half_dlat + \
+        np.cos(lat1) * np.cos(lat2) * half_dlon * half_dlon
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+
+def geom_distance(geom1, geom2, metric=EUCLIDEAN):
+    """ Distance between two geometries
+
+    Arguments:
+        geom1 {Shapely geometry} -- a single Shapely geometry
+        geom2 {Shapely geometry} -- a single Shapely geometry
+
+    Keyword Arguments:
+        metric {str} -- 'euclidean' for planar distance in the units of the
+            coordinates, or 'haversine' for metres between EPSG:4326
+            geometries (default: {'euclidean'})
+
+    Returns:
+        float -- distance between the geometries
+    """
+    if metric == EUCLIDEAN:
+        return geom1.distance(geom2)
+    check_metric(metric)
+    if geom1.is_empty or geom2.is_empty:
+        return 0.0
+    if isinstance(geom1, Point) and isinstance(geom2, Point):
+        (x1, y1), (x2, y2) = geom1.coords[0][:2], geom2.coords[0][:2]
+        return _haversine(x1, y1, x2, y2)
+    if isinstance(geom2, Point) and isinstance(geom1, LineString):
+        geom1, geom2 = geom2, geom1
+    if isinstance(geom1, Point) and isinstance(geom2, LineString):
+        return float(_nearest_on_line(geom1, geom2)[0])
+    origin = geom1.coords[0][:2] if isinstance(geom1, Point) else \
+        geom1.representative_point().coords[0][:2]
+    return float(haversine_distances(*_nearest_lonlats(geom1, geom2, origin)))
+
+
+def nearest_point(point, geom, metric=EUCLIDEAN):
+    """ The point on geom nearest to a point
+
+    Arguments:
+        point {Point} -- point to search from
+        geom {Shapely geometry} -- geometry to find the nearest point on
+
+    Keyword Arguments:
+        metric {str} -- 'euclidean' or 'haversine', see `geom_distance`
+            (default: {'euclidean'})
+
+    Returns:
+        Point -- nearest point on geom
+    """
+    if metric == EUCLIDEAN:
+        return nearest_points(point, geom)[1]
+    check_metric(metric)
+    if isinstance(geom, LineString) and not geom.is_empty:
+        return Point(_nearest_on_line(point, geom)[1])
+    return Point(_nearest_lonlats(point, geom, point.coords[0][:2])[1])
+
+
+def _nearest_on_line(point, line):
+    """ Haversine distance from a point to a line and the nearest point on
+    it. A plain Python version of `_project_haversine` for a single line,
+    which avoids NumPy's overhead on small inputs. """
+    px, py = point.coords[0][:2]
+    scale = math.cos(math.radians(py))
+    coords = line.coords
+    best = (math.inf, None)
+    start = coords[0]
+    for end in coords[1:]:
+        ax = _wrap_scalar(start[0] - px) * scale
+        ay = start[1] - py
+        delta_lon = _wrap_scalar(end[0] - start[0])
+        dx = delta_lon * scale
+        dy = end[1] - start[1]
+        length2 = dx * dx + dy * dy
+        r = 0.0 if length2 == 0 else \
+            min(max(-(ax * dx + ay * dy) / length2, 0.0), 1.0)
+        nearest = (_wrap_scalar(start[0] + r * delta_lon), start[1] + r * dy)
+        distance = _haversine(px, py, nearest[0], nearest[1])
+        if distance < best[0]:
+            best = (distance, nearest)
+        start = end
+    return best
+
+
+def _haversine(lon1, lat1, lon2, lat2):
+    lat1 = math.radians(lat1)
+    lat2 = math.radians(lat2)
+    half_dlat = math.sin((lat2 - lat1) / 2)
+    half_dlon = math.sin((math.radians(lon2) - math.radians(lon1)) / 2)
+    a = half_dlat * half_dlat + \
+        math.cos(lat1) * math.cos(lat2) * half_dlon * half_dlon
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(a, 1)))
+
+
+def _wrap_scalar(longitude):
+    if abs(longitude) > 180:
+        return (longitude + 180) % 360 - 180
+    return longitude
+
+
+def _nearest_lonlats(geom1, geom2, origin):
+    """ Nearest pair of points on two geometries, found in a local
+    equirectangular projection around origin """
+    lon0, lat0 = origin
+    scale = math.cos(math.radians(lat0))
+
+    def forward(x, y, z=None):
+        return ((np.asarray(x) - lon0 + 180) % 360 - 180) * scale, \
+            np.asarray(y) - lat0
+
+    def inverse(x, y, z=None):
+        return np.asarray(x) / scale + lon0, np.asarray(y) + lat0
+
+    pair = nearest_points(transform(forward, geom1), transform(forward, geom2))
+    return [transform(inverse, p).coords[0] for p in pair]
+
+
+def search_bounds(bounds, distance, metric=EUCLIDEAN):
+    """ Bounds which contain everything within a distance of bounds. For
+    the haversine metric, bounds are in degrees and distance is in metres,
+    and a search crossing the antimeridian covers every longitude, see
+    `search_boxes` for a tighter search.
+
+    Arguments:
+        bounds {tuple} -- (minx, miny, maxx, maxy) to expand
+        distance {int|float} -- distance to expand by
+
+    Keyword Arguments:
+        metric {str} -- 'euclidean' or 'haversine', see `geom_distance`
+            (default: {'euclidean'})
+
+    Returns:
+        tuple -- expanded (minx, miny, maxx, maxy)
+    """
+    boxes = search_boxes(bounds, distance, metric)
+    return (min(box[0] for box in boxes), boxes[0][1],
+            max(box[2] for box in boxes), boxes[0][3])
+
+
+def search_boxes(bounds, distance, metric=EUCLIDEAN):
+    """ Boxes which together contain everything within a distance of
+    bounds. For the haversine metric, bounds are in degrees and distance is
+    in metres, and a search crossing the antimeridian is split into a box
+    either side of it.
+
+    Arguments:
+        bounds {tuple} -- (minx, miny, maxx, maxy) to expand
+        distance {int|float} -- distance to expand by
+
+    Keyword Arguments:
+        metric {str} -- 'euclidean' or 'haversine', see `geom_distance`
+            (default: {'euclidean'})
+
+    Returns:
+        list -- one or two (minx, miny, maxx, maxy) boxes
+    """
+    if metric == EUCLIDEAN:
+        return [expand_bounds(bounds, distance)]
+    check_metric(metric)
+    minx, miny, maxx, maxy = bounds
+    angle = distance / EARTH_RADIUS
+    if not angle < math.pi:
+        return [(-180.0, -90.0, 180.0, 90.0)]
+    dlat = math.degrees(angle)
+    miny = max(miny - dlat, -90.0)
+    maxy = min(maxy + dlat, 90.0)
+    max_lat = math.radians(max(abs(miny), abs(maxy)))
+    if math.sin(angle) >= math.cos(max_lat):
+        # the search reaches a pole, so covers every longitude
+        dlon = 360.0
+    else:
+        dlon = math.degrees(math.asin(math.sin(angle) / math.cos(max_lat)))
+    minx, miny, maxx, maxy = expand_bounds(
+        (minx - dlon, miny, maxx + dlon, maxy), 0)
+    miny, maxy = max(miny, -90.0), min(maxy, 90.0)
+    if maxx - minx >= 360.0:
+        return [(-180.0, miny, 180.0, maxy)]
+    if minx < -180.0:
+        return [(-180.0, miny, maxx, maxy), (minx + 360.0, miny, 180.0, maxy)]
+    if maxx > 180.0:
+        return [(minx, miny, 180.0, maxy), (-180.0, miny, maxx - 360.0, maxy)]
+    return [(minx, miny, maxx, maxy)]
+
+
+def search_index(index, bounds, distance, metric=EUCLIDEAN):
+    """ Find the entries of a spatial index whose bounds could be within a
+    distance of bounds, searching each of the `search_boxes` so that
+    haversine searches wrap around the antimeridian
+
+    Arguments:
+        index {SpatialIndex} -- index to search
+        bounds {tuple} -- (minx, miny, maxx, maxy) to search around
+        distance {int|float} -- distance to search within
+
+    Keyword Arguments:
+        metric {str} -- 'euclidean' or 'haversine', see `geom_distance`
+            (default: {'euclidean'})
+
+    Returns:
+        list -- ids of the entries found, in the order the index returns
+            them for each box in turn
+    """
+    boxes = search_boxes(bounds, distance, metric)
+    if len(boxes) == 1:
+        return index.intersection(boxes[0])
+    found = index.intersection(boxes[0])
+    seen = set(found)
+    return found + [i for i in index.intersection(boxes[1]) if i not in seen]
+
+
+def line_segments(coords, offsets):
+    """ Get the segments of a set of packed lines
+
+    Arguments:
+        coords {numpy.ndarray} -- (N, 2) array of coordinates
+        offsets {numpy.ndarray} -- line start offsets into coords
+
+    Returns:
+        tuple -- (starts, ends, segment_offsets) where starts and ends are
+            (S, 2) arrays of segment endpoints and the segments of line `i`
+            are segment_offsets[i]:segment_offsets[i + 1]
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    counts = np.maximum(np.diff(offsets) - 1, 0)
+    segment_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    segment_offsets[1:] = np.cumsum(counts)
+    start_ids = np.nonzero(segment_mask(offsets))[0]
+    return coords[start_ids], coords[start_ids + 1], segment_offsets
+
+
+def point_distances(points1, points2, metric=EUCLIDEAN):
+    """ Distance from every point in one set to every point in another
+
+    Arguments:
+        points1 {numpy.ndarray} -- (M, 2) array of point coordinates
+        points2 {numpy.ndarray} -- (N, 2) array of point coordinates
+
+    Keyword Arguments:
+        metric {str} -- 'euclidean' or 'haversine', see `geom_distance`
+            (default: {'euclidean'})
+
+    Returns:
+        numpy.ndarray -- (M, N) array of distances
+    """
+    points1 = np.asarray(points1, dtype=float).reshape(-1, 2)
+    points2 = np.asarray(points2, dtype=float).reshape(-1, 2)
+    if metric == EUCLIDEAN:
+        dx = points1[:, 0, None] - points2[None, :, 0]
+        dy = points1[:, 1, None] - points2[None, :, 1]
+        return np.sqrt(dx * dx + dy * dy)
+    check_metric(metric)
+    return haversine_distances(points1[:, None], points2[None])
+
+
+def point_segment_distances(points, starts, ends, pairwise=False):
+    """ Distance from every point to every segment
+
+    Arguments:
+        points {numpy.ndarray} -- (M, 2) array of point coordinates
+        starts {numpy.ndarray} -- (S, 2) array of segment start coordinates
+        ends {numpy.ndarray} -- (S, 2) array of segment end coordinates
+
+    Keyword Arguments:
+        pairwise {bool} -- only measure point i to segment i, where M == S
+            (default: {False})
+
+    Returns:
+        numpy.ndarray -- (M, S) array of distances, or (M,) if pairwise
+    """
+    distances, _ = _project(points, starts, ends, pairwise=pairwise)
+    return distances
+
+
+def point_line_distances(points, coords, offsets,
+                         chunk_pairs=DEFAULT_CHUNK_PAIRS, metric=EUCLIDEAN):
+    """ Distance from every point to every line, where lines are packed as
+    in `arrays.lines_to_coords`. Lines without any segments are infinitely
+    far away.
+
+    Arguments:
+        points {numpy.ndarray} -- (M, 2) array of point coordinates
+        coords {numpy.ndarray} -- (N, 2) array of line coordinates
+        offsets {numpy.ndarray} -- line start offsets into coords
+
+    Keyword Arguments:
+        chunk_pairs {int} -- number of point-segment pairs to work on at
+            once (default: {DEFAULT_CHUNK_PAIRS})
+        metric {str} -- 'euclidean' or 'haversine', see `geom_distance`
+            (default: {'euclidean'})
+
+    Returns:
+        numpy.ndarray -- (M, n) array of distances
+    """
+    check_metric(metric)
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    starts, ends, segment_offsets = line_segments(coords, offsets)
+    n_lines = len(segment_offsets) - 1
+    distances = np.full((len(points), n_lines), np.inf)
+    has_segments = np.diff(segment_offsets) > 0
+    if len(starts) == 0:
+        return distances
+
+    first_segments = segment_offsets[:-1][has_segments]
+    for chunk in _chunks(len(points), len(starts), chunk_pairs):
+        segment_distances, _ = _project(points[chunk], starts, ends, metric)
+        distances[chunk, has_segments] = np.minimum.reduceat(
+            segment_distances, first_segments, axis=1)
+    return distances
+
+
+def nearest_on_lines(points, coords, offsets,
+                     chunk_pairs=DEFAULT_CHUNK_PAIRS, metric=EUCLIDEAN):
+    """ For each point find the closest line, the distance to it and the
+    nearest point on it. Where lines are equally close, the earliest is
+    used, as in `common.closest`.
+
+    Arguments:
+        points {numpy.ndarray} -- (M, 2) array of point coordinates
+        coords {numpy.ndarray} -- (N, 2) array of line coordinates
+        offsets {numpy.ndarray} -- line start offsets into coords
+
+    Keyword Arguments:
+        chunk_pairs {int} -- number of point-segment pairs to work on at
+            once (default: {DEFAULT_CHUNK_PAIRS})
+        metric {str} -- 'euclidean' or 'haversine', see `geom_distance`
+            (default: {'euclidean'})
+
+    Returns:
+        tuple -- (distances, nearest, line_ids), an (M,) array of
+            distances, an (M, 2) array of the nearest points on the lines
+            and an (M,) array of the closest lines' positions. Where there
+            are no lines these are inf, nan and -1.
+    """
+    check_metric(metric)
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    starts, ends, segment_offsets = line_segments(coords, offsets)
+    distances = np.full(len(points), np.inf)
+    nearest = np.full((len(points), 2), np.nan)
+    line_ids = np.full(len(points), -1, dtype=np.int64)
+    if len(starts) == 0:
+        return distances, nearest, line_ids
+
+    owners = vertex_owners(segment_offsets)
+    for chunk in _chunks(len(points), len(starts), chunk_pairs):
+        segment_distances, fractions = _project(
+            points[chunk], starts, ends, metric)
+        # segments are in line order, so argmin picks the earliest line
+        best = np.argmin(segment_distances, axis=1)
+        rows = np.arange(len(best))
+        fraction = fractions[rows, best, None]
+        distances[chunk] = segment_distances[rows, best]
+        nearest[chunk] = _along(starts[best], ends[best], fraction, metric)
+        line_ids[chunk] = owners[best]
+    return distances, nearest, line_ids
+
+
+def segment_index(starts, ends):
+    """ Build a spatial index over the bounds of segments
+
+    Arguments:
+        starts {numpy.ndarray} -- (S, 2) array of segment start coordinates
+        ends {numpy.ndarray} -- (S, 2) array of segment end coordinates
+
+    Returns:
+        SpatialIndex -- index whose ids are segment positions
+    """
+    return SpatialIndex(np.hstack(
+        [np.minimum(starts, ends), np.maximum(starts, ends)]))
+
+
+def nearest_segments(points, starts, ends, index=None,
+                     batch_size=DEFAULT_BATCH_POINTS, metric=EUCLIDEAN):
+    """ For each point find the closest segment, the distance to it and
+    the nearest point on it, searching a spatial index over the segments
+    so that each point is only measured against segments near it. Where
+    segments are equally close, the earliest is used, as in
+    `nearest_on_lines`.
+
+    Each point first takes the segment with the nearest bounds, whose
+    distance bounds a second search for every segment that could be
+    closer. Points are worked on in batches, with the distances for a
+    batch computed together.
+
+    Arguments:
+        points {numpy.ndarray} -- (M, 2) array of point coordinates
+        starts {numpy.ndarray} -- (S, 2) array of segment start coordinates
+        ends {numpy.ndarray} -- (S, 2) array of segment end coordinates
+
+    Keyword Arguments:
+        index {SpatialIndex} -- index from `segment_index`, built if not
+            given (default: {None})
+        batch_size {int} -- number of points searched at once
+            (default: {DEFAULT_BATCH_POINTS})
+        metric {str} -- 'euclidean' or 'haversine', see `geom_distance`
+            (default: {'euclidean'})
+
+    Returns:
+        tuple -- (distances, nearest, segment_ids, fractions), an (M,)
+            array of distances, an (M, 2) array of the nearest points, an
+            (M,) array of the closest segments' positions and an (M,)
+            array of how far along them the nearest points are, as a
+            fraction of their length. Where there are no segments these
+            are inf, nan, -1 and nan.
+    """
+    check_metric(metric)
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    distances = np.full(len(points), np.inf)
+    nearest = np.full((len(points), 2), np.nan)
+    segment_ids = np.full(len(points), -1, dtype=np.int64)
+    fractions = np.full(len(points), np.nan)
+    if len(starts) == 0:
+        return distances, nearest, segment_ids, fractions
+    if index is None:
+        index = segment_index(starts, ends)
+
+    for start in range(0, len(points), batch_size):
+        batch = points[start:start + batch_size]
+        xy = batch.tolist()
+
+        # the segment with the nearest bounds is no closer than the nearest
+        # segment, so bounds the search
+        rows, ids = _pairs([index.nearest((x, y, x, y)) for x, y in xy])
+        bound_distances, _ = _project(
+            batch[rows], starts[ids], ends[ids], metric, pairwise=True)
+        bounds = np.full(len(batch), np.inf)
+        np.minimum.at(bounds, rows, bound_distances)
+
+        rows, ids = _pairs([
+            search_index(index, (x, y, x, y), bound, metric)
+            for (x, y), bound in zip(xy, bounds.tolist())])
+        pair_distances, pair_fractions = _project(
+            batch[rows], starts[ids], ends[ids], metric, pairwise=True)
+        order = np.lexsort((ids, pair_distances, rows))
+        first = order[np.r_[True, rows[order][1:] != rows[order][:-1]]]
+
+        batch_rows = slice(start, start + len(batch))
+        distances[batch_rows] = pair_distances[first]
+        segment_ids[batch_rows] = ids[first]
+        fractions[batch_rows] = pair_fractions[first]
+        nearest[batch_rows] = _along(
+            starts[ids[first]], ends[ids[first]],
+            pair_fractions[first, None], metric)
+
+    return distances, nearest, segment_ids, fractions
+
+
+def _pairs(candidates):
+    """ Flatten a list of candidate lists into (row, candidate) arrays """
+    rows = np.repeat(
+        np.arange(len(candidates)), [len(c) for c in candidates])
+    ids = np.fromiter(
+        (i for c in candidates for i in c), dtype=np.int64, count=len(rows))
+    return rows, ids
+
+
+def _project(points, starts, ends, metric=EUCLIDEAN, pairwise=False):
+    """ Distances from points to segments and the position of the nearest
+    point along each segment, as a fraction of its length. Every point is
+    measured to every segment, or with `pairwise` point i to segment i. """
+    if not pairwise:
+        points = points[:, None]
+        starts = starts[None]
+        ends = ends[None]
+    if metric == HAVERSINE:
+        return _project_haversine(points, starts, ends)
+    px = points[..., 0]
+    py = points[..., 1]
+    ax = starts[..., 0]
+    ay = starts[..., 1]
+    bx = ends[..., 0]
+    by = ends[..., 1]
+
+    dx = bx - ax
+    dy = by - ay
+    length2 = dx * dx + dy * dy
+    degenerate = length2 == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = ((px - ax) * dx + (py - ay) * dy) / length2
+        s = ((ay - py) * dx - (ax - px) * dy) / length2
+    r = np.where(degenerate, 0.0, r)
+
+    to_start = _hypot(px - ax, py - ay)
+    to_end = _hypot(px - bx, py - by)
+    perpendicular = np.abs(s) * np.sqrt(length2)
+    distances = np.where(
+        r <= 0, to_start, np.where(r >= 1, to_end, perpendicular))
+    return distances, np.clip(r, 0, 1)
+
+
+def _project_haversine(points, starts, ends):
+    """ As `_project`, but finding the nearest point in a local
+    equirectangular projection centred on each point, and measuring the
+    great circle distance to it """
+    scale = np.cos(np.radians(points[..., 1]))
+    ax = _wrap(starts[..., 0] - points[..., 0]) * scale
+    ay = starts[..., 1] - points[..., 1]
+    dx = _wrap(ends[..., 0] - starts[..., 0]) * scale
+    dy = ends[..., 1] - starts[..., 1]
+    length2 = dx * dx + dy * dy
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = -(ax * dx + ay * dy) / length2
+    r = np.clip(np.where(length2 == 0, 0.0, r), 0, 1)
+    nearest = _along(starts, ends, r[..., None], HAVERSINE)
+    return haversine_distances(points, nearest), r
+
+
+def _along(starts, ends, fraction, metric):
+    """ Points a fraction of the way along segments """
+    delta = ends - starts
+    if metric == HAVERSINE:
+        delta = np.stack([_wrap(delta[..., 0]), delta[..., 1]], axis=-1)
+        along = starts + fraction * delta
+        return np.stack([_wrap(along[..., 0]), along[..., 1]], axis=-1)
+    return starts + fraction * delta
+
+
+def _wrap(longitudes):
+    """ Wrap longitudes, or differences between them, into [-180, 180],
+    leaving those already in range untouched """
+    return np.where(
+        np.abs(longitudes) > 180, (longitudes + 180) % 360 - 180, longitudes)
+
+
+def _hypot(dx, dy):
+    return np.sqrt(dx * dx + dy * dy)
+
+
+def _chunks(n_points, n_segments, chunk_pairs):
+    """ Slices of points to work on so that each chunk holds about
+    `chunk_pairs` point-segment pairs """
+    size = max(1, chunk_pairs // max(n_segments, 1))
+    for start in range(0, n_points, size):
+        yield slice(start, min(start + size, n_points))
+
+
+def distance_matrix(sources, sinks, max_distance=None, metric=EUCLIDEAN,
+                    ram_budget=DEFAULT_RAM_BUDGET, spill_dir=None,
+                    chunk_pairs=DEFAULT_CHUNK_PAIRS):
+    """ Distance from every source to every sink, e.g. as the costs for
+    matching supply to demand. The matrix is worked out in blocks of rows
+    with NumPy when sources and sinks are points, or points and
+    LineStrings, and pair by pair with Shapely otherwise.
+
+    Without a max_distance a dense matrix is returned. With one, only
+    distances within or equal to it are kept, in a CSRMatrix. Empty
+    geometries are treated as infinitely far from everything. If the
+    result would take more than `ram_budget` bytes, it is written to files
+    in spill_dir as it is built and returned as memory-mapped arrays.
+
+    Arguments:
+        sources {list|numpy.ndarray} -- Shapely geometries, or an (M, 2)
+            array of point coordinates, for the rows
+        sinks {list|numpy.ndarray} -- Shapely geometries, or an (N, 2)
+            array of point coordinates, for the columns
+
+    Keyword Arguments:
+        max_distance {int|float} -- largest distance to keep, making the
+            result sparse (default: {None})
+        metric {str} -- 'euclidean' or 'haversine', see `geom_distance`
+            (default: {'euclidean'})
+        ram_budget {int} -- largest result in bytes to keep in memory
+            (default: {DEFAULT_RAM_BUDGET})
+        spill_dir {str} -- directory for memory-mapped results, a new
+            temporary directory if not given (default: {None})
+        chunk_pairs {int} -- number of distances to work on at once
+            (default: {DEFAULT_CHUNK_PAIRS})
+
+    Returns:
+        numpy.ndarray|CSRMatrix -- (M, N) dense distances, or a CSRMatrix
+            of distances within max_distance
+    """
+    check_metric(metric)
+    blocks = _distance_blocks(
+        sources, sinks, max_distance, metric, chunk_pairs)
+    shape = (_count(sources), _count(sinks))
+    if max_distance is None:
+        return _dense_matrix(blocks, shape, ram_budget, spill_dir)
+    return _sparse_matrix(blocks, shape, max_distance, ram_budget, spill_dir)
+
+
+def _count(geoms):
+    if isinstance(geoms, np.ndarray):
+        return len(geoms.reshape(-1, 2))
+    return len(geoms)
+
+
+def _lines(geoms):
+    """ geoms if they are all non-empty LineStrings, otherwise None """
+    if isinstance(geoms, np.ndarray) or not all(
+            isinstance(g, LineString) and not g.is_empty for g in geoms):
+        return None
+    return geoms
+
+
+def _distance_blocks(sources, sinks, max_distance, metric, chunk_pairs):
+    """ Yield (start, block) pairs, where block holds the distances from
+    sources[start:start + len(block)] to every sink """
+    n_sources = _count(sources)
+    n_sinks = _count(sinks)
+    source_xy = point_coords(sources)
+    sink_xy = point_coords(sinks)
+    source_lines = None if source_xy is not None else _lines(sources)
+    sink_lines = None if sink_xy is not None else _lines(sinks)
+
+    if source_xy is not None and sink_xy is not None:
+        size = max(1, chunk_pairs // max(n_sinks, 1))
+        for start in range(0, n_sources, size):
+            yield start, point_distances(
+                source_xy[start:start + size], sink_xy, metric)
+
+    elif source_xy is not None and sink_lines is not None:
+        coords, offsets = lines_to_coords(sink_lines)
+        size = max(1, chunk_pairs // max(len(coords), n_sinks, 1))
+        for start in range(0, n_sources, size):
+            yield start, point_line_distances(
+                source_xy[start:start + size], coords, offsets,
+                chunk_pairs, metric)
+
+    elif source_lines is not None and sink_xy is not None:
+        # distances are symmetric, so work out sinks to a block of lines
+        size = max(1, chunk_pairs // max(n_sinks, 1))
+        for start in range(0, n_sources, size):
+            coords, offsets = lines_to_coords(source_lines[start:start + size])
+            yield start, point_line_distances(
+                sink_xy, coords, offsets, chunk_pairs, metric).T
+
+    else:
+        sources = as_geoms(sources)
+        sinks = as_geoms(sinks)
+        non_empty = [i for i, g in enumerate(sinks) if not g.is_empty]
+        if max_distance is not None:
+            # empty sinks aren't indexed
+            index = SpatialIndex.from_geoms(sinks)
+        size = max(1, chunk_pairs // max(n_sinks, 1))
+        for start in range(0, n_sources, size):
+            rows = sources[start:start + size]
+            block = np.full((len(rows), n_sinks), np.inf)
+            for row, geom in enumerate(rows):
+                if geom.is_empty:
+                    columns = []
+                elif max_distance is None:
+                    columns = non_empty
+                else:
+                    columns = search_index(
+                        index, geom.bounds, max_distance, metric)
+                for column in columns:
+                    block[row, column] = geom_distance(
+                        geom, sinks[column], metric)
+            yield start, block
+
+
+def _dense_matrix(blocks, shape, ram_budget, spill_dir):
+    if shape[0] * shape[1] * 8 > ram_budget:
+        matrix = np.lib.format.open_memmap(
+            _spill_paths(spill_dir)('distances.npy'), mode='w+', dtype=float,
+            shape=shape)
+    else:
+        matrix = np.empty(shape)
+    for start, block in blocks:
+        matrix[start:start + len(block)] = block
+    if isinstance(matrix, np.memmap):
+        matrix.flush()
+    return matrix
+
+
+def _sparse_matrix(blocks, shape, max_distance, ram_budget, spill_dir):
+    spill_path = _spill_paths(spill_dir)
+    data = _ArrayWriter(
+        float, ram_budget // 2, lambda: spill_path('data.bin'))
+    indices = _ArrayWriter(
+        np.int64, ram_budget // 2, lambda: spill_path('indices.bin'))
+    indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+    for start, block in blocks:
+        rows, columns = np.nonzero(block <= max_distance)
+        data.append(block[rows, columns])
+        indices.append(columns)
+        indptr[start + 1:start + len(block) + 1] = np.bincount(
+            rows, minlength=len(block))
+    np.cumsum(indptr, out=indptr)
+    return CSRMatrix(data.finish(), indices.finish(), indptr, shape)
+
+
+def _spill_paths(spill_dir):
+    """ Get a function naming files in spill_dir, which creates a
+    temporary directory on first use if spill_dir isn't given """
+    directory = [spill_dir]
+
+    def spill_path(name):
+        if directory[0] is None:
+            directory[0] = tempfile.mkdtemp(prefix='distance_matrix_')
+        return os.path.join(directory[0], name)
+
+    return spill_path
+
+
+class _ArrayWriter:
+    """ Builds a 1D array from appended pieces, moving to a memory-mapped
+    file once the pieces outgrow their budget """
+
+    def __init__(self, dtype, budget, path):
+        """
+        Arguments:
+            dtype {numpy.dtype} -- type of the array
+            budget {int} -- bytes to hold in memory before spilling
+            path {function} -- called with no arguments for the file path
+                to spill to
+        """
+        self.dtype = np.dtype(dtype)
+        self.budget = budget
+        self.spill_path = path
+        self.path = None
+        self.pieces = []
+        self.size = 0
+        self.file = None
+
+    def append(self, values):
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        self.size += len(values)
+        if self.file is None and self.size * self.dtype.itemsize > self.budget:
+            self.path = self.spill_path()
+            self.file = open(self.path, 'wb')
+            for piece in self.pieces:
+                self.file.write(piece.tobytes())
+            self.pieces = []
+        if self.file is None:
+            self.pieces.append(values)
+        else:
+            self.file.write(values.tobytes())
+
+    def finish(self):
+        if self.file is None:
+            if len(self.pieces) == 0:
+                return np.empty(0, dtype=self.dtype)
+            return np.concatenate(self.pieces)
+        self.file.close()
+        return np.memmap(
+            self.path, dtype=self.dtype, mode='r', shape=(self.size,))
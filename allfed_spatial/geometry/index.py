@@ -0,0 +1,189 @@
+import numpy as np
+import rtree
+
+EMPTY_BOUNDS = (np.nan, np.nan, np.nan, np.nan)
+
+
+def geom_bounds(geom):
+    """ Bounds of a geometry, with NaN bounds for empty geometries
+
+    Arguments:
+        geom {Shapely geometry} -- geometry to get the bounds of
+
+    Returns:
+        tuple -- (minx, miny, maxx, maxy)
+    """
+    return _valid_bounds(geom.bounds)
+
+
+def expand_bounds(bounds, distance):
+    """ Grow bounds by a distance in every direction. The result is padded
+    very slightly so that geometries exactly `distance` away are never lost
+    to rounding.
+
+    Arguments:
+        bounds {tuple} -- (minx, miny, maxx, maxy) to expand
+        distance {int|float} -- distance to expand by
+
+    Returns:
+        tuple -- expanded (minx, miny, maxx, maxy)
+    """
+    minx, miny, maxx, maxy = bounds
+    pad = distance + 1e-9 * (
+        abs(distance) + max(abs(minx), abs(miny), abs(maxx), abs(maxy)))
+    return (minx - pad, miny - pad, maxx + pad, maxy + pad)
+
+
+def _valid_bounds(bounds):
+    # Shapely gives empty geometries empty bounds
+    if len(bounds) == 0:
+        return EMPTY_BOUNDS
+    return bounds
+
+
+class SpatialIndex:
+    """ An rtree spatial index over the bounding boxes of a list of
+    geometries, where each entry's id is the position of its geometry in
+    the list. By default the index is bulk loaded with rtree's stream
+    interface. The bounds are also kept as an (N, 4) array so that the index
+    can be saved to disk and rebuilt quickly. Empty geometries are never
+    returned by queries.
+    """
+
+    def __init__(self, bounds, bulk_load=True):
+        """
+        Arguments:
+            bounds {numpy.ndarray|list} -- (N, 4) array of (minx, miny, maxx,
+                maxy), with NaN rows for empty geometries
+
+        Keyword Arguments:
+            bulk_load {bool} -- bulk load the tree rather than inserting
+                entries one at a time. Both give the same query results, but
+                not always in the same order (default: {True})
+        """
+        self._bounds = np.array(bounds, dtype=float).reshape(-1, 4)
+        self._size = len(self._bounds)
+        valid = np.flatnonzero(~np.isnan(self._bounds).any(axis=1))
+        entries = (
+            (int(i), tuple(self._bounds[i].tolist()), None) for i in valid)
+        if len(valid) == 0:
+            self._index = rtree.index.Index()
+        elif bulk_load:
+            self._index = rtree.index.Index(entries)
+        else:
+            self._index = rtree.index.Index()
+            for entry_id, bounds, _ in entries:
+                self._index.insert(entry_id, bounds)
+
+    @classmethod
+    def from_geoms(cls, geoms, bulk_load=True):
+        """ Build an index over a list of Shapely geometries """
+        return cls([geom_bounds(g) for g in geoms], bulk_load)
+
+    @classmethod
+    def from_features(cls, features, bulk_load=True):
+        """ Build an index over a list of Features, using their cached
+        bounds """
+        return cls([_valid_bounds(f.bounds) for f in features], bulk_load)
+
+    @property
+    def bounds(self):
+        """ numpy.ndarray -- (N, 4) array of the bounds of every entry """
+        return self._bounds[:self._size]
+
+    def __len__(self):
+        return self._size
+
+    def copy(self):
+        """ Make an independent copy of the index, which can be updated
+        without changing this one
+
+        Returns:
+            SpatialIndex -- the copied index
+        """
+        return SpatialIndex(self.bounds)
+
+    def intersection(self, bounds):
+        """ Find the ids of entries whose bounds intersect `bounds`, in the
+        order rtree returns them
+
+        Arguments:
+            bounds {tuple} -- (minx, miny, maxx, maxy) to search
+
+        Returns:
+            list -- ids of intersecting entries
+        """
+        return [int(i) for i in self._index.intersection(bounds)]
+
+    def nearest(self, bounds, num_results=1):
+        """ Find the ids of the entries whose bounds are nearest `bounds`.
+        More than `num_results` ids are returned when there are ties.
+
+        Arguments:
+            bounds {tuple} -- (minx, miny, maxx, maxy) to search from
+
+        Keyword Arguments:
+            num_results {int} -- number of nearest entries (default: {1})
+
+        Returns:
+            list -- ids of the nearest entries
+        """
+        return [int(i) for i in self._index.nearest(bounds, num_results)]
+
+    def insert(self, bounds):
+        """ Add a new entry to the end of the index
+
+        Arguments:
+            bounds {tuple} -- (minx, miny, maxx, maxy) of the new entry
+
+        Returns:
+            int -- id of the new entry
+        """
+        entry_id = self._size
+        if entry_id == len(self._bounds):
+            # grow geometrically so that repeated inserts stay cheap
+            grown = np.empty((max(2 * entry_id, 16), 4))
+            grown[:entry_id] = self._bounds
+            self._bounds = grown
+        bounds = _valid_bounds(bounds)
+        self._bounds[entry_id] = bounds
+        self._size += 1
+        if not np.isnan(self._bounds[entry_id]).any():
+            self._index.insert(entry_id, tuple(bounds))
+        return entry_id
+
+    def update(self, entry_id, bounds):
+        """ Replace the bounds of an existing entry, e.g. after its geometry
+        has changed
+
+        Arguments:
+            entry_id {int} -- id of the entry to update
+            bounds {tuple} -- new (minx, miny, maxx, maxy) of the entry
+        """
+        old_bounds = self.bounds[entry_id]
+        if not np.isnan(old_bounds).any():
+            self._index.delete(entry_id, tuple(old_bounds.tolist()))
+        bounds = _valid_bounds(bounds)
+        self.bounds[entry_id] = bounds
+        if not np.isnan(self.bounds[entry_id]).any():
+            self._index.insert(entry_id, tuple(bounds))
+
+    def save(self, path):
+        """ Save the index to disk, see `SpatialIndex.load`
+
+        Arguments:
+            path {str} -- path of the .npy file to write
+        """
+        np.save(path, self.bounds)
+
+    @classmethod
+    def load(cls, path):
+        """ Load an index previously written with `SpatialIndex.save`
+
+        Arguments:
+            path {str} -- path of the .npy file to read
+
+        Returns:
+            SpatialIndex -- the loaded index
+        """
+        return cls(np.load(path))
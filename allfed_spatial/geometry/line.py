@@ -1,10 +1,24 @@
-from shapely.ops import split
-from shapely.geometry import Point, MultiPolygon, LineString
-import rtree
+from shapely.geometry import Point, LineString, MultiLineString
 import math
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import numpy as np
 
 from allfed_spatial.features.feature import Feature
-from allfed_spatial.geometry.common import closest
+from allfed_spatial.geometry.arrays import (
+    lines_to_coords, coords_to_lines, point_coords, vertex_owners,
+    cumulative_lengths, segment_lengths, segment_mask)
+from allfed_spatial.geometry.common import closest_indices
+from allfed_spatial.geometry.distance import (
+    line_segments, nearest_segments, point_segment_distances,
+    DEFAULT_BATCH_POINTS, EUCLIDEAN)
+
+DEFAULT_SPLIT_CHUNK_SIZE = 4096
+
+DOUGLAS_PEUCKER = 'douglas-peucker'
+VISVALINGAM = 'visvalingam'
+SIMPLIFY_METHODS = (DOUGLAS_PEUCKER, VISVALINGAM)
 
 
 def frechet_distance(points1, points2):
@@ -18,73 +32,215 @@ def frechet_distance(points1, points2):
     Currently this is a greedy implementation of moving along each line at the
     same proportional speed. So compare the point at 20% along line 1 with the
     point at 20% along line 2. Here we're just checking each point on both lines
-    with the implicit point on the other line.
+    with the implicit point on the other line. For an exact measure see
+    `discrete_frechet_distance`.
+
+    The walk is worked out all at once from the cumulative lengths along
+    each line: each vertex's proportional position is looked up on the
+    other line with a binary search, and the implicit points are
+    interpolated together.
 
     Arguments:
-        points1 {list} -- a list of points
-        points2 {list} -- a list of points
+        points1 {list|numpy.ndarray} -- a list of Points or coordinates, or
+            an (N, 2) array of coordinates
+        points2 {list|numpy.ndarray} -- a list of Points or coordinates, or
+            an (N, 2) array of coordinates
 
     Returns:
         number - the distance between the lines
     """
+    coords1 = _walk_coords(points1)
+    coords2 = _walk_coords(points2)
+    cumulative1 = _cumulative_length(coords1)
+    cumulative2 = _cumulative_length(coords2)
+    length1 = cumulative1[-1]
+    length2 = cumulative2[-1]
+    if length1 == 0:
+        return float(_point_distances(coords1[0], coords2).max())
+    if length2 == 0:
+        return float(_point_distances(coords2[0], coords1).max())
+
+    max_dist = max(
+        _point_distances(coords1[0], coords2[:1])[0],
+        _point_distances(coords1[-1], coords2[-1:])[0])
+
+    # proportion of the way along each line at every vertex after the first
+    proportion1 = cumulative1[1:] / length1
+    proportion2 = cumulative2[1:] / length2
+
+    # Vertices are visited in order of proportion, line 2 first on ties, and
+    # the walk stops when either line's vertices run out. When a vertex of
+    # one line is visited, the other line is on the segment ending at its
+    # first unvisited vertex.
+    visited2 = np.searchsorted(proportion2, proportion1, side='right')
+    visited1 = np.searchsorted(proportion1, proportion2, side='left')
+    walked1 = visited2 < len(proportion2)
+    walked2 = visited1 < len(proportion1)
+
+    vertices1 = np.nonzero(walked1)[0] + 1
+    segments2 = visited2[walked1] + 1
+    implicit2 = _interpolate_segments(
+        coords2, cumulative2, segments2,
+        length2 * cumulative1[vertices1] / length1)
+
+    vertices2 = np.nonzero(walked2)[0] + 1
+    segments1 = visited1[walked2] + 1
+    implicit1 = _interpolate_segments(
+        coords1, cumulative1, segments1,
+        length1 * cumulative2[vertices2] / length2)
+
+    distances = np.concatenate([
+        _hypot(coords1[vertices1] - implicit2),
+        _hypot(coords2[vertices2] - implicit1),
+    ])
+    if len(distances) > 0:
+        max_dist = max(max_dist, distances.max())
+    return float(max_dist)
+
+
+def discrete_frechet_distance(points1, points2, threshold=None):
+    """ Exact discrete Fréchet distance between two lines: the shortest
+    leash which lets the person and dog of `frechet_distance` step from
+    vertex to vertex along their lines, neither ever going backwards.
+
+    Worked out by dynamic programming over the anti-diagonals of the
+    vertex pairs, one vectorized step per diagonal, keeping only the last
+    two diagonals in memory. With a threshold, only the vertex pairs which
+    can be reached within it are visited instead, a row at a time, which
+    on lines that do match is a narrow band, so it costs close to linear
+    time. It stops as soon as a row has none, since every walk has to
+    step on every row.
+
+    Arguments:
+        points1 {list|numpy.ndarray} -- a list of Points or coordinates, or
+            an (N, 2) array of coordinates
+        points2 {list|numpy.ndarray} -- a list of Points or coordinates, or
+            an (N, 2) array of coordinates
 
-    line1 = LineString(points1)
-    line2 = LineString(points2)
-    line1Len = line1.length
-    line2Len = line2.length
-    if (line1Len == 0):
-        return max([points1[0].distance(p2) for p2 in points2])
-    if (line2Len == 0):
-        return max([points2[0].distance(p1) for p1 in points1])
-
-    maxDist = max(
-        points1[0].distance(points2[0]),
-        points1[-1].distance(points2[-1]))
-    line1PointIndex = 1
-    line2PointIndex = 1
-    line1PrevSegLength = 0.0
-    line2PrevSegLength = 0.0
-
-    while (line1PointIndex < len(points1) and line2PointIndex < len(points2)):
-        line1Seg = LineString([
-            points1[line1PointIndex - 1],
-            points1[line1PointIndex]
-        ])
-        line2Seg = LineString([
-            points2[line2PointIndex - 1],
-            points2[line2PointIndex]
-        ])
-
-        line1NextSegLength = line1Seg.length + line1PrevSegLength
-        line2NextSegLength = line2Seg.length + line2PrevSegLength
-
-        if ((line1NextSegLength / line1Len) < (line2NextSegLength / line2Len)):
-            line2DistFromLine1 = (line2Len * line1NextSegLength / line1Len)
-            line2DistanceToImplicit = line2DistFromLine1 - line2PrevSegLength
-            line2Implicit = line2Seg.interpolate(
-                max(line2DistanceToImplicit, 0),
-                normalized = False)
-            maxDist = max(
-                maxDist,
-                points1[line1PointIndex].distance(line2Implicit))
-            line1PointIndex += 1
-            line1PrevSegLength = line1NextSegLength
+    Keyword Arguments:
+        threshold {int|float} -- largest distance of interest, beyond
+            which inf is returned (default: {None})
+
+    Returns:
+        number - the distance between the lines, or inf if it is greater
+            than the threshold
+    """
+    coords1 = _vertex_coords(points1)
+    coords2 = _vertex_coords(points2)
+    if len(coords1) > len(coords2):
+        coords1, coords2 = coords2, coords1
+    if threshold is not None:
+        return _discrete_frechet_within(coords1, coords2, threshold)
+    n, m = len(coords1), len(coords2)
+
+    # coupling distances along the last two diagonals, indexed by position
+    # on line 1 and padded with inf at the front for the edges
+    previous = np.full(n + 1, np.inf)
+    current = np.full(n + 1, np.inf)
+    for k in range(n + m - 1):
+        i = np.arange(max(0, k - m + 1), min(k, n - 1) + 1)
+        distances = _hypot(coords1[i] - coords2[k - i])
+        if k == 0:
+            best = distances
         else:
-            line1DistFromLine2 = (line1Len * line2NextSegLength / line2Len)
-            line1DistanceToImplicit = line1DistFromLine2 - line1PrevSegLength
-            line1Implicit = line1Seg.interpolate(
-                max(line1DistanceToImplicit, 0),
-                normalized = False)
-            maxDist = max(
-                maxDist,
-                points2[line2PointIndex].distance(line1Implicit))
-            line2PointIndex += 1
-            line2PrevSegLength = line2NextSegLength
+            # from (i, j - 1), (i - 1, j) and (i - 1, j - 1)
+            best = np.maximum(distances, np.minimum(
+                np.minimum(current[i + 1], current[i]), previous[i]))
+        following = np.full(n + 1, np.inf)
+        following[i + 1] = best
+        previous, current = current, following
+
+    return float(current[n])
+
+
+def _discrete_frechet_within(coords1, coords2, threshold):
+    # coupling distances along each vertex of line 1 in turn, for the run
+    # of vertices on line 2 from `first` which can be reached within the
+    # threshold, in plain Python as the runs are short
+    xs1, ys1 = coords1.T.tolist()
+    xs2, ys2 = coords2.T.tolist()
+    m = len(xs2)
+    inf = float('inf')
+    first, row = 0, []
+    for i, (x, y) in enumerate(zip(xs1, ys1)):
+        last = first + len(row) - 1
+        following = []
+        left = inf if i > 0 else 0.0
+        j = first
+        while j < m:
+            # from (i - 1, j), (i - 1, j - 1) and (i, j - 1)
+            reach = min(
+                row[j - first] if j <= last else inf,
+                row[j - 1 - first] if first < j <= last + 1 else inf,
+                left)
+            if reach == inf and j > last:
+                break
+            if reach < inf:
+                dx, dy = x - xs2[j], y - ys2[j]
+                reach = max(math.sqrt(dx * dx + dy * dy), reach)
+                if reach > threshold:
+                    reach = inf
+            following.append(reach)
+            left = reach
+            j += 1
+
+        kept = [k for k, value in enumerate(following) if value < inf]
+        if len(kept) == 0:
+            return np.inf
+        first, row = first + kept[0], following[kept[0]:kept[-1] + 1]
+
+    return row[-1] if first + len(row) == m else np.inf
+
+
+def _vertex_coords(points):
+    if isinstance(points, np.ndarray):
+        coords = points.astype(float).reshape(len(points), -1)[:, :2]
+    else:
+        coords = np.array([
+            p.coords[0][:2] if isinstance(p, Point) else tuple(p)[:2]
+            for p in points], dtype=float).reshape(-1, 2)
+    if len(coords) == 0:
+        raise ValueError('Lines must have at least 1 point')
+    return coords
+
 
-    return maxDist
+def _walk_coords(points):
+    coords = _vertex_coords(points)
+    if len(coords) < 2:
+        raise ValueError('Lines must have at least 2 points')
+    return coords
 
 
-def make_points_on_line(geom, distance):
+def _cumulative_length(coords):
+    delta = np.diff(coords, axis=0)
+    return np.concatenate([[0.0], np.cumsum(_hypot(delta))])
+
+
+def _hypot(delta):
+    return np.sqrt(delta[:, 0] * delta[:, 0] + delta[:, 1] * delta[:, 1])
+
+
+def _point_distances(point, coords):
+    return _hypot(coords - point)
+
+
+def _interpolate_segments(coords, cumulative, segment_ends, distances):
+    """ Points at distances along the line, each measured within the
+    segment ending at the given vertex and clamped to it, matching
+    Shapely's interpolate on the segment """
+    starts = coords[segment_ends - 1]
+    ends = coords[segment_ends]
+    along = np.maximum(distances - cumulative[segment_ends - 1], 0)
+    segment_lengths = _hypot(ends - starts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = (along / segment_lengths)[:, None]
+    points = starts + fraction * (ends - starts)
+    points = np.where(fraction >= 1, ends, points)
+    points = np.where(along[:, None] >= segment_lengths[:, None], ends, points)
+    return np.where(along[:, None] <= 0, starts, points)
+
+
+def make_points_on_line(geom, distance, as_array=False):
     """ Create points evenly distributed along a line at a fixed distance.
     Note that lines w/points will not meet Shapely's intersection criteria
     due to the use of interpolate.
@@ -93,23 +249,104 @@ def make_points_on_line(geom, distance):
         geom {LineString|MultiLineString} -- geom to create points along
         distance {int|float} -- distance in metres along line to split
 
+    Keyword Arguments:
+        as_array {bool} -- return an (N, 2) array of coordinates rather
+            than Points (default: {False})
+
     Returns:
         list -- list of shapely Points
     """
+    coords, _ = make_points_on_lines([geom], distance)
+    return coords if as_array else [Point(xy) for xy in coords]
 
-    if geom.geom_type == 'LineString':
-        num_vert = max(int(math.ceil(geom.length / distance) - 1), 1)
-        line_fraction = 1 / (num_vert + 1)
-        return [
-            geom.interpolate(n * line_fraction, normalized=True)
-            for n in range(1, num_vert + 1)
-        ]
-    elif geom.geom_type == 'MultiLineString':
-        parts = [make_points_on_line(part, distance)
-                 for part in geom]
-        return [point for part in parts for point in part]
-    else:
-        raise ValueError('unhandled geometry %s', (geom.geom_type,))
+
+def make_points_on_lines(geoms, distance):
+    """ Create points evenly distributed along each of a list of lines at a
+    fixed distance, as `make_points_on_line` does for one line. The length
+    along each line is worked out once, so all of the points are placed in
+    a single vectorized pass, matching Shapely's interpolate.
+
+    Arguments:
+        geoms {list} -- list of LineStrings and MultiLineStrings
+        distance {int|float} -- distance in metres along line to split
+
+    Returns:
+        tuple -- (coords, offsets) where coords is an (N, 2) array and the
+            points along geoms[i] are coords[offsets[i]:offsets[i + 1]]
+    """
+    line_coords, line_offsets, part_counts = _pack_lines(geoms)
+    cumulative, lengths = _walk_lines(line_coords, line_offsets)
+    counts = _split_counts(lengths, distance)
+    coords, _, point_offsets = _place_points(
+        line_coords, line_offsets, cumulative, lengths, counts)
+
+    offsets = np.zeros(len(geoms) + 1, dtype=np.int64)
+    offsets[1:] = point_offsets[np.cumsum(part_counts, dtype=np.int64)]
+    return coords, offsets
+
+
+def _pack_lines(geoms):
+    """ Pack the parts of LineStrings and MultiLineStrings into a flat
+    coordinate array, along with the number of parts of each geometry """
+    parts = []
+    part_counts = []
+    for geom in geoms:
+        if geom.geom_type == 'LineString':
+            parts.append(geom)
+            part_counts.append(1)
+        elif geom.geom_type == 'MultiLineString':
+            parts.extend(geom.geoms)
+            part_counts.append(len(geom.geoms))
+        else:
+            raise ValueError('unhandled geometry %s', (geom.geom_type,))
+    line_coords, line_offsets = lines_to_coords(parts)
+    return line_coords, line_offsets, np.array(part_counts, dtype=np.int64)
+
+
+def _walk_lines(line_coords, line_offsets):
+    """ Distance along its line of every packed vertex, and the length of
+    each line """
+    cumulative = cumulative_lengths(line_coords, line_offsets)
+    lengths = cumulative[line_offsets[1:] - 1]
+    return cumulative, lengths
+
+
+def _split_counts(lengths, distance):
+    # the same count and spacing of points as interpolating on each line
+    return np.array([
+        max(int(math.ceil(length / distance) - 1), 1) for length in lengths],
+        dtype=np.int64)
+
+
+def _place_points(line_coords, line_offsets, cumulative, lengths, counts):
+    """ Place `counts` evenly spaced points along each packed line, giving
+    their coordinates, the vertex ending the segment each lies on and
+    their offsets per line """
+    point_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    owners = vertex_owners(point_offsets)
+    steps = np.arange(len(owners)) - point_offsets[owners] + 1
+    fractions = 1 / (counts + 1)
+    along = steps * fractions[owners] * lengths[owners]
+
+    # each point lies on the segment ending at the first vertex of its line
+    # beyond it, found by sorting points in among the vertices
+    is_vertex = np.concatenate(
+        [np.ones(len(cumulative), bool), np.zeros(len(along), bool)])
+    order = np.lexsort((
+        ~is_vertex,
+        np.concatenate([cumulative, along]),
+        np.concatenate([vertex_owners(line_offsets), owners])))
+    vertices_before = np.cumsum(is_vertex[order])
+    is_point = ~is_vertex[order]
+    segment_ends = np.empty(len(along), dtype=np.int64)
+    segment_ends[order[is_point] - len(cumulative)] = \
+        vertices_before[is_point]
+    segment_ends = np.clip(
+        segment_ends, line_offsets[:-1][owners] + 1,
+        line_offsets[1:][owners] - 1)
+    coords = _interpolate_segments(
+        line_coords, cumulative, segment_ends, along).reshape(-1, 2)
+    return coords, segment_ends, point_offsets
 
 
 def split_features_by_distance(features, distance):
@@ -119,12 +356,79 @@ def split_features_by_distance(features, distance):
         features {list} -- List of Feature objects
         distance {int|float} -- Approx distance in metres between splits
     """
-    split_features = []
-    for f in features:
-        split_geoms = split_line_by_distance(f.geom, distance)
-        for sg in split_geoms:
-            split_features.append(Feature(sg, f.data))
-    return split_features
+    return list(iter_split_features_by_distance(features, distance))
+
+
+def iter_split_features_by_distance(features, distance, processes=None,
+                                    chunk_size=DEFAULT_SPLIT_CHUNK_SIZE):
+    """ Split up each geometry in an iterable of features based on
+    distance, yielding the split features in input order. Features are
+    worked through in chunks, each sent to a worker as a packed coordinate
+    array, with only a few chunks in flight at once, so memory stays
+    bounded however many features there are.
+
+    Arguments:
+        features {iterable} -- Feature objects, e.g. read lazily from a file
+        distance {int|float} -- Approx distance in metres between splits
+
+    Keyword Arguments:
+        processes {int} -- number of worker processes, or None to work in
+            this process (default: {None})
+        chunk_size {int} -- number of features per chunk (default: {4096})
+
+    Yields:
+        Feature -- split features, sharing the data of their original
+    """
+    features = iter(features)
+    chunks = iter(lambda: list(islice(features, chunk_size)), [])
+    jobs = (_split_job(chunk, distance) for chunk in chunks)
+    for (chunk, short), pieces in _map_in_order(
+            _split_packed, jobs, processes):
+        yield from _split_chunk_features(chunk, short, pieces)
+
+
+def _map_in_order(function, jobs, processes):
+    """ Run function(*args) for each (context, args) job, in this process
+    or across a pool of `processes`, yielding (context, result) in job
+    order. At most two jobs per process are in flight at once, so jobs can
+    be streamed from a generator without all being held in memory. """
+    if processes is None:
+        for context, args in jobs:
+            yield context, function(*args)
+        return
+
+    with ProcessPoolExecutor(processes) as executor:
+        pending = deque()
+        for context, args in jobs:
+            pending.append((context, executor.submit(function, *args)))
+            if len(pending) > 2 * processes:
+                context, future = pending.popleft()
+                yield context, future.result()
+        for context, future in pending:
+            yield context, future.result()
+
+
+def _split_job(features, distance):
+    # features shorter than distance are kept whole, so aren't sent
+    short = [f.geom.length < distance for f in features]
+    packed = _pack_lines(
+        [f.geom for f, keep in zip(features, short) if not keep])
+    return (features, short), packed + (distance,)
+
+
+def _split_chunk_features(features, short, pieces):
+    coords, offsets, owners = pieces
+    lines = coords_to_lines(coords, offsets)
+    line_offsets = np.searchsorted(
+        owners, np.arange(len(short) - sum(short) + 1))
+    j = 0
+    for f, keep in zip(features, short):
+        if keep:
+            yield Feature(f.geom, f.data)
+            continue
+        for sg in lines[line_offsets[j]:line_offsets[j + 1]]:
+            yield Feature(sg, f.data)
+        j += 1
 
 
 def split_line_by_distance(geom, distance):
@@ -143,69 +447,443 @@ def split_line_by_distance(geom, distance):
     if geom.length < distance:
         return [geom]
 
-    # Interpolated points won't intersect line, so need to buffer
-    r = distance / 100
-    buffed = MultiPolygon(
-        [p.buffer(r) for p in make_points_on_line(geom, distance)]
-    )
+    return coords_to_lines(*split_lines_by_distance([geom], distance)[:2])
 
-    # Buffered polygons will each yield two additional split line sections
-    poly_split_lines = split(geom, buffed)
 
-    # Stitch together each two additional split line sections into one
-    point_split_lines = []
-    for i, current_line in enumerate(poly_split_lines):
+def split_lines_by_distance(geoms, distance):
+    """ Split up each of a list of lines based on distance, as
+    `split_line_by_distance` does for one line. The lines are cut at the
+    points `make_points_on_lines` would place along them, walking the
+    packed coordinates directly, so neighbouring pieces share their split
+    point exactly. Lines shorter than `distance` are kept whole, and the
+    parts of MultiLineStrings are split separately.
 
-        if i == len(poly_split_lines) - 1:  # last line
-            point_split_lines.append(current_line)
-        elif i % 2 == 0:  # 0 or even
-            last_line = current_line
-        else:
-            point_split_lines.append(LineString(
-                list(last_line.coords) + list(current_line.coords)))
-            last_line = current_line
+    Arguments:
+        geoms {list} -- list of LineStrings and MultiLineStrings
+        distance {int|float} -- approx distance in metres between splits
 
-    return point_split_lines
+    Returns:
+        tuple -- (coords, offsets, owners) where piece `i` is
+            coords[offsets[i]:offsets[i + 1]] and came from geoms[owners[i]]
+    """
+    return _split_packed(*_pack_lines(geoms), distance)
+
+
+def _split_packed(line_coords, line_offsets, part_counts, distance):
+    """ `split_lines_by_distance` on lines packed by `_pack_lines` """
+    cumulative, lengths = _walk_lines(line_coords, line_offsets)
+    n_parts = len(line_offsets) - 1
+    part_owners = np.repeat(np.arange(len(part_counts)), part_counts)
+
+    # geometries shorter than distance aren't split at all
+    geom_lengths = np.zeros(len(part_counts))
+    np.add.at(geom_lengths, part_owners, lengths)
+    counts = _split_counts(lengths, distance)
+    counts[geom_lengths[part_owners] < distance] = 0
+    points, segment_ends, point_offsets = _place_points(
+        line_coords, line_offsets, cumulative, lengths, counts)
+
+    # piece k of a line runs from point k - 1 through the vertices between
+    # to point k, with the first and last pieces starting and ending at the
+    # line's own ends
+    piece_lines = np.repeat(np.arange(n_parts), counts + 1)
+    k = np.arange(len(piece_lines)) - np.repeat(
+        point_offsets[:-1] + np.arange(n_parts), counts + 1)
+    has_head = k > 0
+    has_tail = k < counts[piece_lines]
+    head = np.clip(point_offsets[piece_lines] + k - 1, 0, None)
+    tail = np.clip(point_offsets[piece_lines] + k, None, len(points) - 1)
+    first = np.where(
+        has_head, segment_ends[head] if len(points) else 0,
+        line_offsets[:-1][piece_lines])
+    last = np.where(
+        has_tail, segment_ends[tail] - 1 if len(points) else 0,
+        line_offsets[1:][piece_lines] - 1)
+
+    # drop vertices the split points landed on
+    if len(points):
+        first += has_head & (
+            line_coords[first] == points[head]).all(axis=1)
+        last -= has_tail & (
+            line_coords[last] == points[tail]).all(axis=1)
+
+    piece_sizes = has_head + (last - first + 1) + has_tail
+    offsets = np.zeros(len(piece_sizes) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(piece_sizes)
+    sources = np.arange(offsets[-1]) + np.repeat(
+        first - offsets[:-1] - has_head, piece_sizes)
+    sources[offsets[:-1][has_head]] = len(line_coords) + head[has_head]
+    sources[offsets[1:][has_tail] - 1] = len(line_coords) + tail[has_tail]
+    coords = np.concatenate([line_coords, points])[sources]
+
+    return coords, offsets, part_owners[piece_lines]
+
+
+def simplify_lines(geoms, tolerance, method=DOUGLAS_PEUCKER,
+                   processes=None, chunk_size=DEFAULT_SPLIT_CHUNK_SIZE):
+    """ Simplify a list of lines, removing vertices which barely change
+    their shape while always keeping each line's endpoints, so lines that
+    met before still meet. Lines are packed into coordinate arrays in
+    chunks and simplified with `simplify_coords`, across a pool of
+    processes if `processes` is given.
 
+    Arguments:
+        geoms {list} -- list of LineStrings and MultiLineStrings
+        tolerance {int|float} -- how far in metres a removed vertex can be
+            from the simplified line, see `simplify_coords`
 
-def join_points_to_lines(points, lines):
-    """ Create Shapely LineStrings joining each provided point to the closest
-    endpoint within the provided line geometries.
+    Keyword Arguments:
+        method {str} -- 'douglas-peucker' or 'visvalingam'
+            (default: {'douglas-peucker'})
+        processes {int} -- number of worker processes, or None to work in
+            this process (default: {None})
+        chunk_size {int} -- number of lines per chunk (default: {4096})
+
+    Returns:
+        tuple -- (simplified, stats), the list of simplified geometries and
+            a dict of the number of lines and vertices before and after
+    """
+    _check_simplify_method(method)
+    chunks = (
+        geoms[start:start + chunk_size]
+        for start in range(0, len(geoms), chunk_size))
+    jobs = (
+        (chunk, _pack_lines(chunk)[:2] + (tolerance, method))
+        for chunk in chunks)
+
+    simplified = []
+    vertices_before = 0
+    vertices_after = 0
+    for chunk, (coords, offsets, before) in _map_in_order(
+            _simplify_job, jobs, processes):
+        lines = coords_to_lines(coords, offsets)
+        vertices_before += before
+        vertices_after += len(coords)
+        part = 0
+        for geom in chunk:
+            if geom.geom_type == 'LineString':
+                simplified.append(lines[part])
+                part += 1
+            else:
+                n_parts = len(geom.geoms)
+                simplified.append(
+                    MultiLineString(lines[part:part + n_parts]))
+                part += n_parts
+
+    return simplified, {
+        'lines': len(geoms),
+        'vertices_before': vertices_before,
+        'vertices_after': vertices_after,
+        'vertices_removed': vertices_before - vertices_after,
+    }
+
+
+def _simplify_job(coords, offsets, tolerance, method):
+    return simplify_coords(coords, offsets, tolerance, method) + (
+        len(coords),)
+
+
+def simplify_coords(coords, offsets, tolerance, method=DOUGLAS_PEUCKER):
+    """ Simplify lines packed into a flat coordinate array, all at once,
+    keeping the endpoints of every line.
+
+    'douglas-peucker' keeps the vertex furthest from the segment joining
+    the ends of a section of line, if it is more than `tolerance` from it,
+    and repeats on the two halves, as Shapely's simplify does with
+    preserve_topology=False. 'visvalingam' repeatedly removes the vertex
+    making the smallest triangle with its neighbours, while that area is
+    less than tolerance squared. Both give the same vertices as GEOS. Each
+    pass works on every line at once, so the number of passes depends on
+    the longest line rather than the number of lines.
+
+    Arguments:
+        coords {numpy.ndarray} -- (N, 2) array of coordinates
+        offsets {numpy.ndarray} -- line start offsets into coords
+        tolerance {int|float} -- simplification tolerance in metres
+
+    Keyword Arguments:
+        method {str} -- 'douglas-peucker' or 'visvalingam'
+            (default: {'douglas-peucker'})
+
+    Returns:
+        tuple -- (coords, offsets) of the simplified lines
+    """
+    _check_simplify_method(method)
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if method == DOUGLAS_PEUCKER:
+        keep = _douglas_peucker(coords, offsets, tolerance)
+    else:
+        keep = _visvalingam(coords, offsets, tolerance)
+
+    kept = np.concatenate([[0], np.cumsum(keep)]).astype(np.int64)
+    return coords[keep], kept[offsets]
+
+
+def densify_coords(coords, offsets, spacing):
+    """ Add vertices along lines packed into a flat coordinate array, so
+    that no segment is longer than `spacing`. Each segment is split evenly
+    and the original vertices are all kept.
+
+    Arguments:
+        coords {numpy.ndarray} -- (N, 2) array of coordinates
+        offsets {numpy.ndarray} -- line start offsets into coords
+        spacing {int|float} -- longest segment to leave
+
+    Returns:
+        tuple -- (coords, offsets) of the densified lines
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if len(coords) < 2:
+        return coords.copy(), offsets.copy()
+
+    # each vertex is followed by the points splitting the segment after it
+    pieces = np.ones(len(coords), dtype=np.int64)
+    pieces[:-1] = np.where(
+        segment_mask(offsets),
+        np.maximum(np.ceil(segment_lengths(coords) / spacing), 1), 1)
+    owners = np.repeat(np.arange(len(coords)), pieces)
+    steps = np.arange(len(owners)) - np.repeat(
+        np.cumsum(pieces) - pieces, pieces)
+    following = coords[np.minimum(owners + 1, len(coords) - 1)]
+    fractions = (steps / pieces[owners])[:, None]
+    dense = coords[owners] + fractions * (following - coords[owners])
+
+    dense_offsets = np.zeros(len(coords) + 1, dtype=np.int64)
+    dense_offsets[1:] = np.cumsum(pieces)
+    return dense, dense_offsets[offsets]
+
+
+def _check_simplify_method(method):
+    if method not in SIMPLIFY_METHODS:
+        raise ValueError('Invalid simplification method')
+
+
+def _douglas_peucker(coords, offsets, tolerance):
+    """ Which vertices Douglas-Peucker keeps, working on the sections of
+    every line together, one level of recursion at a time """
+    keep = np.ones(len(coords), dtype=bool)
+    filled = np.diff(offsets) > 0
+    first = offsets[:-1][filled]
+    last = offsets[1:][filled] - 1
+
+    while len(first) > 0:
+        sections = last - first > 1
+        first, last = first[sections], last[sections]
+        if len(first) == 0:
+            break
+
+        # every vertex inside a section, measured to the section's ends
+        counts = last - first - 1
+        section_offsets = np.concatenate([[0], np.cumsum(counts)])
+        owners = vertex_owners(section_offsets)
+        inner = np.arange(len(owners)) - section_offsets[owners] + \
+            first[owners] + 1
+        distances = point_segment_distances(
+            coords[inner], coords[first[owners]], coords[last[owners]],
+            pairwise=True)
+
+        # the first furthest vertex of each section, as GEOS takes
+        furthest = np.maximum.reduceat(distances, section_offsets[:-1])
+        at_furthest = np.where(
+            distances == furthest[owners], inner, len(coords))
+        split = np.minimum.reduceat(at_furthest, section_offsets[:-1])
+
+        flat = furthest <= tolerance
+        keep[inner[flat[owners]]] = False
+        first, last, split = first[~flat], last[~flat], split[~flat]
+        first, last = (
+            np.concatenate([first, split]), np.concatenate([split, last]))
+
+    return keep
+
+
+def _visvalingam(coords, offsets, tolerance):
+    """ Which vertices Visvalingam-Whyatt keeps, removing the smallest
+    triangle of every line at each step, as GEOS does one line at a time
+    """
+    n = len(coords)
+    keep = np.ones(n, dtype=bool)
+    previous = np.arange(n) - 1
+    following = np.arange(n) + 1
+    filled = np.diff(offsets) > 0
+    is_end = np.zeros(n, dtype=bool)
+    is_end[offsets[:-1][filled]] = True
+    is_end[offsets[1:][filled] - 1] = True
+    inner = np.flatnonzero(~is_end)
+    areas = np.full(n, np.inf)
+    areas[inner] = _triangle_areas(
+        coords[previous[inner]], coords[inner], coords[following[inner]])
+    threshold = tolerance * tolerance
+
+    # the inner vertices still in each line still being simplified, in
+    # order, so that the first smallest triangle is removed as in GEOS
+    counts = np.diff(offsets) - 2
+    lines = np.flatnonzero(counts > 0)
+    counts = counts[lines]
+    owners = np.repeat(np.arange(len(lines)), counts)
+    vertices = np.arange(len(owners)) - np.repeat(
+        np.cumsum(counts) - counts, counts) + offsets[lines][owners] + 1
+
+    while len(lines) > 0:
+        group_starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        vertex_areas = areas[vertices]
+        smallest = np.minimum.reduceat(vertex_areas, group_starts)
+        at_smallest = np.where(
+            vertex_areas == smallest[owners], np.arange(len(vertices)),
+            len(vertices))
+        positions = np.minimum.reduceat(at_smallest, group_starts)
+        removing = smallest < threshold
+        positions = positions[removing]
+        removed = vertices[positions]
+
+        keep[removed] = False
+        before = previous[removed]
+        after = following[removed]
+        following[before] = after
+        previous[after] = before
+        for vertex in [before, after]:
+            vertex = vertex[~is_end[vertex]]
+            areas[vertex] = _triangle_areas(
+                coords[previous[vertex]], coords[vertex],
+                coords[following[vertex]])
+
+        still = removing[owners]
+        still[positions] = False
+        vertices = vertices[still]
+        counts = counts[removing] - 1
+        lines = lines[removing][counts > 0]
+        counts = counts[counts > 0]
+        owners = np.repeat(np.arange(len(lines)), counts)
+
+    return keep
+
+
+def _triangle_areas(a, b, c):
+    # as GEOS's Triangle::area
+    return np.abs(
+        ((c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1]) -
+         (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1])) / 2.0)
+
+
+def line_endpoints(lines):
+    """ Start and end of each of a list of lines, for `join_points_to_lines`.
+    Working them out once lets repeated joins against the same lines, e.g.
+    a road network, skip it.
 
     Arguments:
-        points {list} -- list of Shapely Points
         lines {list} -- list of Shapely Linestrings
 
     Returns:
-        [list] -- list of Shapely Linestrings joining points to lines
+        numpy.ndarray -- (N, 2) array of the start and then the end of each
+            non-empty line, in line order
     """
+    coords, offsets = lines_to_coords(lines)
+    filled = np.diff(offsets) > 0
+    return np.stack([
+        coords[offsets[:-1][filled]],
+        coords[offsets[1:][filled] - 1],
+    ], axis=1).reshape(-1, 2)
 
-    # create an empty spatial index object
-    index = rtree.index.Index()
 
-    # populate the spatial index
-    for index_id, geom in enumerate(lines):
-        index.insert(index_id, geom.bounds)
+def join_points_to_lines(points, lines, endpoints=None, metric=EUCLIDEAN):
+    """ Create Shapely LineStrings joining each provided point to the closest
+    endpoint within the provided line geometries. Only endpoints are ever
+    joined to, so they are searched directly, for all of the points at
+    once, see `common.closest_indices`.
 
-    # create lines which join points to lines
-    joins = []
-    for search_id, geom in enumerate(points):
+    Arguments:
+        points {list} -- list of Shapely Points
+        lines {list} -- list of Shapely Linestrings
 
-        # buffer out the point until we hit a line
-        r = 1
-        index_ids = []
+    Keyword Arguments:
+        endpoints {numpy.ndarray} -- endpoints of the lines from
+            `line_endpoints`, to reuse across joins to the same lines, in
+            which case lines is not read (default: {None})
+        metric {str} -- 'euclidean', or 'haversine' to join EPSG:4326
+            geometries by distance in metres without projecting them
+            (default: {'euclidean'})
 
-        while len(index_ids) == 0:
-            buffered = geom.buffer(r)
-            index_ids = [int(i) for i in index.intersection(buffered.bounds)]
-            r *= 2
+    Returns:
+        [list] -- list of Shapely Linestrings joining points to lines
+    """
 
-        points_in_lines = []
-        for l in [lines[ind] for ind in index_ids]:
-            points_in_lines.append(Point(l.coords[0]))
-            points_in_lines.append(Point(l.coords[-1]))
+    if len(points) == 0:
+        return []
+    query_xy = point_coords(points)
+    if query_xy is None:
+        raise ValueError('Can only join non-empty Points to lines')
+
+    if endpoints is None:
+        endpoints = line_endpoints(lines)
+    endpoints = np.asarray(endpoints, dtype=float).reshape(-1, 2)
+    if len(endpoints) == 0:
+        raise ValueError('No lines to join points to')
+
+    indices, _ = closest_indices(query_xy, endpoints, metric=metric)
+    return [
+        LineString([xy, endpoint])
+        for xy, endpoint in zip(
+            query_xy.tolist(), endpoints[indices[:, 0]].tolist())
+    ]
+
+
+def join_points_to_nearest_locations(points, lines,
+                                     batch_size=DEFAULT_BATCH_POINTS,
+                                     metric=EUCLIDEAN):
+    """ Create Shapely LineStrings joining each provided point to the
+    nearest location anywhere along the provided lines, rather than only
+    to their endpoints as `join_points_to_lines` does, so that long lines
+    needn't be split up first. Points are projected onto the nearest
+    segment found with a spatial index over every segment, in vectorized
+    batches.
 
-        closest_point_on_line = closest(geom, points_in_lines)
-        joins.append(LineString((geom, closest_point_on_line)))
+    Arguments:
+        points {list|numpy.ndarray} -- list of Shapely Points, or an (M, 2)
+            array of coordinates
+        lines {list} -- list of Shapely Linestrings
+
+    Keyword Arguments:
+        batch_size {int} -- number of points searched at once
+            (default: {4096})
+        metric {str} -- 'euclidean', or 'haversine' to join EPSG:4326
+            geometries by distance in metres without projecting them
+            (default: {'euclidean'})
+
+    Returns:
+        tuple -- (joins, line_ids, positions), a list of LineStrings joining
+            each point to its line, an array of the positions of those
+            lines in `lines` and an array of how far along them the joins
+            meet them, in coordinate units as Shapely's project gives, for
+            inserting the join's end into the line
+    """
 
-    return joins
+    if len(points) == 0:
+        return [], np.empty(0, dtype=np.int64), np.empty(0)
+    query_xy = point_coords(points)
+    if query_xy is None:
+        raise ValueError('Can only join non-empty Points to lines')
+
+    coords, offsets = lines_to_coords(lines)
+    starts, ends, segment_offsets = line_segments(coords, offsets)
+    if len(starts) == 0:
+        raise ValueError('No lines to join points to')
+
+    _, nearest, segment_ids, fractions = nearest_segments(
+        query_xy, starts, ends, batch_size=batch_size, metric=metric)
+    line_ids = vertex_owners(segment_offsets)[segment_ids]
+
+    # distance along the line to the start of the segment, plus the way
+    # along the segment
+    cumulative, _ = _walk_lines(coords, offsets)
+    first_vertices = offsets[line_ids] + segment_ids - \
+        segment_offsets[line_ids]
+    positions = cumulative[first_vertices] + fractions * (
+        cumulative[first_vertices + 1] - cumulative[first_vertices])
+
+    joins = [
+        LineString([xy, location])
+        for xy, location in zip(query_xy.tolist(), nearest.tolist())
+    ]
+    return joins, line_ids, positions
@@ -0,0 +1,132 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from allfed_spatial.geometry.arrays import lines_to_coords
+from allfed_spatial.geometry.index import SpatialIndex, expand_bounds
+from allfed_spatial.geometry.line import (
+    densify_coords, discrete_frechet_distance)
+
+DEFAULT_BATCH_SIZE = 1024
+
+
+def match_lines(lines_a, lines_b, max_distance, index=None, reverse=False,
+                processes=None, batch_size=DEFAULT_BATCH_SIZE):
+    """ Find pairs of lines, one from each list, that are near duplicates
+    of each other, i.e. whose Fréchet distance is at most `max_distance`.
+    Useful for finding the same road in two datasets.
+
+    The discrete Fréchet distance only compares vertices, so both lines
+    are first densified to segments of at most half `max_distance`. The
+    distance then approximates the Fréchet distance between the lines
+    themselves, whatever their vertex densities, overestimating it by at
+    most that spacing.
+
+    Candidates are found with a spatial index over lines_b, searching
+    around each line in lines_a, then dropped if their start or end points
+    are too far apart, which rules out most of them before any Fréchet
+    distances are computed. Those are then worked out in batches, across a
+    process pool if `processes` is given.
+
+    Arguments:
+        lines_a {list} -- list of Shapely LineStrings
+        lines_b {list} -- list of Shapely LineStrings
+        max_distance {int|float} -- largest distance between matched lines
+
+    Keyword Arguments:
+        index {SpatialIndex} -- prebuilt index over lines_b
+            (default: {None})
+        reverse {bool} -- also match lines running in opposite directions
+            (default: {False})
+        processes {int} -- number of worker processes, or None to work in
+            this process (default: {None})
+        batch_size {int} -- number of candidate pairs handed to a worker at
+            a time (default: {1024})
+
+    Returns:
+        list -- (index in lines_a, index in lines_b, distance) for each
+            matched pair, ordered by index in lines_a then lines_b
+    """
+    coords_a, offsets_a = lines_to_coords(lines_a)
+    coords_b, offsets_b = lines_to_coords(lines_b)
+    if max_distance > 0:
+        coords_a, offsets_a = densify_coords(
+            coords_a, offsets_a, max_distance / 2)
+        coords_b, offsets_b = densify_coords(
+            coords_b, offsets_b, max_distance / 2)
+    if index is None:
+        index = SpatialIndex(_line_bounds(coords_b, offsets_b))
+    bounds_a = _line_bounds(coords_a, offsets_a)
+
+    pairs = [
+        (i, j)
+        for i in np.flatnonzero(~np.isnan(bounds_a).any(axis=1))
+        for j in sorted(index.intersection(
+            expand_bounds(bounds_a[i], max_distance)))
+        if offsets_b[j + 1] > offsets_b[j]
+    ]
+    if len(pairs) == 0:
+        return []
+    pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+    pairs = pairs[_endpoints_within(
+        coords_a, offsets_a, coords_b, offsets_b, pairs, max_distance,
+        reverse)]
+
+    batches = (
+        [(int(i), int(j),
+          coords_a[offsets_a[i]:offsets_a[i + 1]],
+          coords_b[offsets_b[j]:offsets_b[j + 1]])
+         for i, j in pairs[start:start + batch_size]]
+        for start in range(0, len(pairs), batch_size))
+    kwargs = {'max_distance': max_distance, 'reverse': reverse}
+    if processes is None:
+        results = (_match_batch(batch, **kwargs) for batch in batches)
+        return [match for batch in results for match in batch]
+
+    with ProcessPoolExecutor(processes) as executor:
+        futures = [
+            executor.submit(_match_batch, batch, **kwargs)
+            for batch in batches]
+        return [match for f in futures for match in f.result()]
+
+
+def _match_batch(batch, max_distance, reverse):
+    matches = []
+    for i, j, line_a, line_b in batch:
+        distance = discrete_frechet_distance(
+            line_a, line_b, threshold=max_distance)
+        if reverse:
+            distance = min(distance, discrete_frechet_distance(
+                line_a, line_b[::-1], threshold=max_distance))
+        if distance <= max_distance:
+            matches.append((i, j, distance))
+    return matches
+
+
+def _line_bounds(coords, offsets):
+    # bounds of each packed line, NaN for empty ones
+    bounds = np.full((len(offsets) - 1, 4), np.nan)
+    filled = np.flatnonzero(np.diff(offsets) > 0)
+    if len(filled) > 0:
+        starts = offsets[filled]
+        bounds[filled, :2] = np.minimum.reduceat(coords, starts)
+        bounds[filled, 2:] = np.maximum.reduceat(coords, starts)
+    return bounds
+
+
+def _endpoints_within(coords_a, offsets_a, coords_b, offsets_b, pairs,
+                      max_distance, reverse):
+    # every coupling of two lines pairs up their starts and their ends
+    starts_a = coords_a[offsets_a[pairs[:, 0]]]
+    ends_a = coords_a[offsets_a[pairs[:, 0] + 1] - 1]
+    starts_b = coords_b[offsets_b[pairs[:, 1]]]
+    ends_b = coords_b[offsets_b[pairs[:, 1] + 1] - 1]
+
+    def within(p1, p2, p3, p4):
+        return (np.hypot(*(p1 - p2).T) <= max_distance) & \
+            (np.hypot(*(p3 - p4).T) <= max_distance)
+
+    keep = within(starts_a, starts_b, ends_a, ends_b)
+    if reverse:
+        keep |= within(starts_a, ends_b, ends_a, starts_b)
+    return keep
@@ -1,34 +1,318 @@
-from shapely.ops import linemerge
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 from allfed_spatial.features.feature import Feature
+from allfed_spatial.geometry.arrays import (
+    coords_to_lines, endpoint_nodes, linear_parts, lines_to_coords)
+
+# Lines merged by `merge_coords`, packed as in geometry.arrays. Merged line
+# `i` is coords[offsets[i]:offsets[i + 1]] and was made from the input
+# lines lines[line_offsets[i]:line_offsets[i + 1]], in the order they
+# appear along it.
+MergedLines = namedtuple(
+    'MergedLines', ['coords', 'offsets', 'lines', 'line_offsets'])
+
+AGGREGATIONS = ('sum', 'mean', 'min', 'max', 'count', 'first', 'last')
 
 
-def merge_features(features):
+def merge_features(features, tolerance=0, by=None, agg=None,
+                   processes=None):
     """ Merge feature geometries together where possible, forming several
-    contiguous MultiLineStrings. Applies data of first feature to all.
+    contiguous LineStrings. See `merge_lines` for how lines are joined and
+    ordered, including loops.
 
-    Note:
-    - ordering of loops seems to be somewhat arbitary
-    - ordering of crossing loops is unpredictable
-    - touching loops don't seem to join
-    avoid loops if feasible.
+    Features can be grouped by their data, e.g. by road class, so only
+    features in the same group are merged. Each merged feature gets the
+    data of the first feature in its group, with the `agg` fields worked
+    out from the features merged into it.
 
     Arguments:
         features {list} -- list of Features
+
+    Keyword Arguments:
+        tolerance {int|float} -- size of the grid endpoints are rounded to
+            before matching, or 0 to only join identical endpoints
+            (default: {0})
+        by {str|list} -- data field, or list of fields, whose values
+            features must share to be merged (default: {None})
+        agg {dict} -- aggregation for each data field to aggregate, one of
+            'sum', 'mean', 'min', 'max', 'count', 'first' or 'last', where
+            'first' and 'last' follow the merged line (default: {None})
+        processes {int} -- number of worker processes to merge groups
+            across, or None to work in this process (default: {None})
+
+    Returns:
+        list -- list of merged Features, by group in order of each group's
+            first feature
     """
 
     if (features == None or len(features) < 1):
         raise ValueError('List of features needs at least 1 member')
+    agg = agg or {}
+    for how in agg.values():
+        _check_aggregation(how)
+
+    parts = [linear_parts(f.geom) for f in features]
+    part_features = np.repeat(
+        np.arange(len(features)), [len(p) for p in parts])
+    coords, offsets = lines_to_coords([part for p in parts for part in p])
 
-    merged_features = []
-    merged_geoms = linemerge([f.geom for f in features])
+    # pack the parts of each group together, in order of the groups' first
+    # features
+    groups = {}
+    feature_groups = np.array([
+        groups.setdefault(_group_key(f.data, by), len(groups))
+        for f in features], dtype=np.int64)
+    part_order = np.argsort(feature_groups[part_features], kind='stable')
+    group_offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+    group_offsets[1:] = np.cumsum(np.bincount(
+        feature_groups[part_features], minlength=len(groups)))
+    counts = np.diff(offsets)[part_order]
+    part_offsets = np.zeros(len(part_order) + 1, dtype=np.int64)
+    part_offsets[1:] = np.cumsum(counts)
+    coords = coords[np.arange(part_offsets[-1]) + np.repeat(
+        offsets[:-1][part_order] - part_offsets[:-1], counts)]
 
-    if merged_geoms.geom_type == 'MultiLineString':
-        merged_geoms = merged_geoms.geoms
+    jobs = [
+        (coords[part_offsets[start]:part_offsets[end]],
+         part_offsets[start:end + 1] - part_offsets[start], tolerance)
+        for start, end in zip(group_offsets[:-1], group_offsets[1:])]
+    if processes is None:
+        results = [merge_coords(*job) for job in jobs]
     else:
-        merged_geoms = [merged_geoms]
+        with ProcessPoolExecutor(processes) as executor:
+            futures = [executor.submit(merge_coords, *job) for job in jobs]
+            results = [f.result() for f in futures]
+
+    geoms = []
+    line_features = []
+    line_counts = []
+    for start, merged in zip(group_offsets[:-1], results):
+        geoms.extend(coords_to_lines(merged.coords, merged.offsets))
+        line_features.append(part_features[part_order[start + merged.lines]])
+        line_counts.append(np.diff(merged.line_offsets))
+    data = _merged_data(
+        features, feature_groups, np.concatenate(line_features),
+        np.concatenate(line_counts), agg)
+    return [Feature(geom, d) for geom, d in zip(geoms, data)]
+
+
+def merge_lines(lines, tolerance=0):
+    """ Join lines end to end wherever exactly two of them meet, like
+    `shapely.ops.linemerge`, but with a predictable result. Where three or
+    more lines meet none of them are joined there. Lines may be flipped to
+    join them up.
+
+    Merged lines come in the order of the first input line in each, and
+    run the same way as that line. A chain of lines which closes on itself
+    becomes a loop starting and ending at the start of its first line, and
+    loops which only touch other lines are never joined to them.
+
+    Arguments:
+        lines {list} -- list of Shapely LineStrings or MultiLineStrings
+
+    Keyword Arguments:
+        tolerance {int|float} -- size of the grid endpoints are rounded to
+            before matching, see `arrays.endpoint_nodes` (default: {0})
+
+    Returns:
+        list -- list of merged Shapely LineStrings
+    """
+    parts = [part for line in lines for part in linear_parts(line)]
+    merged = merge_coords(*lines_to_coords(parts), tolerance=tolerance)
+    return coords_to_lines(merged.coords, merged.offsets)
+
+
+def merge_coords(coords, offsets, tolerance=0):
+    """ Merge lines packed into a flat coordinate array, as `merge_lines`
+    does for geometries. Empty lines are dropped, and where two lines are
+    joined the first coordinate of the second is dropped.
+
+    Lines are chained through the nodes where exactly two line ends meet,
+    then each chain's coordinates are gathered in one pass, so the work is
+    all done in NumPy whatever the number of lines.
+
+    Arguments:
+        coords {numpy.ndarray} -- (N, 2) array of coordinates
+        offsets {numpy.ndarray} -- line start offsets into coords
+
+    Keyword Arguments:
+        tolerance {int|float} -- size of the grid endpoints are rounded to
+            before matching (default: {0})
+
+    Returns:
+        MergedLines -- the merged lines and the input lines in each
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    filled = np.flatnonzero(np.diff(offsets) > 0)
+    starts = offsets[filled]
+    counts = offsets[filled + 1] - starts
+    line_nodes, _ = endpoint_nodes(
+        coords, np.append(starts, offsets[-1]), tolerance)
+
+    # each line has two ends, 2 * i at its start and 2 * i + 1 at its end.
+    # Ends meeting at a node of degree 2 are mates, and a chain is walked
+    # by entering a line at one end, leaving by the other and entering the
+    # next line at its mate
+    ends = np.arange(2 * len(filled))
+    nodes = line_nodes.reshape(-1)
+    degree = np.bincount(nodes, minlength=len(ends))[nodes]
+    paired = ends[degree == 2]
+    paired = paired[np.argsort(nodes[paired] * len(ends) + paired)]
+    mates = np.full(len(ends), -1)
+    mates[paired[0::2]] = paired[1::2]
+    mates[paired[1::2]] = paired[0::2]
+    walks, walk_offsets = _walk_chains(mates[ends ^ 1], mates < 0)
+
+    # turn walks round so each runs the same way as its first line, whose
+    # start is the smallest end in it if so, then order them by that line
+    walk_starts = walk_offsets[:-1]
+    walk_counts = np.diff(walk_offsets)
+    walk_ids = np.repeat(np.arange(len(walk_counts)), walk_counts)
+    firsts = walks[:0]
+    if len(walks) > 0:
+        firsts = np.minimum.reduceat(walks, walk_starts)
+    position = np.arange(len(walks))
+    backwards = walk_starts + walk_offsets[1:] - 1
+    walks = np.where(
+        (firsts % 2 == 1)[walk_ids],
+        walks[backwards[walk_ids] - position] ^ 1, walks)
+    order = np.argsort(firsts)
+    chain_counts = walk_counts[order]
+    chain_offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    chain_offsets[1:] = np.cumsum(chain_counts)
+    kept = walks[position + np.repeat(
+        walk_starts[order] - chain_offsets[:-1], chain_counts)]
+
+    lines = kept // 2
+    flipped = kept % 2 == 1
+    chain_starts = np.zeros(len(kept), dtype=bool)
+    chain_starts[chain_offsets[:-1]] = True
+
+    # gather each line's coordinates, backwards if flipped, dropping the
+    # first of every line but the first in each chain
+    line_counts = counts[lines]
+    total = line_counts.sum()
+    position = np.arange(total) - np.repeat(
+        np.cumsum(line_counts) - line_counts, line_counts)
+    index = np.repeat(starts[lines], line_counts) + np.where(
+        np.repeat(flipped, line_counts),
+        np.repeat(line_counts, line_counts) - 1 - position, position)
+    keep = (position > 0) | np.repeat(chain_starts, line_counts)
+
+    kept_counts = np.zeros(len(kept) + 1, dtype=np.int64)
+    kept_counts[1:] = np.cumsum(line_counts - 1 + chain_starts)
+    return MergedLines(
+        coords[index[keep]], kept_counts[chain_offsets], filled[lines],
+        chain_offsets)
+
+
+def _group_key(data, by):
+    if by is None:
+        return None
+    if isinstance(by, str):
+        return data[by]
+    return tuple(data[field] for field in by)
+
+
+def _check_aggregation(how):
+    if how not in AGGREGATIONS:
+        raise ValueError('Invalid aggregation')
+
+
+def _merged_data(features, feature_groups, line_features, line_counts, agg):
+    # data for each merged line, from the first feature of its group, with
+    # each feature counted once towards the aggregates of a line however
+    # many of its parts are in it
+    n_lines = len(line_counts)
+    lines = np.repeat(np.arange(n_lines), line_counts)
+    _, first = np.unique(
+        lines * len(features) + line_features, return_index=True)
+    first = np.sort(first)
+    members = line_features[first]
+    counts = np.bincount(lines[first], minlength=n_lines)
+    starts = np.cumsum(counts) - counts
+
+    _, group_firsts = np.unique(feature_groups, return_index=True)
+    bases = group_firsts[feature_groups[members[starts]]].tolist()
+    if not agg:
+        return [features[i].data for i in bases]
+
+    aggregated = {
+        field: _aggregate(
+            np.array([features[i].data[field] for i in members.tolist()]),
+            starts, counts, how).tolist()
+        for field, how in agg.items()}
+    return [
+        dict(features[base].data,
+             **{field: values[i] for field, values in aggregated.items()})
+        for i, base in enumerate(bases)]
+
+
+def _aggregate(values, starts, counts, how):
+    # reduce the values of each run starting at `starts`, all at once
+    if how == 'count':
+        return counts
+    if how == 'first':
+        return values[starts]
+    if how == 'last':
+        return values[starts + counts - 1]
+    if len(starts) == 0:
+        return values[:0]
+    ufunc = {'sum': np.add, 'mean': np.add, 'min': np.minimum,
+             'max': np.maximum}[how]
+    reduced = ufunc.reduceat(values, starts)
+    return reduced / counts if how == 'mean' else reduced
+
+
+def _walk_chains(following, unlinked):
+    # walk each chain from one of its ends, then the loops left over from
+    # their first line, giving the ends entered and where each walk starts.
+    # An array reads faster than a list when walks jump about in memory
+    following = array('q', following.astype(np.int64).tobytes())
+
+    # lines joined to nothing are walks of their own
+    alone = unlinked[0::2] & unlinked[1::2]
+    unlinked = unlinked & ~np.repeat(alone, 2)
+    walks = (2 * np.flatnonzero(alone)).tolist()
+    walk_offsets = list(range(len(walks)))
+    append = walks.append
 
-    for mg in merged_geoms:
-        merged_features.append(Feature(mg, features[0].data))
+    # a chain can be walked from either end, so skip the end it finishes at
+    finished = bytearray(len(following))
+    for head in np.flatnonzero(unlinked).tolist():
+        if finished[head]:
+            continue
+        walk_offsets.append(len(walks))
+        end = head
+        while end >= 0:
+            append(end)
+            last = end
+            end = following[end]
+        finished[last ^ 1] = 1
 
-    return merged_features
+    paths = np.array(walks, dtype=np.int64)
+    walked = np.zeros(len(following) // 2, dtype=bool)
+    walked[paths // 2] = True
+    loop_starts = np.flatnonzero(~walked).tolist()
+    walked = bytearray(walked)
+    walks = []
+    append = walks.append
+    for line in loop_starts:
+        if walked[line]:
+            continue
+        walk_offsets.append(len(paths) + len(walks))
+        end = head = 2 * line
+        while True:
+            append(end)
+            walked[end >> 1] = 1
+            end = following[end]
+            if end == head:
+                break
+    walk_offsets.append(len(paths) + len(walks))
+    return (np.concatenate([paths, np.array(walks, dtype=np.int64)]),
+            np.array(walk_offsets, dtype=np.int64))
@@ -1,13 +1,16 @@
-import rtree
 import copy
-from shapely.ops import nearest_points
 from shapely.geometry import LineString, Point
 
-from allfed_spatial.geometry.common import intersects, closest_non_intersecting_within_radius
+from allfed_spatial.geometry.common import (
+    prepared_intersects, closest_non_intersecting_within_radius,
+    INTERSECTS_TOLERANCE)
+from allfed_spatial.geometry.distance import (
+    nearest_point, search_index, EUCLIDEAN)
+from allfed_spatial.geometry.index import SpatialIndex, expand_bounds
 from allfed_spatial.features.feature import Feature
 
 
-def snap_features(r, features):
+def snap_features(r, features, index=None, metric=EUCLIDEAN):
     """ Geometrically 'snap' (connect) features together which are within
     radius `r` of each other
 
@@ -16,10 +19,21 @@ def snap_features(r, features):
                    together
         features {list} -- list of Features
 
+    Keyword Arguments:
+        index {SpatialIndex} -- prebuilt index over the features, e.g. a
+            FeatureCollection's. Snapping works on a copy of it, so it
+            still describes the given features afterwards (default: {None})
+        metric {str} -- 'euclidean', or 'haversine' to snap EPSG:4326
+            features without projecting them, see `snap_linestrings`
+            (default: {'euclidean'})
+
     Returns:
         list -- list of snapped Features
     """
-    snapped_geoms = snap_linestrings(r, [f.geom for f in features])
+    if index is not None:
+        index = index.copy()
+    snapped_geoms = snap_linestrings(
+        r, [f.geom for f in features], index, metric)
     return [Feature(snapped_geoms[i], f.data) for i, f in enumerate(features)]
 
 
@@ -37,14 +51,13 @@ def intersects_with_index(rid, index, geom, geoms):
     Returns:
         boolean -- true if geom intersects one of geoms, false if not
     """
-    buff = geom.buffer(1)
-    ints = [geoms[int(i)] for i in index.intersection(buff.bounds) if i != rid]
-    if any([intersects(ig, geom) for ig in ints]):
-        return True
-    return False
+    search_bounds = expand_bounds(geom.bounds, INTERSECTS_TOLERANCE)
+    ints = [geoms[int(i)] for i in index.intersection(search_bounds) if i != rid]
+    intersects_geom = prepared_intersects(geom)
+    return any(intersects_geom(ig) for ig in ints)
 
 
-def snap_linestrings(r, lines):
+def snap_linestrings(r, lines, index=None, metric=EUCLIDEAN):
     """ Geometrically 'snaps' LineStrings within an array together
     within a tolerance. An endpoint is only snapped if it is not
     otherwise connected.
@@ -54,19 +67,28 @@ def snap_linestrings(r, lines):
                    together
         lines {list} -- Array of Shapely LineStrings
 
+    Keyword Arguments:
+        index {SpatialIndex} -- prebuilt index over lines, e.g. from a
+            FeatureCollection. It is updated in place as lines are snapped,
+            so that it describes the returned lines. If not given, one is
+            built. Ties between equally close lines are broken by the order
+            the index returns candidates in (default: {None})
+        metric {str} -- 'euclidean' for planar coordinates in metres, or
+            'haversine' for EPSG:4326 lines, where r is still in metres and
+            distances are measured along the Earth's surface
+            (default: {'euclidean'})
+
     Returns:
         array -- Array of snapped Shapely LineStrings
     """
 
-    # create an empty spatial index object
-    index = rtree.index.Index()
+    if index is None:
+        # built entry by entry, which keeps the long standing tie-breaking
+        # between equally close lines
+        index = SpatialIndex.from_geoms(lines, bulk_load=False)
 
     snapped = []
 
-    # populate the spatial index
-    for index_id, geom in enumerate(lines):
-        index.insert(index_id, geom.bounds)
-
     # create snapped lines
     for search_id, geom in enumerate(lines):
 
@@ -78,15 +100,15 @@ def snap_linestrings(r, lines):
         if intersects_with_index(search_id, index, e1, lines):
             new_e1_coords = []
         else:
-            e1buff = e1.buffer(r)
-            e1_line_indices = [int(i) for i in index.intersection(
-                e1buff.bounds) if i != search_id]
+            e1_line_indices = [int(i) for i in search_index(
+                index, e1.bounds, r, metric) if i != search_id]
 
             if len(e1_line_indices) > 0:
                 closest_line = closest_non_intersecting_within_radius(
-                    e1, geom, [lines[i] for i in e1_line_indices], r)
-                new_e1_coords = [nearest_points(e1, closest_line)[
-                    1].coords[0]] if closest_line else []
+                    e1, geom, [lines[i] for i in e1_line_indices], r,
+                    metric=metric)
+                new_e1_coords = [nearest_point(
+                    e1, closest_line, metric).coords[0]] if closest_line else []
             else:
                 new_e1_coords = []
 
@@ -94,15 +116,15 @@ def snap_linestrings(r, lines):
         if intersects_with_index(search_id, index, e2, lines):
             new_e2_coords = []
         else:
-            e2buff = e2.buffer(r)
-            e2_line_indices = [int(i) for i in index.intersection(
-                e2buff.bounds) if i != search_id]
+            e2_line_indices = [int(i) for i in search_index(
+                index, e2.bounds, r, metric) if i != search_id]
 
             if len(e2_line_indices) > 0:
                 closest_line = closest_non_intersecting_within_radius(
-                    e2, geom, [lines[i] for i in e2_line_indices], r)
-                new_e2_coords = [nearest_points(e2, closest_line)[
-                    1].coords[0]] if closest_line else []
+                    e2, geom, [lines[i] for i in e2_line_indices], r,
+                    metric=metric)
+                new_e2_coords = [nearest_point(
+                    e2, closest_line, metric).coords[0]] if closest_line else []
             else:
                 new_e2_coords = []
 
@@ -114,8 +136,7 @@ def snap_linestrings(r, lines):
 
         snapped_geom = LineString(snapped_geom_coords)
         snapped.append(snapped_geom)
-        index.delete(search_id, geom.bounds)
-        index.insert(search_id, snapped_geom.bounds)
+        index.update(search_id, snapped_geom.bounds)
         lines[search_id] = snapped_geom
 
     return snapped
@@ -0,0 +1,168 @@
+from collections import namedtuple
+
+import networkx as nx
+import numpy as np
+
+from allfed_spatial.geometry.arrays import (
+    endpoint_nodes, linear_parts, lines_to_coords, segment_lengths,
+    segment_mask)
+
+# A line network. Nodes are the distinct endpoints of the lines and edges
+# are the lines between them, so edge `i` joins edge_nodes[i, 0] to
+# edge_nodes[i, 1]. Adjacency is held in compressed sparse row form: the
+# edges meeting node `n` are edge_ids[indptr[n]:indptr[n + 1]], leading to
+# the nodes at the same positions in `indices`. Edges are made from the
+# features in order, one per line (or part of a MultiLineString), so the
+# edges of feature `i` are feature_offsets[i]:feature_offsets[i + 1].
+Network = namedtuple('Network', [
+    'node_coords', 'edge_nodes', 'edge_lengths', 'edge_costs',
+    'indptr', 'indices', 'edge_ids', 'feature_offsets'])
+
+
+def build_network(features, tolerance=0, cost_field=None):
+    """ Build a network from line features, joining lines whose endpoints
+    fall on the same node. Endpoints are snapped to a grid of `tolerance`
+    and matched in one NumPy pass, so run `snap_features` first to join
+    lines which only nearly meet.
+
+    Arguments:
+        features {list} -- list of Features with LineString or
+            MultiLineString geometries
+
+    Keyword Arguments:
+        tolerance {int|float} -- size of the grid endpoints are rounded to
+            before matching, or 0 to only match identical endpoints. Note
+            that two endpoints closer than this can still fall either side
+            of a grid line (default: {0})
+        cost_field {str} -- data field to use as each edge's cost, rather
+            than its length (default: {None})
+
+    Returns:
+        Network -- the nodes, edges and adjacency of the network
+    """
+    parts = [linear_parts(f.geom) for f in features]
+    coords, offsets = lines_to_coords([part for p in parts for part in p])
+
+    # empty parts don't make edges
+    part_features = np.repeat(
+        np.arange(len(features)), [len(p) for p in parts])
+    filled = np.diff(offsets) > 0
+    part_features = part_features[filled]
+    offsets = np.concatenate([offsets[:-1][filled], offsets[-1:]])
+
+    costs = None
+    if cost_field is not None:
+        costs = np.array(
+            [f.data[cost_field] for f in features])[part_features]
+    network = network_from_coords(coords, offsets, tolerance, costs)
+
+    feature_offsets = np.zeros(len(features) + 1, dtype=np.int64)
+    feature_offsets[1:] = np.cumsum(
+        np.bincount(part_features, minlength=len(features)))
+    return network._replace(feature_offsets=feature_offsets)
+
+
+def network_from_coords(coords, offsets, tolerance=0, costs=None):
+    """ Build a network from lines packed into a flat coordinate array, as
+    `build_network` does for features, with one edge per line
+
+    Arguments:
+        coords {numpy.ndarray} -- (N, 2) array of coordinates
+        offsets {numpy.ndarray} -- line start offsets into coords, where
+            every line has at least one coordinate
+
+    Keyword Arguments:
+        tolerance {int|float} -- size of the grid endpoints are rounded to
+            before matching, see `build_network` (default: {0})
+        costs {numpy.ndarray} -- cost of each line, rather than its length
+            (default: {None})
+
+    Returns:
+        Network -- the nodes, edges and adjacency of the network, where
+            each line is its own feature
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n_edges = len(offsets) - 1
+    edge_nodes, node_coords = endpoint_nodes(coords, offsets, tolerance)
+
+    lengths = np.zeros(n_edges)
+    if len(coords) > 1:
+        real = segment_mask(offsets)
+        segment_edges = np.repeat(np.arange(n_edges), np.diff(offsets))
+        lengths = np.bincount(
+            segment_edges[:-1][real], segment_lengths(coords)[real],
+            minlength=n_edges)
+    if costs is None:
+        costs = lengths
+
+    indptr, indices, edge_ids = _adjacency(edge_nodes, len(node_coords))
+    return Network(
+        node_coords, edge_nodes, lengths, np.asarray(costs), indptr, indices,
+        edge_ids, np.arange(n_edges + 1, dtype=np.int64))
+
+
+def _adjacency(edge_nodes, n_nodes):
+    """ CSR adjacency of an undirected network, listing each edge once at
+    each of its ends (once in all for loops), in edge order """
+    loops = edge_nodes[:, 0] == edge_nodes[:, 1]
+    edge_ids = np.concatenate([
+        np.arange(len(edge_nodes)), np.flatnonzero(~loops)])
+    sources = np.concatenate([edge_nodes[:, 0], edge_nodes[~loops, 1]])
+    targets = np.concatenate([edge_nodes[:, 1], edge_nodes[~loops, 0]])
+
+    # each (source, edge) pair is unique, so any sort of them will do
+    order = np.argsort(sources * max(len(edge_nodes), 1) + edge_ids)
+    indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(sources, minlength=n_nodes))
+    return indptr, targets[order], edge_ids[order]
+
+
+def network_to_networkx(network, multigraph=False, cost_scale=None):
+    """ Export a network to a networkx graph, e.g. for
+    `flow.solve_min_cost_flow`. Nodes are numbered as in the network, with
+    their coordinates as 'x' and 'y', and edges have 'length', 'cost' and
+    'edge' (their position in the network) attributes.
+
+    OR-Tools only takes integer unit costs, so pass `cost_scale` to give
+    each edge's cost multiplied by it and rounded to an integer, e.g. 100
+    to keep costs to the nearest hundredth.
+
+    Arguments:
+        network {Network} -- network from `build_network`
+
+    Keyword Arguments:
+        multigraph {bool} -- keep every edge between a pair of nodes in a
+            MultiGraph, rather than only the cheapest in a Graph
+            (default: {False})
+        cost_scale {int|float} -- factor edge costs are multiplied by
+            before rounding them to integers, or None to keep them as they
+            are (default: {None})
+
+    Returns:
+        networkx.Graph|networkx.MultiGraph -- the network's graph
+    """
+    graph = nx.MultiGraph() if multigraph else nx.Graph()
+    graph.add_nodes_from(
+        (n, {'x': x, 'y': y})
+        for n, (x, y) in enumerate(network.node_coords.tolist()))
+
+    edges = np.arange(len(network.edge_nodes))
+    if not multigraph:
+        # the cheapest edge between each pair of nodes, earliest on ties
+        pairs = np.sort(network.edge_nodes, axis=1)
+        order = np.lexsort(
+            (edges, network.edge_costs, pairs[:, 1], pairs[:, 0]))
+        pairs = pairs[order]
+        first = np.r_[True, (pairs[1:] != pairs[:-1]).any(axis=1)]
+        edges = np.sort(order[first])
+
+    costs = network.edge_costs[edges]
+    if cost_scale is not None:
+        costs = np.rint(costs * cost_scale).astype(np.int64)
+    graph.add_edges_from(
+        (u, v, {'length': length, 'cost': cost, 'edge': edge})
+        for edge, (u, v), length, cost in zip(
+            edges.tolist(), network.edge_nodes[edges].tolist(),
+            network.edge_lengths[edges].tolist(), costs.tolist()))
+    return graph
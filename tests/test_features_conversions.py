@@ -0,0 +1,78 @@
+import unittest
+import pandas as pd
+import allfed_spatial.features.conversions as conversions
+from shapely.geometry import LineString, Point
+from allfed_spatial.features.feature import Feature
+from tests.test_geometry_line import LineBaseTest
+
+
+class Test_features_to_geodataframe(unittest.TestCase):
+
+    def test_no_features(self):
+        gdf = conversions.features_to_geodataframe([])
+        self.assertEqual(len(gdf), 0)
+
+    def test_typed_columns(self):
+        features = [
+            Feature(Point(0, 0), {'int': 1, 'float': 1.5, 'str': 'a'}),
+            Feature(Point(1, 1), {'int': 2, 'float': 2.5, 'str': 'b'}),
+        ]
+        gdf = conversions.features_to_geodataframe(features)
+        self.assertEqual(list(gdf.columns), ['int', 'float', 'str', 'geometry'])
+        self.assertEqual(gdf['int'].dtype, 'int64')
+        self.assertEqual(gdf['float'].dtype, 'float64')
+        self.assertIs(gdf.geometry.iloc[1], features[1].geom)
+
+    def test_missing_keys(self):
+        features = [
+            Feature(Point(0, 0), {'a': 1}),
+            Feature(Point(1, 1), {'b': 'x'}),
+        ]
+        gdf = conversions.features_to_geodataframe(features)
+        self.assertEqual(list(gdf.columns), ['a', 'b', 'geometry'])
+        self.assertTrue(gdf['a'].isnull().iloc[1])
+        self.assertEqual(gdf['b'].iloc[1], 'x')
+
+    def test_chunks(self):
+        features = [Feature(Point(i, i), {'i': i}) for i in range(5)]
+        gdfs = list(conversions.iter_geodataframes(iter(features), chunk_size=2))
+        self.assertEqual([len(gdf) for gdf in gdfs], [2, 2, 1])
+        self.assertEqual(gdfs[2]['i'].iloc[0], 4)
+
+
+class Test_geodataframe_to_features(LineBaseTest):
+
+    def test_round_trip(self):
+        features = [
+            Feature(LineString([(0, 0), (1, 1)]), {'int': 1, 'str': 'a'}),
+            Feature(LineString([(1, 1), (2, 2)]), {'int': 2, 'str': 'b'}),
+            Feature(LineString([(2, 2), (3, 3)]), {'int': 3, 'str': 'c'}),
+        ]
+        gdf = conversions.features_to_geodataframe(features)
+        result = conversions.geodataframe_to_features(gdf, chunk_size=2)
+        self.FeaturesEqual(result, features)
+        self.assertIs(type(result[0].data['int']), int)
+
+    def test_dates(self):
+        dates = [pd.Timestamp('2020-01-01'), pd.Timestamp('2021-06-30')]
+        features = [
+            Feature(Point(0, 0), {'date': dates[0]}),
+            Feature(Point(1, 1), {'date': dates[1]}),
+        ]
+        gdf = conversions.features_to_geodataframe(features)
+        self.assertEqual(gdf['date'].dtype, 'datetime64[ns]')
+        result = conversions.geodataframe_to_features(gdf, chunk_size=1)
+        self.assertEqual([f.data['date'] for f in result], dates)
+        rows = gdf.drop(columns='geometry').iterrows()
+        self.assertEqual(
+            [f.data for f in result], [row.to_dict() for _, row in rows])
+
+    def test_no_data_columns(self):
+        features = [Feature(Point(0, 0), {}), Feature(Point(1, 1), {})]
+        gdf = conversions.features_to_geodataframe(features)
+        result = conversions.geodataframe_to_features(gdf)
+        self.FeaturesEqual(result, features)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+from shapely.geometry import LineString, MultiLineString, Point, Polygon
+from allfed_spatial.features.feature import Feature, compute_lengths
+
+
+class Test_cached_properties(unittest.TestCase):
+
+    def test_line_properties(self):
+        feature = Feature(LineString([(0, 0), (0, 3), (4, 3)]), {})
+        self.assertEqual(feature.bounds, (0, 0, 4, 3))
+        self.assertEqual(feature.length, 7)
+        self.assertEqual(feature.first_coord, (0, 0))
+        self.assertEqual(feature.last_coord, (4, 3))
+        self.assertTrue(feature.centroid.equals(
+            LineString([(0, 0), (0, 3), (4, 3)]).centroid))
+
+    def test_properties_are_cached(self):
+        feature = Feature(LineString([(0, 0), (0, 3)]), {})
+        self.assertIs(feature.centroid, feature.centroid)
+
+    def test_reassigning_geom_invalidates_cache(self):
+        feature = Feature(LineString([(0, 0), (0, 3)]), {})
+        self.assertEqual(feature.length, 3)
+        self.assertEqual(feature.bounds, (0, 0, 0, 3))
+        feature.geom = LineString([(1, 1), (5, 1)])
+        self.assertEqual(feature.length, 4)
+        self.assertEqual(feature.bounds, (1, 1, 5, 1))
+        self.assertEqual(feature.first_coord, (1, 1))
+
+    def test_point_coords(self):
+        feature = Feature(Point(2, 3), {})
+        self.assertEqual(feature.first_coord, (2, 3))
+        self.assertEqual(feature.last_coord, (2, 3))
+        self.assertEqual(feature.length, 0)
+
+
+class Test_update_length(unittest.TestCase):
+
+    def test_metres(self):
+        feature = Feature(LineString([(0, 0), (0, 3000)]), {})
+        feature.update_length()
+        self.assertEqual(feature.data['length'], 3000)
+
+    def test_kilometres(self):
+        feature = Feature(LineString([(0, 0), (0, 3000)]), {})
+        feature.update_length('km')
+        self.assertEqual(feature.data['length'], 3)
+
+    def test_minimum_length(self):
+        feature = Feature(LineString([(0, 0), (0, 0.5)]), {})
+        feature.update_length()
+        self.assertEqual(feature.data['length'], 1)
+
+    def test_uses_reassigned_geom(self):
+        feature = Feature(LineString([(0, 0), (0, 3000)]), {})
+        feature.update_length()
+        feature.geom = LineString([(0, 0), (0, 5000)])
+        feature.update_length()
+        self.assertEqual(feature.data['length'], 5000)
+
+    def test_invalid_unit(self):
+        feature = Feature(LineString([(0, 0), (0, 3000)]), {})
+        with self.assertRaises(ValueError):
+            feature.update_length('miles')
+
+
+class Test_compute_lengths(unittest.TestCase):
+
+    def test_no_features(self):
+        lengths = compute_lengths([])
+        self.assertEqual(len(lengths), 0)
+
+    def test_matches_update_length(self):
+        geoms = [
+            LineString([(0, 0), (0, 3000)]),
+            LineString([(0, 0), (0, 0.5)]),
+            LineString([(0, 0), (3, 4), (3, 10)]),
+        ]
+        features = [Feature(g, {}) for g in geoms]
+        expected = [Feature(g, {}) for g in geoms]
+        for f in expected:
+            f.update_length()
+        compute_lengths(features)
+        for f, e in zip(features, expected):
+            self.assertAlmostEqual(f.data['length'], e.data['length'])
+
+    def test_kilometres_without_minimum(self):
+        features = [
+            Feature(LineString([(0, 0), (0, 3000)]), {}),
+            Feature(LineString([(0, 0), (0, 500)]), {}),
+        ]
+        lengths = compute_lengths(features, unit='km', min_length=None)
+        self.assertEqual(lengths.tolist(), [3, 0.5])
+        self.assertEqual(features[1].data['length'], 0.5)
+
+    def test_multi_part_and_other_geometries(self):
+        features = [
+            Feature(MultiLineString([[(0, 0), (0, 2)], [(5, 5), (5, 8)]]), {}),
+            Feature(Polygon([(0, 0), (0, 2), (2, 2), (2, 0)]), {}),
+            Feature(Point(1, 1), {}),
+        ]
+        lengths = compute_lengths(features, min_length=None)
+        self.assertEqual(lengths.tolist(), [5, 8, 0])
+
+    def test_geodesic(self):
+        # one degree of latitude is ~110.6km at the equator
+        features = [Feature(LineString([(0, 0), (0, 0.5), (0, 1)]), {})]
+        lengths = compute_lengths(features, unit='km', geodesic=True)
+        self.assertAlmostEqual(lengths[0], 110.574, places=2)
+
+    def test_invalid_unit(self):
+        with self.assertRaises(ValueError):
+            compute_lengths([], unit='miles')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+from shapely.geometry import LineString, Point, Polygon
+import allfed_spatial.features.profile as profile
+from allfed_spatial.features.collection import FeatureCollection
+from allfed_spatial.features.feature import Feature
+
+
+class Test_memory_footprint(unittest.TestCase):
+
+    def test_no_features(self):
+        footprint = profile.memory_footprint([])
+        self.assertEqual(footprint['features'], 0)
+        self.assertEqual(footprint['total_bytes'], 0)
+
+    def test_counts(self):
+        shared = {'name': 'road'}
+        features = [
+            Feature(LineString([(0, 0), (1, 1), (2, 2)]), shared),
+            Feature(LineString([(2, 2), (3, 3)]), shared),
+            Feature(Point(0, 0), {'name': 'town'}),
+            Feature(Polygon([(0, 0), (0, 1), (1, 1)]), {}),
+        ]
+        footprint = profile.memory_footprint(features)
+        self.assertEqual(footprint['features'], 4)
+        self.assertEqual(
+            footprint['geom_types'],
+            {'LineString': 2, 'Point': 1, 'Polygon': 1})
+        self.assertEqual(footprint['coordinates'], 10)
+        self.assertEqual(footprint['data_dicts'], 3)
+        self.assertEqual(footprint['index_bytes'], 0)
+        self.assertEqual(
+            footprint['total_bytes'],
+            footprint['geometry_bytes'] + footprint['data_bytes'])
+
+    def test_includes_collection_index(self):
+        collection = FeatureCollection([Feature(Point(0, 0), {})])
+        self.assertEqual(profile.memory_footprint(collection)['index_bytes'], 0)
+        collection.index
+        self.assertGreater(
+            profile.memory_footprint(collection)['index_bytes'], 0)
+
+
+class Test_profile_stage(unittest.TestCase):
+
+    def test_records_stage(self):
+        results = []
+        with profile.profile_stage('build', results, verbose=False) as stats:
+            kept = [Point(i, i) for i in range(1000)]
+        self.assertEqual(results, [stats])
+        self.assertEqual(stats['stage'], 'build')
+        self.assertGreater(stats['allocated_bytes'], 0)
+        self.assertGreaterEqual(
+            stats['peak_allocated_bytes'], stats['allocated_bytes'])
+        self.assertGreaterEqual(stats['seconds'], 0)
+        if profile.resource is not None:
+            self.assertGreater(stats['peak_rss_bytes'], 0)
+        self.assertEqual(len(kept), 1000)
+
+    def test_records_failed_stage(self):
+        results = []
+        with self.assertRaises(ValueError):
+            with profile.profile_stage('fail', results, verbose=False):
+                raise ValueError('failed')
+        self.assertEqual(results[0]['stage'], 'fail')
+
+    def test_nested_stage(self):
+        with profile.profile_stage('outer') as outer:
+            with profile.profile_stage('first'):
+                big = [Point(i, i) for i in range(10000)]
+                del big
+            with profile.profile_stage('second') as inner:
+                small = [Point(i, i) for i in range(10)]
+        # the inner stages can't tell their own peaks from earlier ones
+        self.assertIsNone(inner['peak_allocated_bytes'])
+        self.assertGreater(inner['allocated_bytes'], 0)
+        self.assertGreater(outer['peak_allocated_bytes'], 0)
+        self.assertEqual(len(small), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
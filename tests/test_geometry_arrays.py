@@ -0,0 +1,100 @@
+import unittest
+import allfed_spatial.geometry.arrays as arrays
+from shapely.geometry import LineString, MultiLineString, Point, Polygon
+
+
+class Test_lines_to_coords(unittest.TestCase):
+
+    def test_no_lines(self):
+        coords, offsets = arrays.lines_to_coords([])
+        self.assertEqual(coords.shape, (0, 2))
+        self.assertEqual(offsets.tolist(), [0])
+
+    def test_round_trip(self):
+        lines = [
+            LineString([(0, 0), (0, 1)]),
+            LineString([(1, 1), (2, 2), (3, 1)]),
+        ]
+        coords, offsets = arrays.lines_to_coords(lines)
+        self.assertEqual(coords.shape, (5, 2))
+        self.assertEqual(offsets.tolist(), [0, 2, 5])
+        result = arrays.coords_to_lines(coords, offsets)
+        for line, expected in zip(result, lines):
+            self.assertTrue(line.equals(expected))
+
+    def test_drops_z(self):
+        coords, _ = arrays.lines_to_coords([LineString([(0, 0, 5), (1, 1, 5)])])
+        self.assertEqual(coords.tolist(), [[0, 0], [1, 1]])
+
+
+class Test_linear_parts(unittest.TestCase):
+
+    def test_all_cases(self):
+        self.assertEqual(len(arrays.linear_parts(LineString([(0, 0), (1, 1)]))), 1)
+        self.assertEqual(len(arrays.linear_parts(Point(0, 0))), 0)
+        self.assertEqual(len(arrays.linear_parts(LineString())), 0)
+        self.assertEqual(len(arrays.linear_parts(MultiLineString([
+            [(0, 0), (1, 1)], [(2, 2), (3, 3)]]))), 2)
+        self.assertEqual(len(arrays.linear_parts(Polygon(
+            [(0, 0), (0, 4), (4, 4), (4, 0)],
+            [[(1, 1), (1, 2), (2, 2), (2, 1)]]))), 2)
+
+
+class Test_cumulative_lengths(unittest.TestCase):
+
+    def test_restarts_for_each_line(self):
+        coords, offsets = arrays.lines_to_coords([
+            LineString([(0, 0), (0, 3), (4, 3)]),
+            LineString([(10, 10), (10, 12)]),
+        ])
+        self.assertEqual(
+            arrays.cumulative_lengths(coords, offsets).tolist(),
+            [0, 3, 7, 0, 2])
+        self.assertEqual(
+            arrays.segment_mask(offsets).tolist(),
+            [True, True, False, True])
+
+    def test_empty(self):
+        coords, offsets = arrays.lines_to_coords([])
+        self.assertEqual(len(arrays.cumulative_lengths(coords, offsets)), 0)
+
+    def test_summed_line_by_line(self):
+        lines = [
+            LineString([(0.1 * i, (0.3 * i) ** 2) for i in range(n)])
+            for n in (2, 3, 17, 2, 40, 9)]
+        coords, offsets = arrays.lines_to_coords(lines)
+        expected = []
+        for line in lines:
+            expected.extend(arrays.cumulative_lengths(
+                *arrays.lines_to_coords([line])).tolist())
+            self.assertEqual(expected[-1], line.length)
+        self.assertEqual(
+            arrays.cumulative_lengths(coords, offsets).tolist(), expected)
+
+
+class Test_endpoint_nodes(unittest.TestCase):
+
+    def test_shared_endpoints(self):
+        coords, offsets = arrays.lines_to_coords([
+            LineString([(1, 1), (0, 0)]),
+            LineString([(0, 0), (5, 5), (2, 2)]),
+            LineString([(2, 2), (1, 1.01)]),
+        ])
+        nodes, node_coords = arrays.endpoint_nodes(coords, offsets)
+        self.assertEqual(nodes.tolist(), [[0, 1], [1, 2], [2, 3]])
+        self.assertEqual(
+            node_coords.tolist(), [[1, 1], [0, 0], [2, 2], [1, 1.01]])
+
+        nodes, node_coords = arrays.endpoint_nodes(coords, offsets, 0.1)
+        self.assertEqual(nodes.tolist(), [[0, 1], [1, 2], [2, 0]])
+        self.assertEqual(node_coords.tolist(), [[1, 1], [0, 0], [2, 2]])
+
+    def test_no_lines(self):
+        coords, offsets = arrays.lines_to_coords([])
+        nodes, node_coords = arrays.endpoint_nodes(coords, offsets)
+        self.assertEqual(nodes.shape, (0, 2))
+        self.assertEqual(node_coords.shape, (0, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,11 @@
+import random
 import unittest
+from unittest import mock
+import numpy as np
 import allfed_spatial.geometry.common as common
 from shapely.geometry import Point, LineString, LinearRing, Polygon
 from shapely.geometry.collection import GeometryCollection
+from allfed_spatial.geometry.index import SpatialIndex
 
 class Test_closest(unittest.TestCase):
 
@@ -149,6 +153,217 @@ class Test_closest(unittest.TestCase):
         closest_geometry2 = common.closest(geom, targets2, 1)
         self.assertNotEqual(closest_geometry1, closest_geometry2)
 
+class Test_closest_with_index(unittest.TestCase):
+
+    def assertSameAsWithoutIndex(self, geom, targets, n=1):
+        index = SpatialIndex.from_geoms(targets)
+        self.assertIs(
+            common.closest(geom, targets, n, index=index),
+            common.closest(geom, targets, n))
+
+    def test_point_two_targets(self):
+        geom = Point(0, 0)
+        targets = [Point(1, 1), Point(2, 2)]
+        self.assertSameAsWithoutIndex(geom, targets, 1)
+        self.assertSameAsWithoutIndex(geom, targets, 2)
+
+    def test_polygon_cresent_two_targets(self):
+        geom = Polygon([(1, 1.5), (1, 2), (0, 2), (0, 0), (1, 0), (1, 0.5), (1.1, 0.5), (1.1, -0.1), (-0.1, -0.1), (-0.1, 2.1), (1.1, 2.1), (1.1, 1.5)])
+        targets = [Point(0.5, 1), Point(1.5, 0)]
+        self.assertSameAsWithoutIndex(geom, targets)
+
+    def test_two_equal_targets(self):
+        geom = LineString([(0, 0), (1, 1)])
+        self.assertSameAsWithoutIndex(geom, [Point(0, 0), Point(1, 1)])
+        self.assertSameAsWithoutIndex(geom, [Point(1, 1), Point(0, 0)])
+
+    def test_many_ties(self):
+        geom = Point(0, 0)
+        targets = [Point(x, y) for x in [-1, 0, 1] for y in [-1, 0, 1]]
+        for n in range(1, len(targets) + 1):
+            self.assertSameAsWithoutIndex(geom, targets, n)
+
+    def test_random_lines(self):
+        rng = random.Random(0)
+        targets = []
+        for _ in range(200):
+            x, y = rng.uniform(0, 100), rng.uniform(0, 100)
+            targets.append(LineString(
+                [(x, y), (x + rng.uniform(-10, 10), y + rng.uniform(-10, 10))]))
+        for _ in range(20):
+            geom = Point(rng.uniform(0, 100), rng.uniform(0, 100))
+            self.assertSameAsWithoutIndex(geom, targets, rng.randint(1, 5))
+
+    def test_requesting_too_many_targets_throws(self):
+        targets = [Point(1, 1)]
+        with self.assertRaises(ValueError):
+            common.closest(
+                Point(0, 0), targets, 2, index=SpatialIndex.from_geoms(targets))
+
+class Test_closest_indices(unittest.TestCase):
+
+    def test_points(self):
+        geoms = [Point(0, 0), Point(10, 10)]
+        targets = [Point(1, 1), Point(9, 9), Point(2, 2)]
+        indices, distances = common.closest_indices(geoms, targets, k=2)
+        self.assertEqual(indices.tolist(), [[0, 2], [1, 2]])
+        self.assertAlmostEqual(distances[1, 1], 8 * 2 ** 0.5)
+
+    def test_fewer_targets_than_k(self):
+        indices, distances = common.closest_indices(
+            [Point(0, 0)], [Point(1, 0)], k=2)
+        self.assertEqual(indices.tolist(), [[0, -1]])
+        self.assertEqual(distances.tolist(), [[1, float('inf')]])
+
+    def test_radius(self):
+        geoms = [Point(0, 0)]
+        targets = [Point(10, 0), Point(10, 0.000001), Point(3, 4)]
+        for index in [None, SpatialIndex.from_geoms(targets)]:
+            indices, distances = common.closest_indices(
+                geoms, targets, k=3, radius=10, index=index)
+            self.assertEqual(indices.tolist(), [[2, 0, -1]])
+            self.assertEqual(distances.tolist(), [[5, 10, float('inf')]])
+
+    def test_coordinate_arrays(self):
+        indices, _ = common.closest_indices(
+            np.array([[0, 0], [5, 5]]), np.array([[4, 4], [1, 0]]))
+        self.assertEqual(indices.tolist(), [[1], [0]])
+
+    def test_ties_match_closest(self):
+        geom = Point(0, 0)
+        targets = [Point(x, y) for x in [-1, 0, 1] for y in [-1, 0, 1]]
+        k = len(targets)
+        expected = [
+            targets.index(common.closest(geom, targets, n))
+            for n in range(1, k + 1)]
+        for chunk_size in [2, 100]:
+            indices, _ = common.closest_indices(
+                [geom], targets, k=k, chunk_size=chunk_size)
+            self.assertEqual(indices[0].tolist(), expected)
+        indices, _ = common.closest_indices(
+            [geom], targets, k=k, index=SpatialIndex.from_geoms(targets))
+        self.assertEqual(indices[0].tolist(), expected)
+
+    def test_random_lines_match_closest(self):
+        rng = random.Random(1)
+        targets = []
+        for _ in range(100):
+            x, y = rng.uniform(0, 100), rng.uniform(0, 100)
+            targets.append(LineString(
+                [(x, y), (x + rng.uniform(-10, 10), y + rng.uniform(-10, 10))]))
+        geoms = [
+            Point(rng.uniform(0, 100), rng.uniform(0, 100)) for _ in range(20)]
+        indices, distances = common.closest_indices(geoms, targets, k=3)
+        for row, geom in enumerate(geoms):
+            for n in range(1, 4):
+                self.assertIs(
+                    targets[indices[row, n - 1]],
+                    common.closest(geom, targets, n))
+                self.assertEqual(
+                    distances[row, n - 1],
+                    geom.distance(targets[indices[row, n - 1]]))
+
+    def test_lines_on_grid_match_index(self):
+        rng = random.Random(2)
+        targets = [
+            LineString([(rng.randint(0, 10), rng.randint(0, 10))
+                        for _ in range(rng.randint(2, 4))])
+            for _ in range(50)]
+        geoms = [Point(rng.randint(0, 10), rng.randint(0, 10))
+                 for _ in range(30)]
+        index = SpatialIndex.from_geoms(targets)
+        for k, radius in [(1, None), (4, None), (4, 1.5)]:
+            expected = common.closest_indices(
+                geoms, targets, k, radius, index=index)
+            result = common.closest_indices(geoms, targets, k, radius)
+            self.assertEqual(result[0].tolist(), expected[0].tolist())
+            self.assertEqual(result[1].tolist(), expected[1].tolist())
+
+    def test_grid_matches_brute_force(self):
+        rng = np.random.RandomState(3)
+        targets = np.round(rng.rand(300, 2) * 10)
+        targets[:5] = [40, 3]
+        geoms = np.vstack([rng.rand(200, 2) * 10, [[200, -50], [5, 5]]])
+        flat = np.column_stack([rng.rand(300) * 10, np.full(300, 2.0)])
+        for ts in [targets, flat, targets[:1]]:
+            for k, radius in [(1, None), (4, None), (4, 1.5), (2, 0)]:
+                expected = common.closest_indices(geoms, ts, k, radius)
+                with mock.patch.object(common, 'MAX_BRUTE_FORCE_PAIRS', 0):
+                    result = common.closest_indices(geoms, ts, k, radius)
+                self.assertEqual(result[0].tolist(), expected[0].tolist())
+                self.assertEqual(result[1].tolist(), expected[1].tolist())
+
+class Test_haversine_metric(unittest.TestCase):
+
+    def setUp(self):
+        # at 60 degrees north 0.01 degrees east is about 556m away while
+        # 0.008 degrees north is about 890m away
+        self.geom = Point(0, 60)
+        self.targets = [Point(0, 60.008), Point(0.01, 60)]
+
+    def test_closest(self):
+        index = SpatialIndex.from_geoms(self.targets)
+        for i in [None, index]:
+            self.assertIs(common.closest(self.geom, self.targets, index=i),
+                          self.targets[0])
+            self.assertIs(
+                common.closest(
+                    self.geom, self.targets, index=i, metric='haversine'),
+                self.targets[1])
+
+    def test_closest_within_radius(self):
+        index = SpatialIndex.from_geoms(self.targets)
+        for i in [None, index]:
+            self.assertIs(
+                common.closest_within_radius(
+                    self.geom, self.targets, 600, index=i, metric='haversine'),
+                self.targets[1])
+            self.assertIsNone(common.closest_within_radius(
+                self.geom, self.targets, 500, index=i, metric='haversine'))
+
+    def test_closest_indices(self):
+        rng = random.Random(7)
+        targets = [Point(rng.uniform(0, 1), rng.uniform(59, 61))
+                   for _ in range(100)]
+        lines = [LineString([(p.x, p.y), (p.x + 0.01, p.y + 0.01)])
+                 for p in targets]
+        geoms = [Point(rng.uniform(0, 1), rng.uniform(59, 61))
+                 for _ in range(20)]
+        for ts in [targets, lines]:
+            index = SpatialIndex.from_geoms(ts)
+            for k, radius in [(3, None), (3, 20000)]:
+                brute = common.closest_indices(
+                    geoms, ts, k, radius, metric='haversine')
+                indexed = common.closest_indices(
+                    geoms, ts, k, radius, index=index, metric='haversine')
+                self.assertEqual(brute[0].tolist(), indexed[0].tolist())
+                np.testing.assert_allclose(brute[1], indexed[1])
+                for row, geom in enumerate(geoms):
+                    self.assertIs(
+                        ts[brute[0][row, 0]],
+                        common.closest(geom, ts, metric='haversine'))
+
+    def test_closest_indices_grid(self):
+        rng = np.random.RandomState(8)
+        targets = np.column_stack([
+            (rng.uniform(170, 190, 200) + 180) % 360 - 180,
+            rng.uniform(-80, 80, 200)])
+        geoms = np.column_stack([
+            rng.uniform(-180, 180, 100), rng.uniform(-90, 90, 100)])
+        for k, radius in [(3, None), (3, 500000)]:
+            expected = common.closest_indices(
+                geoms, targets, k, radius, metric='haversine')
+            with mock.patch.object(common, 'MAX_BRUTE_FORCE_PAIRS', 0):
+                result = common.closest_indices(
+                    geoms, targets, k, radius, metric='haversine')
+            self.assertEqual(result[0].tolist(), expected[0].tolist())
+            self.assertEqual(result[1].tolist(), expected[1].tolist())
+
+    def test_invalid_metric(self):
+        with self.assertRaises(ValueError):
+            common.closest(self.geom, self.targets, metric='manhattan')
+
+
 class Test_closest_within_radius(unittest.TestCase):
 
     def test_point_within_radius(self):
@@ -207,6 +422,49 @@ class Test_closest_within_radius(unittest.TestCase):
         with self.assertRaises(ValueError):
             closest_geometry = common.closest_within_radius(geom, targets, 10, 3)
 
+class Test_closest_within_radius_with_index(unittest.TestCase):
+
+    def assertSameAsWithoutIndex(self, geom, targets, radius, n=1):
+        index = SpatialIndex.from_geoms(targets)
+        self.assertIs(
+            common.closest_within_radius(geom, targets, radius, n, index),
+            common.closest_within_radius(geom, targets, radius, n))
+
+    def test_radius_edges(self):
+        geom = Point(0, 0)
+        for targets in [
+                [Point(1, 1)],
+                [Point(100, 100)],
+                [Point(10, 0)],
+                [Point(10, 0.000001)],
+                [Point(0, 0), Point(10, 0)],
+                [Point(0, 0), Point(10, 0.000001)]]:
+            for n in range(1, len(targets) + 1):
+                self.assertSameAsWithoutIndex(geom, targets, 10, n)
+
+    def test_ties(self):
+        geom = LineString([(0, 0), (1, 1)])
+        self.assertSameAsWithoutIndex(geom, [Point(0, 0), Point(1, 1)], 1)
+        self.assertSameAsWithoutIndex(geom, [Point(1, 1), Point(0, 0)], 1)
+
+    def test_random_lines(self):
+        rng = random.Random(2)
+        targets = []
+        for _ in range(200):
+            x, y = rng.uniform(0, 100), rng.uniform(0, 100)
+            targets.append(LineString(
+                [(x, y), (x + rng.uniform(-10, 10), y + rng.uniform(-10, 10))]))
+        for _ in range(20):
+            geom = Point(rng.uniform(0, 100), rng.uniform(0, 100))
+            self.assertSameAsWithoutIndex(
+                geom, targets, rng.uniform(0, 10), rng.randint(1, 3))
+
+    def test_requesting_third_of_two_targets_throws(self):
+        targets = [Point(1, 1), Point(2, 2)]
+        with self.assertRaises(ValueError):
+            common.closest_within_radius(
+                Point(0, 0), targets, 10, 3, SpatialIndex.from_geoms(targets))
+
 class Test_intersects(unittest.TestCase):
 
     def test_different_points_do_not_intersect(self):
@@ -269,6 +527,46 @@ class Test_intersects(unittest.TestCase):
         intersects = common.intersects(geom1, geom2)
         self.assertEqual(intersects, True)
 
+    def test_within_tolerance_intersects(self):
+        geom1 = Point(0, 1e-9)
+        geom2 = LineString([(0, 0), (2, 0)])
+        self.assertEqual(common.intersects(geom1, geom2), True)
+        self.assertEqual(common.intersects(Point(0, 1e-7), geom2), False)
+
+
+class Test_prepared_intersects(unittest.TestCase):
+
+    def test_matches_intersects(self):
+        random.seed(1)
+        geoms = [
+            Polygon([(0, 0), (4, 0), (4, 4), (0, 4)]),
+            LineString([(0, 0), (2, 2), (4, 0)]),
+            LinearRing([(1, 1), (3, 1), (3, 3), (1, 3)]),
+            Point(2, 2),
+            GeometryCollection([Point(0, 0), LineString([(1, 0), (1, 3)])]),
+        ]
+        targets = [
+            Point(4, 4 + 1e-9),
+            Point(2, 2 + 1e-7),
+            LineString([(5, 5), (6, 6)]),
+            LineString([(-1, -1), (-1e-9, -1e-9)]),
+            GeometryCollection([Point(10, 10)]),
+        ]
+        for _ in range(50):
+            x = random.uniform(-1, 5)
+            y = random.uniform(-1, 5)
+            targets.append(LineString([(x, y), (x + random.uniform(-1, 1), y)]))
+            targets.append(Point(x, y))
+        for geom in geoms:
+            predicate = common.prepared_intersects(geom)
+            for target in targets:
+                self.assertEqual(
+                    predicate(target), geom.distance(target) < 1e-8)
+                self.assertEqual(
+                    common.intersects(geom, target),
+                    geom.distance(target) < 1e-8)
+
+
 class Test_closest_non_intersecting_within_radius(unittest.TestCase):
 
     def test_nearest_point_no_intersect(self):
@@ -334,5 +632,56 @@ class Test_closest_non_intersecting_within_radius(unittest.TestCase):
         with self.assertRaises(ValueError):
             closest = common.closest_non_intersecting_within_radius(geom, non_intersect_geom, targets, 10, n=3)
 
+
+class Test_closest_non_intersecting_within_radius_ordering(unittest.TestCase):
+
+    def reference(self, geom, non_intersect_geom, targets, radius, n):
+        # filter every target, then take the nth closest
+        eligible = [
+            t for t in targets if not common.intersects(non_intersect_geom, t)]
+        if len(eligible) == 0:
+            return None
+        most_close = common.closest(geom, eligible, n)
+        if geom.distance(most_close) > radius:
+            return None
+        return most_close
+
+    def test_random_lines(self):
+        rng = random.Random(9)
+        targets = []
+        for _ in range(60):
+            x, y = rng.randint(0, 20), rng.randint(0, 20)
+            targets.append(LineString(
+                [(x, y), (x + rng.randint(-5, 5), y + rng.randint(-5, 5))]))
+        index = SpatialIndex.from_geoms(targets)
+        for _ in range(40):
+            geom = Point(rng.randint(0, 20), rng.randint(0, 20))
+            non_intersect_geom = targets[rng.randrange(len(targets))]
+            for n in [1, 2, 5]:
+                for radius in [1, 3, 50]:
+                    try:
+                        expected = self.reference(
+                            geom, non_intersect_geom, targets, radius, n)
+                    except ValueError:
+                        with self.assertRaises(ValueError):
+                            common.closest_non_intersecting_within_radius(
+                                geom, non_intersect_geom, targets, radius, n)
+                        continue
+                    result = common.closest_non_intersecting_within_radius(
+                        geom, non_intersect_geom, targets, radius, n)
+                    self.assertIs(result, expected)
+                    result = common.closest_non_intersecting_within_radius(
+                        geom, non_intersect_geom, targets, radius, n,
+                        index=index)
+                    self.assertIs(result, expected)
+
+    def test_index_returns_none_when_too_few(self):
+        geom = Point(0, 0)
+        targets = [Point(1, 1), Point(2, 2), Point(3, 3)]
+        index = SpatialIndex.from_geoms(targets)
+        result = common.closest_non_intersecting_within_radius(
+            geom, Point(1, 1), targets, 10, n=3, index=index)
+        self.assertIsNone(result)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
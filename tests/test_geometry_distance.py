@@ -0,0 +1,348 @@
+import math
+import random
+import tempfile
+import unittest
+import numpy as np
+import pyproj
+import allfed_spatial.geometry.common as common
+import allfed_spatial.geometry.distance as distance
+from allfed_spatial.geometry.arrays import lines_to_coords
+from allfed_spatial.geometry.index import SpatialIndex
+from allfed_spatial.geometry.snap import snap_linestrings
+from allfed_spatial.geometry.line import join_points_to_lines
+from shapely.geometry import LineString, LinearRing, Point, Polygon
+
+
+class Test_line_segments(unittest.TestCase):
+
+    def test_segments(self):
+        coords, offsets = lines_to_coords([
+            LineString([(0, 0), (1, 0), (1, 1)]),
+            LineString(),
+            LineString([(5, 5), (6, 6)]),
+        ])
+        starts, ends, segment_offsets = distance.line_segments(coords, offsets)
+        self.assertEqual(starts.tolist(), [[0, 0], [1, 0], [5, 5]])
+        self.assertEqual(ends.tolist(), [[1, 0], [1, 1], [6, 6]])
+        self.assertEqual(segment_offsets.tolist(), [0, 2, 2, 3])
+
+
+class Test_point_line_distances(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(3)
+        self.lines = [
+            LineString([
+                (rng.uniform(0, 10), rng.uniform(0, 10))
+                for _ in range(rng.randint(2, 6))])
+            for _ in range(50)]
+        self.lines.append(LineString([(1, 1), (1, 1), (2, 2)]))
+        self.lines.append(LinearRing([(0, 0), (1, 0), (1, 1)]))
+        self.points = [
+            Point(rng.uniform(-2, 12), rng.uniform(-2, 12)) for _ in range(60)]
+        self.points += [Point(1, 1), Point(0, 0)]
+        self.xy = np.array([p.coords[0] for p in self.points])
+        self.expected = np.array(
+            [[p.distance(l) for l in self.lines] for p in self.points])
+
+    def test_matches_shapely(self):
+        coords, offsets = lines_to_coords(self.lines)
+        for chunk_pairs in [1, 100, distance.DEFAULT_CHUNK_PAIRS]:
+            result = distance.point_line_distances(
+                self.xy, coords, offsets, chunk_pairs)
+            self.assertEqual(result.tolist(), self.expected.tolist())
+
+    def test_empty_lines_are_infinitely_far(self):
+        coords, offsets = lines_to_coords([LineString(), self.lines[0]])
+        result = distance.point_line_distances(self.xy[:1], coords, offsets)
+        self.assertEqual(result[0, 0], float('inf'))
+        self.assertEqual(result[0, 1], self.expected[0, 0])
+
+    def test_nearest_on_lines(self):
+        coords, offsets = lines_to_coords(self.lines)
+        distances, nearest, line_ids = distance.nearest_on_lines(
+            self.xy, coords, offsets, chunk_pairs=100)
+        self.assertEqual(distances.tolist(), self.expected.min(axis=1).tolist())
+        self.assertEqual(
+            line_ids.tolist(), self.expected.argmin(axis=1).tolist())
+        for point, xy, d, line_id in zip(
+                self.points, nearest, distances, line_ids):
+            self.assertAlmostEqual(Point(xy).distance(point), d)
+            self.assertAlmostEqual(Point(xy).distance(self.lines[line_id]), 0)
+
+    def test_nearest_without_lines(self):
+        coords, offsets = lines_to_coords([])
+        distances, nearest, line_ids = distance.nearest_on_lines(
+            self.xy[:2], coords, offsets)
+        self.assertEqual(distances.tolist(), [float('inf')] * 2)
+        self.assertTrue(np.isnan(nearest).all())
+        self.assertEqual(line_ids.tolist(), [-1, -1])
+
+
+    def test_nearest_segments_matches_brute_force(self):
+        coords, offsets = lines_to_coords(self.lines)
+        starts, ends, segment_offsets = distance.line_segments(
+            coords, offsets)
+        owners = np.repeat(
+            np.arange(len(self.lines)), np.diff(segment_offsets))
+        for metric in distance.METRICS:
+            expected = distance.nearest_on_lines(
+                self.xy, coords, offsets, metric=metric)
+            distances, nearest, segment_ids, fractions = \
+                distance.nearest_segments(
+                    self.xy, starts, ends, batch_size=7, metric=metric)
+            self.assertEqual(distances.tolist(), expected[0].tolist())
+            self.assertEqual(nearest.tolist(), expected[1].tolist())
+            self.assertEqual(
+                owners[segment_ids].tolist(), expected[2].tolist())
+            self.assertTrue(((fractions >= 0) & (fractions <= 1)).all())
+
+    def test_nearest_segments_without_segments(self):
+        distances, nearest, segment_ids, fractions = \
+            distance.nearest_segments(self.xy[:2], np.empty((0, 2)),
+                                      np.empty((0, 2)))
+        self.assertEqual(distances.tolist(), [float('inf')] * 2)
+        self.assertTrue(np.isnan(nearest).all())
+        self.assertEqual(segment_ids.tolist(), [-1, -1])
+
+class Test_haversine(unittest.TestCase):
+
+    def test_one_degree(self):
+        result = distance.haversine_distances([0, 0], [0, 1])
+        self.assertAlmostEqual(
+            result, distance.EARTH_RADIUS * math.pi / 180, places=6)
+
+    def test_matches_geodesic(self):
+        geod = pyproj.Geod(ellps='WGS84')
+        rng = random.Random(4)
+        for _ in range(20):
+            lon, lat = rng.uniform(-180, 180), rng.uniform(-80, 80)
+            lon2, lat2 = lon + rng.uniform(-1, 1), lat + rng.uniform(-1, 1)
+            _, _, expected = geod.inv(lon, lat, lon2, lat2)
+            result = distance.haversine_distances([lon, lat], [lon2, lat2])
+            self.assertLess(abs(result - expected), expected * 0.006)
+
+    def test_across_antimeridian(self):
+        result = distance.geom_distance(
+            Point(179.999, 0), Point(-179.999, 0), 'haversine')
+        self.assertAlmostEqual(result, 222.39, places=1)
+
+    def test_point_to_line(self):
+        line = LineString([(-1, 60), (1, 60)])
+        point = Point(0.5, 60.001)
+        expected = distance.haversine_distances([0.5, 60], [0.5, 60.001])
+        self.assertAlmostEqual(
+            distance.geom_distance(point, line, 'haversine'), expected, 3)
+        self.assertAlmostEqual(
+            distance.geom_distance(line, point, 'haversine'), expected, 3)
+        nearest = distance.nearest_point(point, line, 'haversine')
+        self.assertAlmostEqual(nearest.x, 0.5)
+        self.assertAlmostEqual(nearest.y, 60)
+
+    def test_kernel_matches_geom_distance(self):
+        rng = random.Random(5)
+        lines = [
+            LineString([
+                (10 + rng.uniform(0, 0.1), 50 + rng.uniform(0, 0.1))
+                for _ in range(3)])
+            for _ in range(20)]
+        points = np.array([
+            (10 + rng.uniform(0, 0.1), 50 + rng.uniform(0, 0.1))
+            for _ in range(20)])
+        coords, offsets = lines_to_coords(lines)
+        result = distance.point_line_distances(
+            points, coords, offsets, metric='haversine')
+        for row, xy in enumerate(points):
+            for column, line in enumerate(lines):
+                self.assertAlmostEqual(
+                    result[row, column],
+                    distance.geom_distance(Point(xy), line, 'haversine'), 3)
+
+    def test_invalid_metric(self):
+        with self.assertRaises(ValueError):
+            distance.geom_distance(Point(0, 0), Point(1, 1), 'manhattan')
+
+
+class Test_search_bounds(unittest.TestCase):
+
+    def test_contains_everything_within_distance(self):
+        rng = random.Random(6)
+        for lat in [0, 45, 80, -89.9]:
+            bounds = distance.search_bounds((10, lat, 10, lat), 50000, 'haversine')
+            for _ in range(200):
+                lon2 = 10 + rng.uniform(-5, 5)
+                lat2 = max(min(lat + rng.uniform(-0.5, 0.5), 90), -90)
+                if distance.haversine_distances([10, lat], [lon2, lat2]) <= 50000:
+                    self.assertTrue(bounds[0] <= lon2 <= bounds[2])
+                    self.assertTrue(bounds[1] <= lat2 <= bounds[3])
+
+    def test_reaches_pole(self):
+        bounds = distance.search_bounds((0, 89, 0, 89), 200000, 'haversine')
+        self.assertEqual(bounds[0], -180)
+        self.assertEqual(bounds[2], 180)
+        self.assertEqual(bounds[3], 90)
+
+    def test_euclidean(self):
+        bounds = distance.search_bounds((0, 0, 1, 1), 1)
+        self.assertAlmostEqual(bounds[0], -1)
+        self.assertAlmostEqual(bounds[3], 2)
+
+    def test_antimeridian(self):
+        boxes = distance.search_boxes(
+            (179.999, 0, 179.999, 0), 1000, 'haversine')
+        self.assertEqual(len(boxes), 2)
+        self.assertEqual(boxes[0][2], 180)
+        self.assertEqual(boxes[1][0], -180)
+        self.assertTrue(boxes[1][0] <= -179.999 <= boxes[1][2])
+        bounds = distance.search_bounds(
+            (179.999, 0, 179.999, 0), 1000, 'haversine')
+        self.assertEqual((bounds[0], bounds[2]), (-180, 180))
+
+        boxes = distance.search_boxes(
+            (-179.999, 0, -179.999, 0), 1000, 'haversine')
+        self.assertEqual(len(boxes), 2)
+        self.assertTrue(boxes[1][0] <= 179.999 <= boxes[1][2])
+        self.assertEqual(
+            len(distance.search_boxes((10, 0, 10, 0), 1000, 'haversine')), 1)
+
+
+class Test_haversine_workflows(unittest.TestCase):
+
+    def test_index_across_antimeridian(self):
+        targets = [Point(-179.999, 0), Point(179.9, 0)]
+        query = Point(179.999, 0)
+        index = SpatialIndex.from_geoms(targets)
+        self.assertIs(
+            common.closest(query, targets, index=index, metric='haversine'),
+            targets[0])
+        self.assertIs(
+            common.closest_within_radius(
+                query, targets, 1000, index=index, metric='haversine'),
+            targets[0])
+        for radius in (None, 1000):
+            indices, _ = common.closest_indices(
+                [query], targets, radius=radius, index=index,
+                metric='haversine')
+            self.assertEqual(indices.tolist(), [[0]])
+
+    def test_snap_lonlat_lines(self):
+        # lines 5m apart at the equator, snapped within 10m
+        gap = 5 / (distance.EARTH_RADIUS * math.pi / 180)
+        lines = [
+            LineString([(0, 0), (0.01, 0)]),
+            LineString([(0.01 + gap, 0), (0.02, 0)]),
+        ]
+        result = snap_linestrings(10, list(lines), metric='haversine')
+        self.assertEqual(result[0].coords[-1], (0.01 + gap, 0))
+        result = snap_linestrings(1, list(lines), metric='haversine')
+        self.assertEqual(len(result[0].coords), 2)
+
+    def test_join_lonlat_points(self):
+        # at 60 degrees north a degree of longitude is half a degree of
+        # latitude, so the eastern line end is nearer
+        lines = [
+            LineString([(0.01, 60), (1, 60)]),
+            LineString([(0, 60.008), (0, 61)]),
+        ]
+        result = join_points_to_lines(
+            [Point(0, 60)], lines, metric='haversine')
+        self.assertEqual(result[0].coords[-1], (0.01, 60))
+        result = join_points_to_lines([Point(0, 60)], lines)
+        self.assertEqual(result[0].coords[-1], (0, 60.008))
+
+
+class Test_distance_matrix(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(8)
+        self.sources = [
+            Point(rng.uniform(0, 10), rng.uniform(0, 10)) for _ in range(30)]
+        self.sinks = [
+            Point(rng.uniform(0, 10), rng.uniform(0, 10)) for _ in range(20)]
+        self.lines = [
+            LineString([(p.x, p.y), (p.x + 1, p.y - 1)]) for p in self.sinks]
+
+    def expected(self, sources, sinks):
+        return np.array([[s.distance(t) for t in sinks] for s in sources])
+
+    def assertCSREqual(self, result, dense, max_distance):
+        self.assertEqual(result.shape, dense.shape)
+        self.assertEqual(len(result.indptr), dense.shape[0] + 1)
+        for row in range(dense.shape[0]):
+            columns = slice(result.indptr[row], result.indptr[row + 1])
+            expected_columns = np.nonzero(dense[row] <= max_distance)[0]
+            self.assertEqual(
+                result.indices[columns].tolist(), expected_columns.tolist())
+            self.assertEqual(
+                result.data[columns].tolist(),
+                dense[row, expected_columns].tolist())
+
+    def test_dense_points(self):
+        for chunk_pairs in [7, distance.DEFAULT_CHUNK_PAIRS]:
+            result = distance.distance_matrix(
+                self.sources, self.sinks, chunk_pairs=chunk_pairs)
+            self.assertEqual(
+                result.tolist(),
+                self.expected(self.sources, self.sinks).tolist())
+
+    def test_dense_points_and_lines(self):
+        result = distance.distance_matrix(
+            self.sources, self.lines, chunk_pairs=50)
+        expected = self.expected(self.sources, self.lines)
+        self.assertEqual(result.tolist(), expected.tolist())
+        result = distance.distance_matrix(
+            self.lines, self.sources, chunk_pairs=50)
+        self.assertEqual(result.tolist(), expected.T.tolist())
+
+    def test_other_geometries(self):
+        sinks = [Polygon([(0, 0), (0, 2), (2, 2)]), LineString(), Point(5, 5)]
+        expected = self.expected(self.sources, sinks)
+        # empty geometries are infinitely far away
+        expected[:, 1] = np.inf
+        result = distance.distance_matrix(self.sources, sinks)
+        self.assertEqual(result.tolist(), expected.tolist())
+        result = distance.distance_matrix(self.sources, sinks, max_distance=3)
+        self.assertCSREqual(result, expected, 3)
+
+    def test_coordinate_arrays(self):
+        result = distance.distance_matrix(
+            np.array([[0, 0], [1, 1]]), np.array([[3, 4]]))
+        self.assertEqual(result.tolist(), [[5], [13 ** 0.5]])
+
+    def test_sparse(self):
+        expected = self.expected(self.sources, self.sinks)
+        for chunk_pairs in [7, distance.DEFAULT_CHUNK_PAIRS]:
+            result = distance.distance_matrix(
+                self.sources, self.sinks, max_distance=4,
+                chunk_pairs=chunk_pairs)
+            self.assertCSREqual(result, expected, 4)
+
+    def test_spills_to_disk(self):
+        expected = self.expected(self.sources, self.lines)
+        with tempfile.TemporaryDirectory() as spill_dir:
+            result = distance.distance_matrix(
+                self.sources, self.lines, ram_budget=100, spill_dir=spill_dir,
+                chunk_pairs=50)
+            self.assertIsInstance(result, np.memmap)
+            self.assertEqual(result.tolist(), expected.tolist())
+            result = distance.distance_matrix(
+                self.sources, self.lines, max_distance=5, ram_budget=100,
+                spill_dir=spill_dir, chunk_pairs=50)
+            self.assertIsInstance(result.data, np.memmap)
+            self.assertIsInstance(result.indices, np.memmap)
+            self.assertCSREqual(result, expected, 5)
+            del result
+
+    def test_haversine(self):
+        sources = [Point(0, 60), Point(1, 61)]
+        sinks = [Point(0, 60.5), Point(1, 60)]
+        result = distance.distance_matrix(sources, sinks, metric='haversine')
+        for row, source in enumerate(sources):
+            for column, sink in enumerate(sinks):
+                self.assertAlmostEqual(
+                    result[row, column],
+                    distance.geom_distance(source, sink, 'haversine'), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
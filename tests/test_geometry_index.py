@@ -0,0 +1,147 @@
+import os
+import tempfile
+import unittest
+from shapely.geometry import LineString, Point
+from allfed_spatial.geometry.index import SpatialIndex
+from allfed_spatial.geometry.snap import snap_features, snap_linestrings
+from allfed_spatial.features.collection import FeatureCollection
+from allfed_spatial.features.feature import Feature
+from tests.test_geometry_line import LineBaseTest
+
+
+class Test_SpatialIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.geoms = [
+            LineString([(0, 0), (1, 1)]),
+            Point(5, 5),
+            LineString(),
+            LineString([(10, 10), (12, 12)]),
+        ]
+
+    def test_empty(self):
+        index = SpatialIndex.from_geoms([])
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.intersection((0, 0, 1, 1)), [])
+
+    def test_intersection(self):
+        for bulk_load in [True, False]:
+            index = SpatialIndex.from_geoms(self.geoms, bulk_load)
+            self.assertEqual(len(index), 4)
+            self.assertEqual(sorted(index.intersection((0, 0, 6, 6))), [0, 1])
+            self.assertEqual(index.intersection((100, 100, 101, 101)), [])
+
+    def test_nearest(self):
+        index = SpatialIndex.from_geoms(self.geoms)
+        self.assertEqual(index.nearest((9, 9, 9, 9)), [3])
+
+    def test_update_and_insert(self):
+        index = SpatialIndex.from_geoms(self.geoms)
+        index.update(1, (20, 20, 20, 20))
+        index.update(2, (0, 0, 0, 0))
+        self.assertEqual(sorted(index.intersection((0, 0, 6, 6))), [0, 2])
+        new_id = index.insert((30, 30, 31, 31))
+        self.assertEqual(new_id, 4)
+        self.assertEqual(len(index), 5)
+        self.assertEqual(index.intersection((30, 30, 30, 30)), [4])
+
+    def test_save_and_load(self):
+        index = SpatialIndex.from_geoms(self.geoms)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'index.npy')
+            index.save(path)
+            loaded = SpatialIndex.load(path)
+        self.assertEqual(len(loaded), 4)
+        self.assertEqual(sorted(loaded.intersection((0, 0, 6, 6))), [0, 1])
+
+
+class Test_FeatureCollection(unittest.TestCase):
+
+    def test_index_follows_changes(self):
+        collection = FeatureCollection([
+            Feature(Point(0, 0), {}),
+            Feature(Point(5, 5), {}),
+        ])
+        self.assertEqual(collection.index.intersection((4, 4, 6, 6)), [1])
+        collection.update_geom(1, Point(50, 50))
+        self.assertEqual(collection.index.intersection((4, 4, 6, 6)), [])
+        collection.append(Feature(Point(5, 5), {}))
+        self.assertEqual(collection.index.intersection((4, 4, 6, 6)), [2])
+        collection[0] = Feature(Point(4, 4), {})
+        self.assertEqual(
+            sorted(collection.index.intersection((4, 4, 6, 6))), [0, 2])
+
+    def test_reordering_rebuilds_index(self):
+        collection = FeatureCollection([
+            Feature(Point(0, 0), {}),
+            Feature(Point(5, 5), {}),
+        ])
+        self.assertEqual(collection.index.intersection((4, 4, 6, 6)), [1])
+        collection.reverse()
+        self.assertEqual(collection.index.intersection((4, 4, 6, 6)), [0])
+        del collection[0]
+        self.assertEqual(collection.index.intersection((4, 4, 6, 6)), [])
+
+    def test_repeat_rebuilds_index(self):
+        collection = FeatureCollection([
+            Feature(Point(0, 0), {}),
+            Feature(Point(5, 5), {}),
+        ])
+        self.assertEqual(len(collection.index), 2)
+        collection *= 2
+        self.assertEqual(len(collection), 4)
+        self.assertEqual(
+            sorted(collection.index.intersection((4, 4, 6, 6))), [1, 3])
+
+    def test_index_rebuilt_when_out_of_step(self):
+        collection = FeatureCollection([Feature(Point(0, 0), {})])
+        self.assertEqual(len(collection.index), 1)
+        list.append(collection, Feature(Point(5, 5), {}))
+        self.assertEqual(collection.index.intersection((4, 4, 6, 6)), [1])
+
+    def test_attach_index(self):
+        collection = FeatureCollection([Feature(Point(0, 0), {})])
+        with self.assertRaises(ValueError):
+            collection.index = SpatialIndex.from_geoms([])
+
+
+class Test_prebuilt_index(LineBaseTest):
+
+    def test_snap_with_index(self):
+        lines = [
+            LineString([(0, 0), (100, 100)]),
+            LineString([(0, -100), (0, -5)])
+        ]
+        index = SpatialIndex.from_geoms(lines)
+        result = snap_linestrings(10, lines, index)
+        self.LinesEquivalent(result, [
+            LineString([(0, -5), (0, 0), (100, 100)]),
+            LineString([(0, -100), (0, -5)])
+        ])
+        self.assertEqual(tuple(index.bounds[0]), result[0].bounds)
+
+    def test_snap_features_with_collection_index(self):
+        collection = FeatureCollection([
+            Feature(LineString([(0, 0), (100, 100)]), {}),
+            Feature(LineString([(0, -100), (0, -5)]), {}),
+        ])
+        result = snap_features(10, collection, collection.index)
+        self.LineEquivalent(
+            result[0].geom, LineString([(0, -5), (0, 0), (100, 100)]))
+        # the collection and its index are left as they were
+        self.assertEqual(collection[0].geom.bounds, (0, 0, 100, 100))
+        self.assertEqual(
+            tuple(collection.index.bounds[0]), collection[0].geom.bounds)
+        self.assertEqual(collection.index.intersection((50, -4, 60, -1)), [])
+
+    def test_copy(self):
+        index = SpatialIndex([(0, 0, 1, 1), (5, 5, 6, 6)])
+        copied = index.copy()
+        copied.update(0, (10, 10, 11, 11))
+        self.assertEqual(index.intersection((0, 0, 1, 1)), [0])
+        self.assertEqual(copied.intersection((0, 0, 1, 1)), [])
+        self.assertEqual(len(copied), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
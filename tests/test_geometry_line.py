@@ -1,4 +1,5 @@
 import unittest
+import numpy as np
 import allfed_spatial.geometry.line as geometry_line
 from shapely.geometry import Point, LineString, MultiLineString
 from allfed_spatial.features.feature import Feature
@@ -178,6 +179,112 @@ class Test_frechet_distance(LineBaseTest):
             3,
             "Expected distance to be at least 3 (minimum possible distance)")
 
+    def test_coordinate_inputs(self):
+        points1 = [(1, 0), (1, 1), (1, 2), (1, 3), (1, 4), (3, 4), (3, 6),
+                   (1, 6), (1, 7)]
+        points2 = [(0, 0), (0, -2), (2, -2), (0, 2), (0, 7)]
+        expected = 5.3601081243155395
+        self.assertEqual(
+            geometry_line.frechet_distance(points1, points2), expected)
+        self.assertEqual(
+            geometry_line.frechet_distance(
+                [Point(p) for p in points1], [Point(p) for p in points2]),
+            expected)
+        self.assertEqual(
+            geometry_line.frechet_distance(
+                np.array(points1), np.array(points2)),
+            expected)
+
+    def test_zero_length_line(self):
+        distance = geometry_line.frechet_distance(
+            [Point(0, 0), Point(0, 0)], [Point(1, 0), Point(3, 4)])
+        self.assertEqual(distance, 5)
+
+    def test_single_point_line(self):
+        with self.assertRaises(ValueError):
+            geometry_line.frechet_distance([Point(0, 0)], [Point(1, 0)])
+
+
+class Test_discrete_frechet_distance(LineBaseTest):
+
+    def brute_force(self, points1, points2):
+        coupling = {}
+        for i, p in enumerate(points1):
+            for j, q in enumerate(points2):
+                d = np.hypot(p[0] - q[0], p[1] - q[1])
+                previous = [coupling[c] for c in [
+                    (i - 1, j), (i, j - 1), (i - 1, j - 1)] if c in coupling]
+                coupling[(i, j)] = max(d, min(previous)) if previous else d
+        return coupling[(len(points1) - 1, len(points2) - 1)]
+
+    def test_known_distance(self):
+        points1 = [(0, 0), (1, 0), (2, 0)]
+        points2 = [(0, 1), (2, 1)]
+        self.assertEqual(
+            geometry_line.discrete_frechet_distance(points1, points2),
+            np.sqrt(2))
+        self.assertEqual(
+            geometry_line.discrete_frechet_distance(
+                [Point(p) for p in points1], np.array(points2)),
+            np.sqrt(2))
+
+    def test_single_points(self):
+        self.assertEqual(
+            geometry_line.discrete_frechet_distance(
+                [(0, 0)], [(3, 4), (0, 1)]), 5)
+        with self.assertRaises(ValueError):
+            geometry_line.discrete_frechet_distance([], [(0, 0)])
+
+    def test_matches_brute_force(self):
+        rng = np.random.RandomState(0)
+        for _ in range(200):
+            points1 = rng.rand(rng.randint(1, 8), 2) * 10
+            points2 = rng.rand(rng.randint(1, 8), 2) * 10
+            expected = self.brute_force(points1, points2)
+            self.assertAlmostEqual(
+                geometry_line.discrete_frechet_distance(points1, points2),
+                expected)
+            self.assertAlmostEqual(
+                geometry_line.discrete_frechet_distance(points2, points1),
+                expected)
+
+    def test_threshold(self):
+        rng = np.random.RandomState(1)
+        for _ in range(200):
+            points1 = rng.rand(rng.randint(1, 8), 2) * 10
+            points2 = rng.rand(rng.randint(1, 8), 2) * 10
+            threshold = rng.rand() * 10
+            expected = self.brute_force(points1, points2)
+            distance = geometry_line.discrete_frechet_distance(
+                points1, points2, threshold=threshold)
+            if expected > threshold:
+                self.assertEqual(distance, np.inf)
+            else:
+                self.assertAlmostEqual(distance, expected)
+
+    def test_threshold_long_lines(self):
+        rng = np.random.RandomState(2)
+        for _ in range(20):
+            points1 = np.cumsum(rng.randn(rng.randint(50, 200), 2), axis=0)
+            points2 = points1[::rng.randint(1, 4)] + rng.randn(1, 2)
+            points2 = points2 + rng.randn(*points2.shape) * 0.5
+            expected = geometry_line.discrete_frechet_distance(
+                points1, points2)
+            for threshold in [expected * 0.9, expected, expected * 1.5]:
+                distance = geometry_line.discrete_frechet_distance(
+                    points1, points2, threshold=threshold)
+                self.assertEqual(
+                    distance, expected if expected <= threshold else np.inf)
+
+    def test_threshold_stops_early(self):
+        points1 = np.column_stack([np.arange(1000.0), np.zeros(1000)])
+        points2 = points1 + [0, 100]
+        self.assertEqual(
+            geometry_line.discrete_frechet_distance(
+                points1, points2, threshold=50), np.inf)
+        self.assertEqual(
+            geometry_line.discrete_frechet_distance(points1, points2), 100)
+
 class Test_make_points_on_line(LineBaseTest):
 
     def test_not_a_line(self):
@@ -296,6 +403,48 @@ class Test_make_points_on_line(LineBaseTest):
                 Point(1, 0.8)
             ])
 
+class Test_make_points_on_lines(LineBaseTest):
+
+    def test_no_lines(self):
+        coords, offsets = geometry_line.make_points_on_lines([], 1)
+        self.assertEqual(coords.shape, (0, 2))
+        self.assertEqual(list(offsets), [0])
+
+    def test_not_a_line(self):
+        with self.assertRaises(ValueError):
+            geometry_line.make_points_on_lines([Point(0, 0)], 1)
+
+    def test_as_array(self):
+        line = LineString([(0, 0), (0, 1), (1, 1)])
+        coords = geometry_line.make_points_on_line(line, 0.5, as_array=True)
+        self.assertEqual(coords.tolist(), [[0, 0.5], [0, 1], [0.5, 1]])
+
+    def test_multiple_lines(self):
+        lines = [
+            LineString([(0, 0), (2, 0)]),
+            MultiLineString([[(0, 0), (0, 1)], [(5, 5), (5, 5), (5, 8)]]),
+            LineString([(1, 1), (1, 1)]),
+        ]
+        coords, offsets = geometry_line.make_points_on_lines(lines, 1)
+        self.assertEqual(list(offsets), [0, 1, 4, 5])
+        self.assertEqual(
+            coords.tolist(),
+            [[1, 0], [0, 0.5], [5, 6], [5, 7], [1, 1]])
+
+    def test_matches_interpolate(self):
+        rng = np.random.RandomState(0)
+        lines = [LineString(rng.rand(rng.randint(2, 10), 2) * 100)
+                 for _ in range(20)]
+        coords, offsets = geometry_line.make_points_on_lines(lines, 7)
+        for line, start, end in zip(lines, offsets[:-1], offsets[1:]):
+            count = end - start
+            expected = [
+                line.interpolate(
+                    n * (1 / (count + 1)), normalized=True).coords[0]
+                for n in range(1, count + 1)]
+            self.assertEqual([tuple(c) for c in coords[start:end]], expected)
+
+
 class Test_split_line_by_distance(LineBaseTest):
     def test_halve_a_line(self):
         line = LineString([Point(0, 0), Point(0, 1)])
@@ -365,6 +514,57 @@ class Test_split_line_by_distance(LineBaseTest):
                 LineString([(0, 1), (1, 1)])
             ])
 
+    def test_split_exactly(self):
+        line = LineString([(0, 0), (0, 1), (1, 1)])
+        splitLines = geometry_line.split_line_by_distance(line, 1)
+        self.assertEqual(
+            [list(l.coords) for l in splitLines],
+            [[(0, 0), (0, 1)], [(0, 1), (1, 1)]])
+
+    def test_pieces_share_split_points(self):
+        rng = np.random.RandomState(0)
+        line = LineString(np.cumsum(rng.rand(50, 2), axis=0))
+        splitLines = geometry_line.split_line_by_distance(line, 3)
+        self.assertEqual(splitLines[0].coords[0], line.coords[0])
+        self.assertEqual(splitLines[-1].coords[-1], line.coords[-1])
+        for line1, line2 in zip(splitLines[:-1], splitLines[1:]):
+            self.assertEqual(line1.coords[-1], line2.coords[0])
+        self.assertAlmostEqual(
+            sum(l.length for l in splitLines), line.length)
+
+    def test_short_line(self):
+        line = LineString([(0, 0), (0, 1)])
+        self.assertEqual(
+            geometry_line.split_line_by_distance(line, 2), [line])
+
+
+class Test_split_lines_by_distance(LineBaseTest):
+
+    def test_no_lines(self):
+        coords, offsets, owners = geometry_line.split_lines_by_distance(
+            [], 1)
+        self.assertEqual(coords.shape, (0, 2))
+        self.assertEqual(list(offsets), [0])
+        self.assertEqual(list(owners), [])
+
+    def test_multiple_lines(self):
+        lines = [
+            LineString([(0, 0), (0, 1)]),
+            LineString([(0, 0), (0, 0.5)]),
+            MultiLineString([[(0, 0), (2, 0)], [(5, 5), (5, 5.5)]]),
+        ]
+        coords, offsets, owners = geometry_line.split_lines_by_distance(
+            lines, 1)
+        self.assertEqual(list(owners), [0, 0, 1, 2, 2, 2, 2])
+        self.assertEqual(
+            [coords[start:end].tolist()
+             for start, end in zip(offsets[:-1], offsets[1:])],
+            [[[0, 0], [0, 0.5]], [[0, 0.5], [0, 1]],
+             [[0, 0], [0, 0.5]],
+             [[0, 0], [1, 0]], [[1, 0], [2, 0]],
+             [[5, 5], [5, 5.25]], [[5, 5.25], [5, 5.5]]])
+
+
 class Test_split_features_by_distance(LineBaseTest):
     def test_empty_list(self):
         features = []
@@ -414,6 +614,148 @@ class Test_split_features_by_distance(LineBaseTest):
             Feature(LineString([(0, 3), (0, 3.75)]), test_data3)
         ])
 
+class Test_iter_split_features_by_distance(LineBaseTest):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.features = [
+            Feature(LineString(np.cumsum(rng.rand(10, 2), axis=0)), {'i': i})
+            for i in range(20)
+        ]
+        self.features[3] = Feature(Point(0, 0), {'i': 3})
+        self.features[7] = Feature(LineString([(0, 0), (0, 0.1)]), {'i': 7})
+
+    def test_streams_generator(self):
+        result = geometry_line.iter_split_features_by_distance(
+            (f for f in self.features), 1, chunk_size=3)
+        self.assertFalse(isinstance(result, list))
+        self.FeaturesEqual(
+            list(result),
+            geometry_line.split_features_by_distance(self.features, 1))
+
+    def test_keeps_short_features(self):
+        result = list(geometry_line.iter_split_features_by_distance(
+            self.features, 1, chunk_size=4))
+        kept = [f for f in result if f.data['i'] in (3, 7)]
+        self.assertEqual([f.geom for f in kept], [
+            self.features[3].geom, self.features[7].geom])
+
+    def test_processes(self):
+        expected = geometry_line.split_features_by_distance(
+            self.features, 1)
+        result = list(geometry_line.iter_split_features_by_distance(
+            iter(self.features), 1, processes=2, chunk_size=2))
+        self.assertEqual(len(result), len(expected))
+        for f1, f2 in zip(result, expected):
+            self.assertTrue(f1.geom.equals_exact(f2.geom, 0))
+            self.assertEqual(f1.data, f2.data)
+
+
+class Test_simplify_lines(LineBaseTest):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.lines = [
+            LineString(np.cumsum(rng.randn(rng.randint(2, 30), 2), axis=0))
+            for _ in range(50)]
+
+    def visvalingam(self, coords, tolerance):
+        coords = [tuple(c) for c in coords]
+        while len(coords) > 2:
+            areas = [
+                abs(((c[0] - a[0]) * (b[1] - a[1]) -
+                     (b[0] - a[0]) * (c[1] - a[1])) / 2.0)
+                for a, b, c in zip(coords[:-2], coords[1:-1], coords[2:])]
+            smallest = min(areas)
+            if smallest >= tolerance * tolerance:
+                break
+            del coords[areas.index(smallest) + 1]
+        return coords
+
+    def test_douglas_peucker_matches_shapely(self):
+        for tolerance in [0.1, 1, 5]:
+            result, _ = geometry_line.simplify_lines(
+                self.lines, tolerance, chunk_size=7)
+            for line, simplified in zip(self.lines, result):
+                self.assertEqual(
+                    list(simplified.coords),
+                    list(line.simplify(
+                        tolerance, preserve_topology=False).coords))
+
+    def test_visvalingam(self):
+        for tolerance in [0.1, 1, 5]:
+            result, _ = geometry_line.simplify_lines(
+                self.lines, tolerance, geometry_line.VISVALINGAM)
+            for line, simplified in zip(self.lines, result):
+                self.assertEqual(
+                    list(simplified.coords),
+                    self.visvalingam(line.coords, tolerance))
+
+    def test_keeps_endpoints(self):
+        lines = [
+            LineString([(0, 0), (1, 0.01), (2, 0)]),
+            MultiLineString([[(0, 0), (1, 0), (2, 0)], [(5, 5), (6, 6)]]),
+            LineString([(0, 0), (0, 0)]),
+        ]
+        for method in geometry_line.SIMPLIFY_METHODS:
+            result, stats = geometry_line.simplify_lines(lines, 1, method)
+            self.assertEqual(list(result[0].coords), [(0, 0), (2, 0)])
+            self.assertEqual(result[1].geom_type, 'MultiLineString')
+            self.assertEqual(
+                [list(l.coords) for l in result[1].geoms],
+                [[(0, 0), (2, 0)], [(5, 5), (6, 6)]])
+            self.assertEqual(list(result[2].coords), [(0, 0), (0, 0)])
+            self.assertEqual(stats, {
+                'lines': 3,
+                'vertices_before': 10,
+                'vertices_after': 8,
+                'vertices_removed': 2,
+            })
+
+    def test_simplify_coords(self):
+        coords = np.array(
+            [[0, 0], [1, 0.01], [2, 0], [5, 5], [5, 6], [6, 6]], dtype=float)
+        offsets = np.array([0, 3, 3, 6])
+        simplified, simplified_offsets = geometry_line.simplify_coords(
+            coords, offsets, 1)
+        self.assertEqual(
+            simplified.tolist(), [[0, 0], [2, 0], [5, 5], [6, 6]])
+        self.assertEqual(simplified_offsets.tolist(), [0, 2, 2, 4])
+
+    def test_processes(self):
+        expected, _ = geometry_line.simplify_lines(self.lines, 1)
+        result, _ = geometry_line.simplify_lines(
+            self.lines, 1, processes=2, chunk_size=10)
+        self.assertEqual(
+            [list(l.coords) for l in result],
+            [list(l.coords) for l in expected])
+
+    def test_invalid_method(self):
+        with self.assertRaises(ValueError):
+            geometry_line.simplify_lines(self.lines, 1, 'nope')
+
+
+class Test_densify_coords(LineBaseTest):
+
+    def test_densify_coords(self):
+        coords = np.array(
+            [[0, 0], [6, 0], [6, 1], [5, 5], [5, 9]], dtype=float)
+        offsets = np.array([0, 3, 3, 5])
+        dense, dense_offsets = geometry_line.densify_coords(
+            coords, offsets, 2)
+        self.assertEqual(
+            dense.tolist(),
+            [[0, 0], [2, 0], [4, 0], [6, 0], [6, 1],
+             [5, 5], [5, 7], [5, 9]])
+        self.assertEqual(dense_offsets.tolist(), [0, 5, 5, 8])
+
+    def test_no_lines(self):
+        dense, dense_offsets = geometry_line.densify_coords(
+            np.empty((0, 2)), np.array([0]), 1)
+        self.assertEqual(dense.shape, (0, 2))
+        self.assertEqual(dense_offsets.tolist(), [0])
+
+
 class Test_join_points_to_lines(LineBaseTest):
     def test_no_points_no_lines(self):
         points = []
@@ -468,5 +810,89 @@ class Test_join_points_to_lines(LineBaseTest):
             LineString([(0, -4), (0, -4)]), # duplicates are fine
         ])
 
+    def test_finds_nearest_endpoint_beyond_first_hit(self):
+        # the long line's bounds are found first, but its endpoints are far
+        points = [Point(0, 0)]
+        lines = [
+            LineString([(-100, 0.5), (100, 0.5)]),
+            LineString([(3, 0), (10, 0)]),
+        ]
+        result = geometry_line.join_points_to_lines(points, lines)
+        self.assertEqual(list(result[0].coords), [(0, 0), (3, 0)])
+
+    def test_points_without_lines(self):
+        with self.assertRaises(ValueError):
+            geometry_line.join_points_to_lines([Point(0, 0)], [])
+
+    def test_many_points(self):
+        rng = np.random.RandomState(0)
+        lines = [LineString(rng.rand(3, 2) * 100) for _ in range(50)]
+        points = [Point(xy) for xy in rng.rand(3000, 2) * 100]
+        endpoints = [Point(l.coords[i]) for l in lines for i in (0, -1)]
+        result = geometry_line.join_points_to_lines(points, lines)
+        for point, join in zip(points[::100], result[::100]):
+            self.assertAlmostEqual(
+                join.length, min(point.distance(e) for e in endpoints))
+
+    def test_reuse_endpoints(self):
+        lines = [
+            LineString([(0, 0), (0, 2)]),
+            LineString(),
+            LineString([(1, -1), (1, 2)]),
+        ]
+        endpoints = geometry_line.line_endpoints(lines)
+        self.assertEqual(
+            endpoints.tolist(), [[0, 0], [0, 2], [1, -1], [1, 2]])
+        points = [Point(1, 0.5), Point(0.9, -0.9)]
+        self.assertEqual(
+            [list(l.coords) for l in geometry_line.join_points_to_lines(
+                points, lines, endpoints)],
+            [list(l.coords) for l in geometry_line.join_points_to_lines(
+                points, lines)])
+
+class Test_join_points_to_nearest_locations(LineBaseTest):
+
+    def test_no_points(self):
+        joins, line_ids, positions = \
+            geometry_line.join_points_to_nearest_locations(
+                [], [LineString([(0, 0), (0, 1)])])
+        self.assertEqual(joins, [])
+        self.assertEqual(len(line_ids), 0)
+        self.assertEqual(len(positions), 0)
+
+    def test_points_without_lines(self):
+        with self.assertRaises(ValueError):
+            geometry_line.join_points_to_nearest_locations([Point(0, 0)], [])
+
+    def test_joins_along_lines(self):
+        points = [Point(1, 5), Point(-1, -1), Point(3, 10.5)]
+        lines = [
+            LineString([(0, 0), (0, 10)]),
+            LineString([(0, 10), (5, 10), (5, 20)]),
+        ]
+        joins, line_ids, positions = \
+            geometry_line.join_points_to_nearest_locations(points, lines)
+        self.assertEqual(
+            [list(j.coords) for j in joins],
+            [[(1, 5), (0, 5)], [(-1, -1), (0, 0)], [(3, 10.5), (3, 10)]])
+        self.assertEqual(line_ids.tolist(), [0, 0, 1])
+        self.assertEqual(positions.tolist(), [5, 0, 3])
+
+    def test_matches_project(self):
+        rng = np.random.RandomState(0)
+        lines = [LineString(rng.rand(5, 2) * 100) for _ in range(30)]
+        points = rng.rand(200, 2) * 100
+        joins, line_ids, positions = \
+            geometry_line.join_points_to_nearest_locations(
+                points, lines, batch_size=16)
+        for xy, join, line_id, position in zip(
+                points, joins, line_ids, positions):
+            point = Point(xy)
+            line = lines[line_id]
+            self.assertAlmostEqual(
+                join.length, min(point.distance(l) for l in lines))
+            self.assertAlmostEqual(position, line.project(point))
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
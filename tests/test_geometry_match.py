@@ -0,0 +1,93 @@
+import time
+import unittest
+import numpy as np
+from shapely.geometry import LineString
+from allfed_spatial.geometry.match import match_lines
+from allfed_spatial.geometry.arrays import lines_to_coords
+from allfed_spatial.geometry.line import (
+    densify_coords, discrete_frechet_distance)
+from allfed_spatial.geometry.index import SpatialIndex
+
+
+class Test_match_lines(unittest.TestCase):
+
+    def setUp(self):
+        self.lines_a = [
+            LineString([(0, 0), (5, 0), (10, 0)]),
+            LineString([(0, 10), (10, 10)]),
+            LineString([(20, 0), (30, 0)]),
+            LineString(),
+        ]
+        self.lines_b = [
+            LineString([(0, 0.5), (10, 0.5)]),
+            LineString([(10, 10.5), (0, 10.5)]),
+            LineString([(0, 1), (5, 3), (10, 1)]),
+            LineString([(20, 100), (30, 100)]),
+        ]
+
+    def test_no_lines(self):
+        self.assertEqual(match_lines([], self.lines_b, 1), [])
+        self.assertEqual(match_lines(self.lines_a, [], 1), [])
+
+    def test_matches(self):
+        self.assertEqual(
+            match_lines(self.lines_a, self.lines_b, 1), [(0, 0, 0.5)])
+        self.assertEqual(
+            match_lines(self.lines_a, self.lines_b, 6),
+            [(0, 0, 0.5), (0, 2, 3)])
+
+    def test_reverse(self):
+        matches = match_lines(self.lines_a, self.lines_b, 1, reverse=True)
+        self.assertEqual(matches, [(0, 0, 0.5), (1, 1, 0.5)])
+        self.assertEqual(
+            match_lines(self.lines_a, self.lines_b, 1), [(0, 0, 0.5)])
+
+    def test_vertex_density(self):
+        # the same road with 2 and 11 vertices
+        sparse = LineString([(0, 0), (100, 0)])
+        dense = LineString([(x, 0) for x in range(0, 101, 10)])
+        for lines_a, lines_b in [([sparse], [dense]), ([dense], [sparse])]:
+            matches = match_lines(lines_a, lines_b, 5)
+            self.assertEqual([(i, j) for i, j, _ in matches], [(0, 0)])
+            self.assertAlmostEqual(matches[0][2], 0)
+
+    def test_long_lines(self):
+        # 50 km lines densify to about 10,000 vertices each, but only the
+        # narrow band of vertex pairs within max_distance is visited
+        started = time.perf_counter()
+        matches = match_lines(
+            [LineString([(0, 0), (50000, 0)])],
+            [LineString([(0, 3), (50000, 3)])], 10)
+        self.assertEqual(matches, [(0, 0, 3)])
+        self.assertLess(time.perf_counter() - started, 2)
+
+    def test_with_index(self):
+        index = SpatialIndex.from_geoms(self.lines_b)
+        self.assertEqual(
+            match_lines(self.lines_a, self.lines_b, 6, index=index),
+            match_lines(self.lines_a, self.lines_b, 6))
+
+    def test_matches_all_pairs(self):
+        rng = np.random.RandomState(0)
+        lines_a = [LineString(rng.rand(rng.randint(2, 6), 2) * 10)
+                   for _ in range(30)]
+        lines_b = [LineString(rng.rand(rng.randint(2, 6), 2) * 10)
+                   for _ in range(30)]
+        expected = []
+        for i, a in enumerate(lines_a):
+            for j, b in enumerate(lines_b):
+                distance = discrete_frechet_distance(
+                    densify_coords(*lines_to_coords([a]), 2.5)[0],
+                    densify_coords(*lines_to_coords([b]), 2.5)[0])
+                if distance <= 5:
+                    expected.append((i, j, distance))
+        self.assertGreater(len(expected), 0)
+        self.assertEqual(
+            match_lines(lines_a, lines_b, 5, batch_size=7), expected)
+        self.assertEqual(
+            match_lines(lines_a, lines_b, 5, processes=2, batch_size=7),
+            expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+import numpy as np
 from shapely.ops import linemerge
 from shapely.geometry import LineString, MultiLineString
 import allfed_spatial.geometry.merge as geometry_merge
@@ -218,5 +219,210 @@ class Test_merge_features(LineBaseTest):
             Feature(LineString([(0, 0), (1, 1), (2, 2), (3, 3)]), f1data)
         ])
 
+    def test_tolerance(self):
+        f1data = {'feature': 1}
+        feature1 = Feature(LineString([(0, 0), (1, 1)]), f1data)
+        feature2 = Feature(LineString([(1, 1.000001), (2, 2)]), {})
+        result = geometry_merge.merge_features(
+            [feature1, feature2], tolerance=0.001)
+        self.FeaturesEqual(result, [
+            Feature(LineString([(0, 0), (1, 1), (2, 2)]), f1data)
+        ])
+
+
+class Test_merge_features_grouped(unittest.TestCase):
+
+    def setUp(self):
+        self.features = [
+            Feature(LineString([(0, 0), (1, 0)]),
+                    {'highway': 'primary', 'length': 1, 'name': 'a'}),
+            Feature(LineString([(1, 0), (2, 0)]),
+                    {'highway': 'track', 'length': 2, 'name': 'b'}),
+            Feature(LineString([(2, 0), (1, 0)]),
+                    {'highway': 'primary', 'length': 3, 'name': 'c'}),
+            Feature(MultiLineString([[(5, 5), (6, 6)], [(7, 7), (6, 6)]]),
+                    {'highway': 'track', 'length': 4, 'name': 'd'}),
+        ]
+
+    def test_by(self):
+        result = geometry_merge.merge_features(self.features, by='highway')
+        self.assertEqual(
+            [list(f.geom.coords) for f in result],
+            [[(0, 0), (1, 0), (2, 0)], [(1, 0), (2, 0)],
+             [(5, 5), (6, 6), (7, 7)]])
+        self.assertEqual(
+            [f.data for f in result],
+            [self.features[0].data, self.features[1].data,
+             self.features[1].data])
+
+    def test_by_fields(self):
+        result = geometry_merge.merge_features(
+            self.features, by=['highway', 'name'])
+        self.assertEqual(len(result), 4)
+
+    def test_agg(self):
+        result = geometry_merge.merge_features(
+            self.features, by='highway',
+            agg={'length': 'sum', 'name': 'last'})
+        self.assertEqual(
+            [f.data for f in result],
+            [{'highway': 'primary', 'length': 4, 'name': 'c'},
+             {'highway': 'track', 'length': 2, 'name': 'b'},
+             {'highway': 'track', 'length': 4, 'name': 'd'}])
+        # the data of the input features is left alone
+        self.assertEqual(self.features[0].data['length'], 1)
+
+    def test_aggregations(self):
+        features = [
+            Feature(LineString([(0, 0), (1, 0)]), {'n': 3}),
+            Feature(LineString([(2, 0), (3, 0)]), {'n': 7}),
+            Feature(LineString([(1, 0), (2, 0)]), {'n': 5}),
+        ]
+        expected = {'sum': 15, 'mean': 5, 'min': 3, 'max': 7, 'count': 3,
+                    'first': 3, 'last': 7}
+        for how, value in expected.items():
+            result = geometry_merge.merge_features(features, agg={'n': how})
+            self.assertEqual(len(result), 1)
+            self.assertEqual(result[0].data, {'n': value})
+
+    def test_parts_counted_once(self):
+        features = [
+            Feature(MultiLineString([[(0, 0), (1, 0)], [(2, 0), (1, 0)]]),
+                    {'n': 1}),
+            Feature(LineString([(2, 0), (3, 0)]), {'n': 2}),
+        ]
+        result = geometry_merge.merge_features(
+            features, agg={'n': 'sum'})
+        self.assertEqual(result[0].data, {'n': 3})
+
+    def test_invalid_aggregation(self):
+        with self.assertRaises(ValueError):
+            geometry_merge.merge_features(
+                self.features, agg={'length': 'median'})
+
+    def test_processes(self):
+        kwargs = {'by': 'highway', 'agg': {'length': 'sum'}}
+        expected = geometry_merge.merge_features(self.features, **kwargs)
+        result = geometry_merge.merge_features(
+            self.features, processes=2, **kwargs)
+        self.assertEqual(
+            [(list(f.geom.coords), f.data) for f in result],
+            [(list(f.geom.coords), f.data) for f in expected])
+
+
+class Test_merge_lines(unittest.TestCase):
+
+    def assertCoords(self, lines, expected):
+        self.assertEqual([list(line.coords) for line in lines], expected)
+
+    def test_no_lines(self):
+        self.assertEqual(geometry_merge.merge_lines([]), [])
+        self.assertEqual(geometry_merge.merge_lines([LineString()]), [])
+
+    def test_flips_lines(self):
+        result = geometry_merge.merge_lines([
+            LineString([(3, 3), (2, 2)]),
+            LineString([(0, 0), (1, 1)]),
+            LineString([(2, 2), (1, 1)]),
+        ])
+        self.assertCoords(result, [[(3, 3), (2, 2), (1, 1), (0, 0)]])
+
+    def test_order_of_first_lines(self):
+        result = geometry_merge.merge_lines([
+            LineString([(5, 5), (6, 6)]),
+            MultiLineString([[(0, 0), (1, 1)], [(7, 7), (6, 6)]]),
+            LineString([(1, 1), (2, 2)]),
+        ])
+        self.assertCoords(result, [
+            [(5, 5), (6, 6), (7, 7)],
+            [(0, 0), (1, 1), (2, 2)],
+        ])
+
+    def test_junctions(self):
+        # three lines meet at (1, 1), so none are joined there
+        result = geometry_merge.merge_lines([
+            LineString([(0, 0), (1, 1)]),
+            LineString([(1, 1), (2, 2)]),
+            LineString([(1, 1), (1, 2)]),
+            LineString([(2, 2), (3, 3)]),
+        ])
+        self.assertCoords(result, [
+            [(0, 0), (1, 1)],
+            [(1, 1), (2, 2), (3, 3)],
+            [(1, 1), (1, 2)],
+        ])
+
+    def test_loop_starts_at_first_line(self):
+        result = geometry_merge.merge_lines([
+            LineString([(1, 1), (0, 1)]),
+            LineString([(0, 0), (1, 1)]),
+            LineString([(0, 1), (0, 0)]),
+        ])
+        self.assertCoords(result, [[(1, 1), (0, 1), (0, 0), (1, 1)]])
+
+        result = geometry_merge.merge_lines([
+            LineString([(0, 1), (1, 1)]),
+            LineString([(0, 0), (1, 1)]),
+            LineString([(0, 1), (0, 0)]),
+        ])
+        self.assertCoords(result, [[(0, 1), (1, 1), (0, 0), (0, 1)]])
+
+    def test_touching_loops(self):
+        result = geometry_merge.merge_lines([
+            LineString([(1, 1), (2, 1), (2, 2), (1, 2), (1, 1)]),
+            LineString([(1, 1), (1, 0), (0, 0), (0, 1), (1, 1)]),
+        ])
+        self.assertCoords(result, [
+            [(1, 1), (2, 1), (2, 2), (1, 2), (1, 1)],
+            [(1, 1), (1, 0), (0, 0), (0, 1), (1, 1)],
+        ])
+
+    def test_crossing_loops(self):
+        result = geometry_merge.merge_lines([
+            LineString([(0, 0), (0, 1), (1, 1)]),
+            LineString([(1, 1), (2, 1), (2, 2)]),
+            LineString([(2, 2), (1, 2), (1, 1)]),
+            LineString([(1, 1), (1, 0), (0, 0)]),
+        ])
+        self.assertCoords(result, [
+            [(1, 1), (1, 0), (0, 0), (0, 1), (1, 1)],
+            [(1, 1), (2, 1), (2, 2), (1, 2), (1, 1)],
+        ])
+
+    def test_same_lines_as_linemerge(self):
+        rng = np.random.RandomState(0)
+        points = rng.randint(0, 30, (1001, 2)).astype(float)
+        lines = [LineString(points[i:i + 2]) for i in range(1000)
+                 if (points[i] != points[i + 1]).any()]
+        result = geometry_merge.merge_lines(lines)
+        expected = list(linemerge(lines).geoms)
+        self.assertEqual(len(result), len(expected))
+        for line in result:
+            matches = [i for i, e in enumerate(expected) if line.equals(e)]
+            self.assertGreater(len(matches), 0)
+            expected.pop(matches[0])
+
+
+class Test_merge_coords(unittest.TestCase):
+
+    def test_merged_lines(self):
+        coords = [(3, 3), (2, 2), (0, 0), (1, 1), (2, 2), (1, 1), (5, 5),
+                  (6, 6)]
+        offsets = [0, 2, 2, 4, 6, 8]
+        merged = geometry_merge.merge_coords(coords, offsets)
+        self.assertEqual(
+            merged.coords.tolist(),
+            [[3, 3], [2, 2], [1, 1], [0, 0], [5, 5], [6, 6]])
+        self.assertEqual(merged.offsets.tolist(), [0, 4, 6])
+        self.assertEqual(merged.lines.tolist(), [0, 3, 2, 4])
+        self.assertEqual(merged.line_offsets.tolist(), [0, 3, 4])
+
+    def test_no_lines(self):
+        merged = geometry_merge.merge_coords(np.empty((0, 2)), [0])
+        self.assertEqual(merged.coords.shape, (0, 2))
+        self.assertEqual(merged.offsets.tolist(), [0])
+        self.assertEqual(merged.line_offsets.tolist(), [0])
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
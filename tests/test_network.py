@@ -0,0 +1,133 @@
+import unittest
+import numpy as np
+from shapely.geometry import LineString, MultiLineString
+from allfed_spatial.features.feature import Feature
+from allfed_spatial.operations.network import (
+    build_network, network_from_coords, network_to_networkx)
+
+try:
+    from allfed_spatial.operations import flow
+except ImportError:
+    flow = None
+
+
+class TestBuildNetwork(unittest.TestCase):
+
+    def setUp(self):
+        self.features = [
+            Feature(LineString([(0, 0), (1, 0)]), {'cost': 5}),
+            Feature(LineString([(1, 0), (1, 1), (2, 1)]), {'cost': 7}),
+            Feature(LineString(), {'cost': 9}),
+            Feature(MultiLineString([
+                [(2, 1), (0, 0)], [(1, 1.01), (1, 1)]]), {'cost': 1}),
+            Feature(LineString([(0, 0), (1, 0)]), {'cost': 2}),
+        ]
+
+    def test_nodes_and_edges(self):
+        network = build_network(self.features)
+        self.assertEqual(
+            network.node_coords.tolist(),
+            [[0, 0], [1, 0], [2, 1], [1, 1.01], [1, 1]])
+        self.assertEqual(
+            network.edge_nodes.tolist(),
+            [[0, 1], [1, 2], [2, 0], [3, 4], [0, 1]])
+        np.testing.assert_allclose(
+            network.edge_lengths, [1, 2, np.sqrt(5), 0.01, 1])
+        np.testing.assert_array_equal(
+            network.edge_costs, network.edge_lengths)
+
+    def test_feature_offsets(self):
+        network = build_network(self.features)
+        self.assertEqual(network.feature_offsets.tolist(), [0, 1, 2, 2, 4, 5])
+
+    def test_cost_field(self):
+        network = build_network(self.features, cost_field='cost')
+        self.assertEqual(network.edge_costs.tolist(), [5, 7, 1, 1, 2])
+
+    def test_tolerance(self):
+        network = build_network(self.features, tolerance=0.1)
+        self.assertEqual(len(network.node_coords), 4)
+        self.assertEqual(network.edge_nodes[3].tolist(), [3, 3])
+
+    def test_adjacency(self):
+        network = build_network(self.features, tolerance=0.1)
+        edges = [
+            network.edge_ids[network.indptr[n]:network.indptr[n + 1]].tolist()
+            for n in range(len(network.node_coords))]
+        neighbours = [
+            network.indices[network.indptr[n]:network.indptr[n + 1]].tolist()
+            for n in range(len(network.node_coords))]
+        # the loop is only listed once at its node
+        self.assertEqual(edges, [[0, 2, 4], [0, 1, 4], [1, 2], [3]])
+        self.assertEqual(neighbours, [[1, 2, 1], [0, 2, 0], [1, 0], [3]])
+
+    def test_no_features(self):
+        network = build_network([])
+        self.assertEqual(network.node_coords.shape, (0, 2))
+        self.assertEqual(network.edge_nodes.shape, (0, 2))
+        self.assertEqual(network.indptr.tolist(), [0])
+        self.assertEqual(network.feature_offsets.tolist(), [0])
+
+    def test_nodes_in_order_of_appearance(self):
+        rng = np.random.RandomState(0)
+        coords = rng.randint(0, 20, (400, 2)).astype(float)
+        offsets = np.arange(0, 401, 2)
+        network = network_from_coords(coords, offsets)
+        nodes = {}
+        expected = [nodes.setdefault(tuple(c), len(nodes)) for c in coords]
+        self.assertEqual(network.edge_nodes.ravel().tolist(), expected)
+        self.assertEqual(
+            [tuple(c) for c in network.node_coords.tolist()], list(nodes))
+
+
+class TestNetworkToNetworkx(unittest.TestCase):
+
+    def setUp(self):
+        self.network = build_network([
+            Feature(LineString([(0, 0), (1, 0)]), {'cost': 5}),
+            Feature(LineString([(1, 0), (1, 1)]), {'cost': 7}),
+            Feature(LineString([(1, 0), (0, 0)]), {'cost': 2}),
+            Feature(LineString([(0, 0), (1, 0)]), {'cost': 2}),
+        ], cost_field='cost')
+
+    def test_graph(self):
+        graph = network_to_networkx(self.network)
+        self.assertEqual(graph.number_of_nodes(), 3)
+        self.assertEqual(graph.nodes[2], {'x': 1, 'y': 1})
+        # the cheapest of the parallel edges, earliest on ties
+        self.assertEqual(
+            graph.edges[0, 1], {'length': 1, 'cost': 2, 'edge': 2})
+        self.assertEqual(graph.edges[1, 2]['edge'], 1)
+
+    def test_multigraph(self):
+        graph = network_to_networkx(self.network, multigraph=True)
+        self.assertEqual(graph.number_of_edges(), 4)
+        self.assertEqual(
+            sorted(d['edge'] for _, _, d in graph.edges(data=True)),
+            [0, 1, 2, 3])
+
+    def test_cost_scale(self):
+        network = build_network([
+            Feature(LineString([(0, 0), (1, 0)]), {'cost': 1.257}),
+            Feature(LineString([(1, 0), (1, 1)]), {'cost': 0.5}),
+        ], cost_field='cost')
+        graph = network_to_networkx(network, cost_scale=100)
+        costs = [d['cost'] for _, _, d in graph.edges(data=True)]
+        self.assertEqual(costs, [126, 50])
+        self.assertTrue(all(type(c) is int for c in costs))
+        graph = network_to_networkx(network)
+        self.assertEqual(graph.edges[0, 1]['cost'], 1.257)
+
+    @unittest.skipIf(flow is None, 'ortools is not installed')
+    def test_min_cost_flow_setup(self):
+        graph = network_to_networkx(self.network, cost_scale=10)
+        flow.preprocess_graph(graph)
+        min_cost_flow = flow.setup_min_cost_flow(graph, 'cost')
+        self.assertEqual(min_cost_flow.NumArcs(), 4)
+        self.assertEqual(
+            sorted(min_cost_flow.UnitCost(i) for i in range(4)),
+            [20, 20, 70, 70])
+
+
+if __name__ == '__main__':
+    unittest.main()